@@ -0,0 +1,3 @@
+from forest_fire.batch import main
+
+main()
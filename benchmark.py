@@ -0,0 +1,4 @@
+import sys
+from forest_fire.benchmark import main
+
+sys.exit(main())
@@ -0,0 +1,3 @@
+from forest_fire.calibration import main
+
+main()
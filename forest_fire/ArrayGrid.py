@@ -0,0 +1,35 @@
+class ArrayGrid:
+    """ A grid with the same interface of mesa's SingleGrid whose cells are views on the arrays of the model """
+
+    def __init__(self, model):
+        self.model = model
+        self.width = model.width
+        self.height = model.height
+        self.torus = False
+
+    def coord_iter(self):
+        """ An iterator that returns the cells of the grid along with their coordinates """
+        for x in range(self.width):
+            for y in range(self.height):
+                yield self.model.get_cell(x, y), x, y
+
+    def out_of_bounds(self, pos):
+        """ Determines whether the position is off the grid """
+        x, y = pos
+        return x < 0 or x >= self.width or y < 0 or y >= self.height
+
+    def iter_neighbors(self, pos, moore, include_center=False, radius=1):
+        """ Return an iterator over the neighbors of the given position """
+        x, y = pos
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if dx == 0 and dy == 0 and not include_center:
+                    continue
+                if not moore and abs(dx) + abs(dy) > radius:
+                    continue
+                if not self.out_of_bounds((x + dx, y + dy)):
+                    yield self.model.get_cell(x + dx, y + dy)
+
+    def get_cell_list_contents(self, cell_list):
+        """ Return the cells at the given positions """
+        return [self.model.get_cell(x, y) for (x, y) in cell_list]
@@ -0,0 +1,45 @@
+import numpy as np
+from .ArrivalTimeSolver import ArrivalTimeSolver
+from .GridActivation import GridActivation
+
+
+class ArrivalActivation(GridActivation):
+    """
+        A scheduler that takes the cells igniting in each step from an ArrivalTimeSolver, instead of computing the
+        next state of the cells near the fire. The steps in which no cell ignites cost nothing.
+        It requires a rule with discrete states, such as ExtendedRule
+    """
+
+    def __init__(self, model):
+        super().__init__(model, frontier=False)
+        self.solver = None
+
+    def setup(self):
+        """ Start the solver from the current state of the cells """
+        self.solver = ArrivalTimeSolver(self.model)
+
+    def step(self):
+        """ Ignite the cells whose arrival time is the next step """
+        grid_state = self.model.grid_state
+        profiler = self.model.profiler
+
+        with profiler.timer("rule.apply"):
+            index = self.solver.take(self.steps + 1)
+        with profiler.timer("advance"):
+            rows, cols = np.divmod(index, self.model.width)
+            state = grid_state.get("state")
+            changes = {"state": ((rows, cols), state[rows, cols].copy())}
+            state[rows, cols] = 1.0
+
+            self.model.metrics.update_cells(*changes["state"])
+            for recorder in self.model.recorders:
+                recorder.add_cells((rows, cols), state[rows, cols])
+            self.update_agents(changes)
+        profiler.count("cells.changed", index.size)
+        self.changed = {"state": index.size}
+        self.steps += 1
+        self.time += 1
+
+    def forecast(self, steps=None):
+        """ Return the step in which each cell ignites (inf if it doesn't), up to the given step or until the fire is out """
+        return self.solver.solve(steps)
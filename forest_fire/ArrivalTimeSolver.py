@@ -0,0 +1,166 @@
+import heapq
+import numpy as np
+from .FixedDraws import FixedDraws
+from .GridSelection import GridSelection
+from .WindFactorCalculator import WindContext
+
+
+class ArrivalTimeSolver:
+    """
+        Compute the step in which each cell ignites, for the rules whose states are only 0 and 1 (see
+        PropagationRule.discrete). A cell that isn't burning can only ignite, and whether it ignites depends on
+        its burning neighbors and on the wind of the day alone: while they don't change, in every step it ignites
+        with the same probability p (with a gust of wind, without or both). So its ignition is an event drawn
+        from a geometric distribution, which is kept in a priority queue ordered by step.
+
+        The events are processed in order: the cells igniting in a step are burned together, then only their
+        neighbors are evaluated again with the vectorized rule. Since the geometric distribution has no memory,
+        drawing the step again when the neighbors change gives the same distribution of the synchronous steps.
+        At the start of each day every cell near the fire is evaluated again with the new wind.
+        A whole fire takes O(N log N) instead of steps x cells, and the burned region at any step is the set of
+        cells whose arrival step isn't after it. If gust_prob is 0 (or 1) the result is the same of the grid engine.
+
+        The solver has its own copy of the states, so it can run ahead of the model (see solve)
+    """
+
+    def __init__(self, model):
+        rule = model.propagation_rule
+        if not rule.discrete:
+            raise RuntimeError("The arrival times require a rule with discrete states")
+        if model.grid_state.members is not None:
+            raise RuntimeError("The arrival times don't support ensembles")
+
+        self.model = model
+        self.grid_state = model.grid_state.detach(["state"])
+        state = self.grid_state.get("state")
+        if not np.all((state == 0.0) | (state == 1.0)):
+            raise RuntimeError("The arrival times require the states to be 0 or 1")
+
+        # The last step whose ignitions have been applied to the states
+        self.time = model.schedule.steps
+        self.arrival = np.where(state == 1.0, float(self.time), np.inf).reshape(-1)  # The step in which each cell ignites
+        self.ignitions = {}  # The indices of the cells igniting in each step that hasn't been taken yet
+
+        self.queue = []  # The (step, version, index) of the ignitions drawn for each cell
+        self.version = np.zeros(state.size, dtype=np.int64)  # An event is valid if its version is the one of the cell
+        self.finished = False  # The fire is out or the scenario has no wind for the next day
+        self.evaluate(self.get_candidates())
+
+    def advance(self, steps):
+        """ Process the ignitions up to the given step """
+        steps_per_day = self.model.steps_per_day
+        while self.time < steps and not self.finished:
+            next_day = (self.time // steps_per_day + 1) * steps_per_day
+            next_event = self.queue[0][0] if self.queue else np.inf
+            time = min(next_event, next_day)
+            if time > steps:
+                self.time = steps
+                break
+
+            ignited = self.pop(time)
+            self.time = time
+            if ignited.size > 0:
+                self.ignite(ignited, time)
+
+            # The wind changes at the start of the day, so every cell near the fire is evaluated again
+            if time % steps_per_day == 0:
+                candidates = self.get_candidates()
+                if candidates.size == 0 and not self.queue:
+                    self.finished = True
+                self.evaluate(candidates)
+            elif ignited.size > 0:
+                self.evaluate(self.get_neighbors(ignited))
+
+    def solve(self, steps=None):
+        """
+            Return the step in which each cell ignites (inf if it doesn't), up to the given step or until the fire
+            is out. The rows start from the top of the map
+        """
+        self.advance(np.inf if steps is None else steps)
+        arrival = self.arrival.reshape(self.grid_state.shape)
+        return arrival.copy() if steps is None else np.where(arrival <= steps, arrival, np.inf)
+
+    def get_state(self, steps):
+        """ Return the state of every cell at the given step """
+        return np.where(self.solve(steps) <= steps, 1.0, 0.0).astype(self.grid_state.dtype)
+
+    def take(self, steps):
+        """ Return the indices of the cells that ignite in the given step, removing them from the solver """
+        self.advance(steps)
+        return self.ignitions.pop(steps, np.empty(0, dtype=np.intp))
+
+    def pop(self, time):
+        """ Remove the events of the given step from the queue and return the cells that ignite """
+        index = []
+        while self.queue and self.queue[0][0] == time:
+            _, version, cell = heapq.heappop(self.queue)
+            if version == self.version[cell]:
+                index.append(cell)
+        return np.unique(np.array(index, dtype=np.intp))
+
+    def ignite(self, index, time):
+        """ Burn the given cells in the given step """
+        self.arrival[index] = time
+        self.version[index] += 1
+        rows, cols = np.divmod(index, self.grid_state.width)
+        self.grid_state.get("state")[rows, cols] = 1.0
+        self.ignitions[time] = index
+
+    def evaluate(self, index):
+        """ Draw the step in which each of the given cells ignites, given the current states and the wind of the next step """
+        if index.size == 0:
+            return
+        model = self.model
+        day = model.starting_day + self.time // model.steps_per_day
+        if day >= len(model.wind):
+            self.queue = []
+            self.finished = True
+            return
+
+        # The probability of igniting in each step, with and without a gust of wind
+        ignites = {}
+        wind_context, np_random = model.wind_context, model.np_random
+        try:
+            model.wind_context = WindContext(day, model.wind[day], model.parameters)
+            for value in (0.0, 1.0):  # A draw of 0 is a gust of wind (if gust_prob > 0), a draw of 1 never is
+                model.np_random = FixedDraws(value)
+                ignites[value] = model.backend.apply_grid(model.propagation_rule, GridSelection(self.grid_state, index)) == 1.0
+        finally:
+            model.wind_context, model.np_random = wind_context, np_random
+
+        gust_prob = min(max(model.parameters.gust_prob, 0.0), 1.0)
+        probability = np.where(ignites[0.0], gust_prob, 0.0) + np.where(ignites[1.0], 1.0 - gust_prob, 0.0)
+
+        # The previous events of the cells are no longer valid
+        self.version[index] += 1
+        can_ignite = probability > 0
+        index, probability = index[can_ignite], probability[can_ignite]
+        delays = np.ones(index.size, dtype=np.int64)
+        uncertain = probability < 1.0
+        delays[uncertain] = np_random.geometric(probability[uncertain])
+
+        for cell, time in zip(index.tolist(), (self.time + delays).tolist()):
+            heapq.heappush(self.queue, (time, int(self.version[cell]), cell))
+
+    def get_candidates(self):
+        """ Return the indices of the cells that can change with a burning cell around them """
+        state = self.grid_state.get("state")
+        burning = np.pad(state > 0, 1)
+        near_fire = np.zeros(state.shape, dtype=bool)
+        for a in (-1, 0, 1):
+            for b in (-1, 0, 1):
+                near_fire |= burning[1 - b:state.shape[0] + 1 - b, 1 + a:state.shape[1] + 1 + a]
+        changeable = self.model.propagation_rule.can_change(state, self.grid_state.get("rate_of_spread"))
+        return np.flatnonzero(changeable & near_fire)
+
+    def get_neighbors(self, index):
+        """ Return the indices of the neighbors of the given cells that can change """
+        width, height = self.grid_state.width, self.grid_state.height
+        rows, cols = np.divmod(index, width)
+        offsets = np.arange(-1, 2)
+        rows = (rows[:, None] + np.repeat(offsets, 3)[None, :]).ravel()
+        cols = (cols[:, None] + np.tile(offsets, 3)[None, :]).ravel()
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        neighbors = np.unique(rows[inside] * width + cols[inside])
+        state = self.grid_state.take("state", neighbors)
+        return neighbors[self.model.propagation_rule.can_change(state, self.grid_state.take("rate_of_spread", neighbors))]
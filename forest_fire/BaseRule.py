@@ -1,5 +1,5 @@
 import numpy as np
-from .PropagationRule import PropagationRule
+from .PropagationRule import PropagationRule, neighbor_directions
 from .SlopeFunctions import SlopeFunctions
 from .WindFactorCalculator import WindFactorCalculator
 
@@ -22,47 +22,90 @@ class BaseRule(PropagationRule):
         super().__init__(model)
 
         # Update height factors using a slope function
-        for (cell, _, _) in self.model.grid.coord_iter():
-            cell.update_height_factor(SlopeFunctions.slope_h2)
-
-        # Define some support vectors to iterate the neighbors
-        self.v_adj = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])
-        self.v_diag = np.array([(-1, 1), (1, 1), (1, -1), (-1, -1)])
+        self.model.update_height_factors(SlopeFunctions.slope_h2)
 
     def apply(self, cell):
         """ Calculate the next state of the cell """
         if cell.state == 1.0 or cell.rate_of_spread == 0.0:
             return cell.state
 
+        # A timer costs as much as the parts of the rule for a single cell, so the clock is read only while profiling
+        profiler = self.model.profiler
+        start = profiler.start()
+
+        # Walk the neighbors once
+        fire_angle, adj_sum, diag_sum = self.scan_neighbors(cell)
+        if start is not None:
+            start = profiler.lap("rule.neighbor_sums", start)
+
         # Compute the wind component
-        cell.wind_component = WindFactorCalculator.compute_wind_factor(self.model, cell)
+        cell.wind_component = WindFactorCalculator.compute_wind_factor(self.model, fire_angle)
+        if start is not None:
+            profiler.lap("rule.wind_factor", start)
 
         # Calculate the next state using the formula given in the paper
         next_state = cell.state
-        next_state += self.calculate_adj_term(cell)
+        next_state += cell.wind_component * adj_sum
         if next_state < 1.0:
-            next_state += self.calculate_diag_term(cell)
+            next_state += cell.wind_component * diag_sum * self.model.parameters.diagonal_weight
 
         # Cap the result to 1.0
         return min(1.0, next_state)
 
-    def calculate_adj_term(self, cell):
-        """ Calculate the adjacent sum term of the formula """
-        sum = 0.0
-        for (a, b) in self.v_adj:
-            x, y = cell.pos + np.array((a, b))
-            if not self.model.grid.out_of_bounds((x, y)):
-                neighbor = self.model.get_cell(x, y)
-                sum += cell.wind_component * cell.get_height_factor(a, b) * neighbor.state
-        return sum
-
-    def calculate_diag_term(self, cell):
-        """ Calculate the diagonal sum term of the formula """
-        sum = 0.0
-        for (a, b) in self.v_diag:
-            x, y = cell.pos + np.array((a, b))
-            if not self.model.grid.out_of_bounds((x, y)):
-                neighbor = self.model.get_cell(x, y)
-                sum += cell.wind_component * cell.get_height_factor(a, b) * neighbor.state
-        sum *= 0.83
-        return sum
+    def scan_neighbors(self, cell):
+        """
+            Walk the neighbors of the cell once, computing the fire direction along with the adjacent and the
+            diagonal sums of the formula. The sums don't include the wind component, which is the same for every neighbor
+        """
+        sum_ang = sum_states = adj_sum = diag_sum = 0.0
+        for a, b, angle, diagonal, neighbor in cell.get_neighbors():
+            state = neighbor.state
+            if state == 0.0:
+                continue
+            sum_ang += angle * state
+            sum_states += state
+            if diagonal:
+                diag_sum += cell.get_height_factor(a, b) * state
+            else:
+                adj_sum += cell.get_height_factor(a, b) * state
+        return WindFactorCalculator.get_fire_direction(sum_ang, sum_states), adj_sum, diag_sum
+
+    def apply_grid(self, grid):
+        """ Calculate the next state of every cell of the grid """
+        state = grid.get("state")
+
+        profiler = self.model.profiler
+
+        # Walk the neighbors once
+        with profiler.timer("rule.neighbor_sums"):
+            fire_angle, sum_states, adj_sum, diag_sum = self.scan_neighbors_grid(grid)
+
+        # Compute the wind component
+        with profiler.timer("rule.wind_factor"):
+            wind_component = WindFactorCalculator.compute_wind_factor_grid(self.model, grid, fire_angle, sum_states)
+
+        # Calculate the next state using the formula given in the paper
+        next_state = state + wind_component * adj_sum
+        next_state = np.where(next_state < 1.0, next_state + wind_component * diag_sum * self.model.parameters.diagonal_weight, next_state)
+
+        # Cap the result to 1.0
+        next_state = np.minimum(1.0, next_state)
+
+        # Keep the state of the burned cells and of the cells that can't burn
+        return np.where((state == 1.0) | (grid.get("rate_of_spread") == 0.0), state, next_state)
+
+    def scan_neighbors_grid(self, grid):
+        """ Compute the fire direction, the sum of the states of the neighbors and the sums of the formula for every cell """
+        sum_ang = np.zeros(grid.shape)
+        sum_states = np.zeros(grid.shape)
+        adj_sum = np.zeros(grid.shape)
+        diag_sum = np.zeros(grid.shape)
+        for a, b, angle, diagonal in neighbor_directions:
+            state = grid.neighbor("state", a, b)
+            sum_ang += angle * state
+            sum_states += state
+            if diagonal:
+                diag_sum += grid.height_factor(a, b) * state
+            else:
+                adj_sum += grid.height_factor(a, b) * state
+        return WindFactorCalculator.get_fire_direction_grid(sum_ang, sum_states), sum_states, adj_sum, diag_sum
@@ -0,0 +1,37 @@
+from mesa.time import SimultaneousActivation
+
+
+class CellActivation(SimultaneousActivation):
+    """
+        Step every cell, then advance them, like SimultaneousActivation, timing the two phases with the profiler of
+        the model. The changed states and rain deficits are counted while the cells are stepped, like in GridActivation
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.changed = {}  # The number of changed values of each layer in the last step
+
+    def step(self):
+        """ Step the cells, then advance them """
+        self.activate(list(self._agents.values()))
+        self.steps += 1
+        self.time += 1
+
+    def activate(self, cells):
+        """ Step the given cells, then advance them """
+        profiler = self.model.profiler
+        changed_deficits = 0
+        with profiler.timer("rule.apply"):
+            for cell in cells:
+                rain_deficit = cell.rain_deficit
+                cell.step()
+                if cell.rain_deficit != rain_deficit:
+                    changed_deficits += 1
+        changed_states = 0
+        with profiler.timer("advance"):
+            for cell in cells:
+                if cell.state != cell.next_state:
+                    changed_states += 1
+                cell.advance()
+        profiler.count("cells.updated", len(cells))
+        self.changed = {"state": changed_states, "rain_deficit": changed_deficits}
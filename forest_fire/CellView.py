@@ -0,0 +1,51 @@
+from .GridState import direction_index
+
+
+class Layer:
+    """ A descriptor that reads and writes the value of a cell in a layer of the grid state """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, cell, owner=None):
+        if cell is None:
+            return self
+        return float(cell.model.grid_state.get(self.name)[cell.row, cell.col])
+
+    def __set__(self, cell, value):
+        cell.model.grid_state.get(self.name)[cell.row, cell.col] = value
+
+
+class CellView:
+    """
+        A lightweight cell backed by the arrays of the model. It has the same attributes of a ForestCell,
+        but it's created only when it's needed (e.g. by the visualization) and it doesn't store any data
+    """
+
+    __slots__ = ("model", "pos", "row", "col", "wind_component")
+
+    state = Layer("state")
+    rate_of_spread = Layer("rate_of_spread")
+    height = Layer("height")
+    rain = Layer("rain")
+    rain_deficit = Layer("rain_deficit")
+    is_burned = Layer("is_burned")
+
+    def __init__(self, pos, model):
+        self.model = model
+        self.pos = pos
+        self.row = model.height - 1 - pos[1]
+        self.col = pos[0]
+        if model.window is not None:  # The arrays contain only the cells of the window
+            self.row -= model.window.top
+            self.col -= model.window.left
+        self.wind_component = 1
+
+    def get_height_factor(self, a, b):
+        return float(self.model.grid_state.height_factors[direction_index[(int(a), int(b))], self.row, self.col])
+
+    def update_height_factor(self, phi):
+        """ Update the height factors using the given slope function """
+        for neighbor in self.model.grid.iter_neighbors(self.pos, moore=True):
+            a, b = neighbor.pos[0] - self.pos[0], neighbor.pos[1] - self.pos[1]
+            self.model.grid_state.height_factors[direction_index[(a, b)], self.row, self.col] = phi(self.height - neighbor.height, a, b, self.model.parameters)
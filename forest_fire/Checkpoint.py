@@ -0,0 +1,135 @@
+import json
+import os
+import numpy as np
+from .ArrivalActivation import ArrivalActivation
+from .FrontierActivation import FrontierActivation
+
+
+class Checkpoint:
+    """
+        Save and restore the state of a model in a compressed .npz file. The checkpoint contains only what changes during the
+        simulation: the states and the rain deficits of the cells, the current rain and wind, the step counter,
+        the fire front of the scheduler, the recorded metrics and the state of the random number generators.
+        The static layers are loaded again from the scenario, using the options saved in the checkpoint
+    """
+
+    version = 1
+
+    @staticmethod
+    def save(model, path):
+        """ Save the state of the model in the given path """
+        metadata = {
+            "version": Checkpoint.version,
+            "options": Checkpoint.get_options(model),
+            "steps": model.schedule.steps,
+            "time": model.schedule.time,
+            "running": model.running,
+            "random": model.random.getstate(),
+            "np_random": model.np_random.bit_generator.state,
+            "metrics": model.metrics.series
+        }
+        arrays = {
+            "state": model.get_layer("state"),
+            "rain_deficit": model.get_layer("rain_deficit"),
+            "rain": model.get_layer("rain"),
+            "wind": np.array(model.wind)
+        }
+        arrays.update(Checkpoint.get_schedule_state(model.schedule))
+        arrays["metadata"] = np.frombuffer(json.dumps(metadata).encode("utf-8"), dtype=np.uint8)
+
+        # Write a temporary file first, so a checkpoint is never left half written
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary_path, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary_path, path)
+        model.log("model", "Checkpoint saved in {} at step {}", path, model.schedule.steps)
+
+    @staticmethod
+    def read(path):
+        """ Return the metadata and the arrays of the checkpoint in the given path """
+        with np.load(path) as file:
+            arrays = {name: file[name] for name in file.files}
+        metadata = json.loads(arrays.pop("metadata").tobytes().decode("utf-8"))
+        if metadata.get("version") != Checkpoint.version:
+            raise RuntimeError("The checkpoint {} has an unsupported version".format(path))
+        return metadata, arrays
+
+    @staticmethod
+    def restore(model, metadata, arrays, restore_random=True):
+        """
+            Overwrite the state of a model built with the options of the checkpoint. If restore_random is False,
+            the random number generators keep the state given by the seed of the model
+        """
+        for name in ("state", "rain_deficit", "rain"):
+            model.set_layer(name, arrays[name])
+        model.wind[:] = arrays["wind"].tolist()
+
+        model.schedule.steps = metadata["steps"]
+        model.schedule.time = metadata["time"]
+        model.running = metadata["running"]
+        Checkpoint.set_schedule_state(model.schedule, arrays)
+
+        if restore_random:
+            version, state, gauss_next = metadata["random"]
+            model.random.setstate((version, tuple(state), gauss_next))
+            model.np_random.bit_generator.state = metadata["np_random"]
+
+        # The arrival engine draws the ignitions again from the restored states
+        if isinstance(model.schedule, ArrivalActivation):
+            model.schedule.setup()
+
+        model.metrics.count()
+        model.metrics.series = metadata["metrics"]
+
+        # The trace and the output continue from the restored state
+        state = model.get_layer("state")
+        for recorder in model.recorders:
+            recorder.add_cells(np.nonzero(np.ones(state.shape, dtype=bool)), state.reshape(-1))
+            recorder.end_step(model.schedule.steps)
+
+        model.log("model", "Checkpoint restored at step {}", model.schedule.steps)
+
+    @staticmethod
+    def get_options(model):
+        """ Return the arguments of ForestFire needed to build the model again """
+        return {
+            "width": model.width,
+            "height": model.height,
+            "propagation_rule": type(model.propagation_rule).__name__,
+            "scenario": model.wildfire_name,
+            "show_partial_burned_cells": model.show_partial_burned_cells,
+            "engine": model.engine,
+            "storage": model.storage,
+            "dtype": np.dtype(model.dtype).name,
+            "frontier": getattr(model.schedule, "frontier", isinstance(model.schedule, FrontierActivation)),
+            "rain_lookahead": model.data_loader.rain_prefetcher.lookahead if model.data_loader.rain_prefetcher is not None else 0,
+            "seed": model._seed,
+            "members": model.grid_state.members if model.grid_state is not None else None,
+            "metrics_interval": model.metrics.interval,
+            "parameters": model.parameters.to_dict(),
+            "backend": model.backend.name,
+            "tiles": getattr(model.schedule, "tiles", None),
+            "steady_state": model.steady_state.mode if model.steady_state is not None else None
+        }
+
+    @staticmethod
+    def get_schedule_state(schedule):
+        """ Return the fire front of the scheduler, if it keeps one """
+        if isinstance(schedule, FrontierActivation):
+            return {name: np.array(sorted(getattr(schedule, name)), dtype=np.int64).reshape(-1, 2) for name in ("front", "pending")}
+        if getattr(schedule, "frontier", False):
+            return {"front": schedule.front, "pending": schedule.pending}
+        return {}
+
+    @staticmethod
+    def set_schedule_state(schedule, arrays):
+        """ Restore the fire front of the scheduler, if it keeps one """
+        if isinstance(schedule, FrontierActivation):
+            for name in ("front", "pending"):
+                setattr(schedule, name, {tuple(pos) for pos in arrays[name].tolist()})
+        elif getattr(schedule, "frontier", False):
+            schedule.front = arrays["front"].astype(np.intp)
+            schedule.pending = arrays["pending"].astype(np.intp)
@@ -1,10 +1,25 @@
-import os.path
+from .ScenarioBundle import ScenarioBundle
+from .RainPrefetcher import RainPrefetcher
 
 
 class DataLoader:
-    """ Load scenarios data from csv file """
-    def __init__(self, model):
+    """ Load scenarios data. The maps are read from the compiled bundle of the scenario (see ScenarioBundle) """
+    def __init__(self, model, rain_lookahead=1):
         self.model = model
+        self.bundle = ScenarioBundle(self.model.wildfire_name, self.model.log)
+
+        # Read the rain of the next days in background
+        self.rain_prefetcher = RainPrefetcher(self.bundle, rain_lookahead) if rain_lookahead > 0 else None
+
+    def load_size(self, width=None, height=None):
+        """ Set the size of the grid from the maps of the scenario. A given width or height must match them """
+        scenario_height, scenario_width = self.bundle.get_shape()
+        if (width is not None and width != scenario_width) or (height is not None and height != scenario_height):
+            raise RuntimeError("The grid is {}x{}, but the maps of the scenario {} are {}x{}".format(
+                width, height, self.model.wildfire_name, scenario_width, scenario_height))
+        self.model.width = scenario_width
+        self.model.height = scenario_height
+        self.model.log("data", "The grid is {}x{}", scenario_width, scenario_height)
 
     def load_starting_points(self):
         with open("data/{}/starting_points.csv".format(self.model.wildfire_name), "r") as file:
@@ -14,65 +29,43 @@ class DataLoader:
                 radius = float(line[2])
                 point_name = line[3].strip()
                 self.model.draw_circle(starting_point, radius)
-                print("Loaded fire at {} (radius: {}, name: {})".format(starting_point, radius, point_name))
-        print("All starting points have been loaded")
+                self.model.log("data", "Loaded fire at {} (radius: {}, name: {})", starting_point, radius, point_name)
+        self.model.log("data", "All starting points have been loaded")
 
     def load_burned_map(self):
-        if os.path.exists("data/{}/burned_mask.csv".format(self.model.wildfire_name)):
-            with open("data/{}/burned_mask.csv".format(self.model.wildfire_name), "r") as file:
-                is_burned = []
-                for line in file:
-                    line = line.split(",")
-                    line = [float(i) for i in line]
-                    is_burned.append(line)
-
-                for (cell, x, y) in self.model.grid.coord_iter():
-                    cell.is_burned = is_burned[self.model.height - 1 - y][x]
-            print("The burned map has been loaded")
+        is_burned = self.bundle.get("burned_mask")
+        if is_burned is not None:
+            self.load_static_layer("is_burned", is_burned)
+            self.model.log("data", "The burned map has been loaded")
 
     def load_rates_of_spread(self):
-        with open("data/{}/spread_component.csv".format(self.model.wildfire_name), "r") as file:
-            rates_of_spread = []
-            for line in file:
-                line = line.split(",")
-                line = [float(i) for i in line]
-                rates_of_spread.append(line)
-
-            for (cell, x, y) in self.model.grid.coord_iter():
-                cell.rate_of_spread = rates_of_spread[self.model.height - 1 - y][x]
-        print("The rates of spread have been loaded")
+        self.load_static_layer("rate_of_spread", self.bundle.get("spread_component"))
+        self.model.log("data", "The rates of spread have been loaded")
 
     def load_heights(self):
-        with open("data/{}/elevation.csv".format(self.model.wildfire_name), "r") as file:
-            heights = []
-            for line in file:
-                line = line.split(",")
-                line = [float(i) for i in line]
-                heights.append(line)
+        self.load_static_layer("height", self.bundle.get("elevation"))
+        self.model.log("data", "The elevation map has been loaded")
 
-            for (cell, x, y) in self.model.grid.coord_iter():
-                cell.height = heights[self.model.height - 1 - y][x]
-        print("The elevation map has been loaded")
+    def load_static_layer(self, name, values):
+        """ Set a layer that doesn't change during the simulation, using the one of the scenario store if the model can share it """
+        store = self.model.scenario_store
+        shared = store.get_layer(self.model, name) if store is not None else None
+        if shared is not None:
+            self.model.grid_state.layers[name] = shared
+        else:
+            self.model.set_layer(name, values)
 
     def load_wind(self):
-        with open("data/{}/wind.csv".format(self.model.wildfire_name), "r") as file:
-            for line in file:
-                line = line.split(",")
-                line = [float(i) for i in line]
-                self.model.wind.append(line)
-        print("The wind map has been loaded")
+        self.model.wind.extend(self.bundle.get("wind").tolist())
+        self.model.log("data", "The wind map has been loaded")
 
     def load_rain(self, day):
-        with open("data/{}/rain/rain{}.csv".format(self.model.wildfire_name, day), "r") as file:
-            rain = []
-            for line in file:
-                line = line.split(",")
-                line = [float(i) for i in line]
-                rain.append(line)
-
-            for (cell, x, y) in self.model.grid.coord_iter():
-                cell.rain = rain[self.model.height - 1 - y][x]
-        print("The rain data at day {} has been loaded".format(day))
+        if self.rain_prefetcher is not None:
+            rain = self.rain_prefetcher.get(day)
+        else:
+            rain = self.bundle.get_rain(day)
+        self.model.set_layer("rain", rain)
+        self.model.log("data", "The rain data at day {} has been loaded", day)
 
     def load_starting_day(self):
         with open("data/{}/starting_day.csv".format(self.model.wildfire_name), "r") as file:
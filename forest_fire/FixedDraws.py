@@ -0,0 +1,12 @@
+import numpy as np
+
+
+class FixedDraws:
+    """ Replace a random number generator of the model, so every cell has (or hasn't) a gust of wind """
+
+    def __init__(self, value):
+        self.value = value
+
+    def random(self, shape=None):
+        """ Return the value, or an array of the given shape filled with it, like random.random and np.random.random """
+        return self.value if shape is None else np.full(shape, self.value)
@@ -1,5 +1,6 @@
 import numpy as np
 from mesa import Agent
+from .PropagationRule import neighbor_directions
 
 
 class ForestCell(Agent):
@@ -23,6 +24,8 @@ class ForestCell(Agent):
 
         self.is_burned = 0  # Indicate whether the cell is burned or not in the real wildfire (ground truth)
 
+        self.neighbors = None  # The neighbors of the cell, see get_neighbors()
+
     def step(self):
         """ Calculate the next state of the cell using the given propagation rule """
         self.next_state = self.model.propagation_rule.apply(self)
@@ -30,15 +33,38 @@ class ForestCell(Agent):
     def advance(self):
         """ Update the current state of the cell """
         if self.state != self.next_state:
-            print("Cell {} changed state from {} to {}".format(self.pos, self.state, self.next_state))
+            self.model.log("cells", "Cell {} changed state from {} to {}", self.pos, self.state, self.next_state)
+            self.model.metrics.update_cell(self, self.state, self.next_state)
+            self.model.profiler.count("cells.changed")
+            if self.model.recorders:
+                x, y = self.pos
+                for recorder in self.model.recorders:
+                    recorder.add((self.model.height - 1 - y) * self.model.width + x, self.next_state)
 
         self.state = self.next_state
 
+    def get_neighbors(self):
+        """
+            Return the neighbors inside the grid as (a, b, angle, diagonal, neighbor) tuples, where (a, b) is the offset
+            of the neighbor and angle is the direction of the fire coming from it. The adjacent neighbors come first.
+            The list is built at the first call, since the neighbors never change
+        """
+        if self.neighbors is None:
+            self.neighbors = []
+            for (a, b, angle, diagonal) in neighbor_directions:
+                x, y = self.pos[0] + a, self.pos[1] + b
+                if not self.model.grid.out_of_bounds((x, y)):
+                    self.neighbors.append((a, b, angle, diagonal, self.model.get_cell(x, y)))
+        return self.neighbors
+
     def get_height_factor(self, a, b):
         return self.height_factors[1 - b][a + 1]
 
+    def set_height_factor(self, a, b, value):
+        self.height_factors[1 - b][a + 1] = value
+
     def update_height_factor(self, phi):
         """ Update the height factor matrix using the given slope function """
         for neighbor in self.model.grid.iter_neighbors(self.pos, moore=True):
             a, b = np.array(neighbor.pos) - self.pos
-            self.height_factors[1 - b][a + 1] = phi(self.height - neighbor.height, a, b)
+            self.height_factors[1 - b][a + 1] = phi(self.height - neighbor.height, a, b, self.model.parameters)
@@ -1,9 +1,32 @@
 import math
+import os
+import random
+import time
+import numpy as np
 from mesa import Model
-from mesa.time import SimultaneousActivation
 from mesa.space import SingleGrid
 from .ForestCell import ForestCell
+from .CellView import CellView
+from .ArrayGrid import ArrayGrid
+from .GridState import GridState, directions
+from .SlopeFactors import SlopeFactors
+from .GridActivation import GridActivation
+from .ArrivalActivation import ArrivalActivation
+from .TiledActivation import TiledActivation
+from .NumpyBackend import NumpyBackend
+from .NumbaBackend import NumbaBackend
+from .CellActivation import CellActivation
+from .FrontierActivation import FrontierActivation
 from .DataLoader import DataLoader
+from .WindFactorCalculator import WindFactorCalculator
+from .Metrics import Metrics
+from .Parameters import Parameters
+from .TraceRecorder import TraceRecorder
+from .OutputWriter import OutputWriter
+from .Checkpoint import Checkpoint
+from .Profiler import Profiler
+from .SteadyState import SteadyState
+from .SimulationWindow import SimulationWindow
 from .BaseRule import BaseRule
 from .ExtendedRule import ExtendedRule
 from .OurRule import OurRule
@@ -12,56 +35,221 @@ from .OurRule import OurRule
 class ForestFire(Model):
     """ Define the Forest Fire Model and its parameters"""
 
-    def __init__(self, width, height, propagation_rule, scenario, show_partial_burned_cells):
-        """ Initialize the model """
+    subsystems = ("data", "model", "cells", "metrics", "profile")  # The subsystems that print messages
+
+    def __init__(self, width, height, propagation_rule, scenario, show_partial_burned_cells, engine="cell",
+                 storage="agents", dtype=np.float64, frontier=False, rain_lookahead=1,
+                 seed=None, members=None, metrics_interval=1, verbose=True,
+                 trace=None, checkpoint=None, checkpoint_interval=1, parameters=None,
+                 backend="numpy", tiles=None, profile=False, profile_interval=0, profile_steps=None,
+                 steady_state=None, scenario_store=None, output=None, window=None):
+        """
+            Initialize the model. The engine can be:
+            - "cell": each cell computes its next state using the propagation rule
+            - "grid": the next state of the whole grid is computed at once using the vectorized propagation rule
+            - "arrival": the step in which each cell ignites is computed by an event-driven solver (see ArrivalTimeSolver).
+              It requires a rule with discrete states (ExtendedRule) and it can run ahead of the model (schedule.forecast)
+
+            The storage can be:
+            - "agents": each cell is a mesa agent placed in the grid
+            - "arrays": the cells are stored as one array (of the given dtype) per attribute. It requires the grid or the arrival engine
+
+            If frontier is True, only the cells around the fire front are updated in each step.
+            The rain of the next rain_lookahead days is read in background (0 to read it at the day boundary).
+            The seed initializes the random number generators of the model.
+            If members is given, the model simulates an ensemble of realizations together. It requires the arrays storage.
+            The metrics are recorded every metrics_interval steps.
+
+            The width and the height of the grid are read from the maps of the scenario: if they are given
+            (not None), they must match them.
+
+            The messages of each subsystem ("data", "model", "cells", "metrics", "profile") are printed if verbose is True or
+            if it contains the name of the subsystem. If trace is a path, the changes of state are recorded in it.
+            If output is a folder, the arrival step of each cell, its peak state and the metrics of each step are
+            written in it while the model runs (see OutputWriter): with metrics_interval=0 the metrics aren't kept in memory.
+            If checkpoint is a folder, a checkpoint is saved in it every checkpoint_interval days (see load_checkpoint).
+            The parameters are the tuning constants of the model: a Parameters object or a dict of values (see Parameters).
+
+            The backend computes the next states in the grid engine:
+            - "numpy": the vectorized version of the propagation rule
+            - "numba": a kernel compiled by Numba that updates each cell in a single pass, using every core.
+              If Numba isn't installed, the numpy backend is used
+
+            If tiles is given, the grid engine splits the grid into the given number of bands of rows, each one updated
+            by a worker process using the vectorized rule. It can't be used with the frontier
+
+            If profile is True, the time spent in each phase of a step is measured (see Profiler): the timers are
+            printed every profile_interval steps (0 to never print them) and the steps in the profile_steps range
+            (first, last) are captured with cProfile
+
+            The steady_state option detects when the cells stop changing (see SteadyState):
+            - "stop": the model stops running when the fire is out
+            - "skip": the model also jumps to the next day when no cell can change before the rain and the wind change
+
+            If scenario_store is a ScenarioStore holding the scenario, the layers that don't change during the simulation
+            and the height factors are shared with the other models of the store instead of being loaded again
+
+            If window is given, only the cells around the fire are simulated, with a margin of window cells, and the
+            window grows with the fire (see SimulationWindow). It requires the grid engine with the arrays storage
+        """
+
+        self.verbose = set(self.subsystems) if verbose is True else set(verbose or ())
+
+        # The seconds spent in each phase of the initialization: reading the data, creating the cells and computing the slopes
+        start = time.perf_counter()
+        self.setup_times = {"loader": 0.0, "agents": 0.0, "slope": 0.0}
 
         self.wildfire_name = scenario
         self.starting_day = 0
 
         self.show_partial_burned_cells = show_partial_burned_cells
+        self.parameters = Parameters.get(parameters)
+        self.scenario_store = scenario_store
+
+        # Simulate only the cells around the fire
+        self.window = None
+        if window is not None:
+            if engine != "grid" or storage != "arrays" or tiles is not None:
+                raise RuntimeError("The window requires the grid engine with the arrays storage, without the tiles")
+            if checkpoint is not None:
+                raise RuntimeError("The window doesn't support the checkpoints")
+            rain_lookahead = 0  # The rain is read only in the window, when the day starts
 
         # Define how the agents' behaviour will be scheduled
-        self.schedule = SimultaneousActivation(self)
+        self.engine = engine
+        self.schedule = self.get_schedule(engine, frontier, tiles)
+        self.grid_state = None
+        self._seed = seed
+        self.random = random.Random(seed)
+        self.np_random = np.random.default_rng(seed)
+
+        # Take the size of the grid from the scenario
+        phase_start = time.perf_counter()
+        self.data_loader = DataLoader(self, rain_lookahead)
+        self.data_loader.load_size(width, height)
+        self.setup_times["loader"] += time.perf_counter() - phase_start
 
         # Define the space type
-        self.width = width
-        self.height = height
-        self.grid = SingleGrid(self.width, self.height, torus=False)
+        phase_start = time.perf_counter()
+        self.storage = storage
+        self.dtype = dtype
+        if self.storage == "agents":
+            self.grid = SingleGrid(self.width, self.height, torus=False)
 
-        # Initialize each cell and set the initial state
-        self.cells = [[None for _ in range(self.width)] for _ in range(self.height)]
-        self.setup_cells()
+            # Initialize each cell and set the initial state
+            self.cells = [[None for _ in range(self.width)] for _ in range(self.height)]
+            self.setup_cells()
+        elif self.storage == "arrays":
+            if self.engine not in ("grid", "arrival"):
+                raise RuntimeError("The arrays storage requires the grid or the arrival engine")
+            if window is not None:
+                self.window = SimulationWindow(self, window)
+            else:
+                self.grid_state = GridState(self.width, self.height, self.dtype)
+            self.grid = ArrayGrid(self)
+            self.cells = None
+        else:
+            raise RuntimeError("Storage not found")
+        self.setup_times["agents"] += time.perf_counter() - phase_start
 
         self.wind = []
+        self.wind_context = None  # The wind of the current day, see WindContext
 
         # Load wildfire data
-        self.data_loader = DataLoader(self)
+        phase_start = time.perf_counter()
         self.data_loader.load_starting_points()  # Load the wildfire starting points
         self.data_loader.load_burned_map()  # Load the burned map
         self.data_loader.load_rates_of_spread()  # Load the rates of spread of each cell
         self.data_loader.load_heights()  # Load the height of each cell
         self.data_loader.load_wind()  # Load the wind data
         self.data_loader.load_starting_day()  # Load the starting day
+        self.setup_times["loader"] += time.perf_counter() - phase_start
 
-        print("The starting day is {}".format(self.starting_day))
+        self.log("model", "The starting day is {}", self.starting_day)
 
         self.max_ros = self.get_max_ros()
-        print("The maximum rate of spread is {} m/s".format(self.max_ros))
+        self.log("model", "The maximum rate of spread is {} m/s", self.max_ros)
 
         self.cell_length = 734  # Length of a cell in meters
-        print("The cell length is {} m".format(self.cell_length))
+        self.log("model", "The cell length is {} m", self.cell_length)
 
         self.seconds_per_step = self.cell_length // self.max_ros
-        print("In the simulation 1 step is equivalent to {} seconds".format(self.seconds_per_step))
+        self.log("model", "In the simulation 1 step is equivalent to {} seconds", self.seconds_per_step)
 
         self.seconds_per_day = 86400
         self.steps_per_day = math.ceil(self.seconds_per_day / self.seconds_per_step)
-        print("In the simulation 1 day is equivalent to {} steps".format(self.steps_per_day))
+        self.log("model", "In the simulation 1 day is equivalent to {} steps", self.steps_per_day)
 
         # Define the rule to use to update the state of each cell
         self.propagation_rule = self.get_propagation_rule(propagation_rule)
 
+        # Define how the grid engine computes the next states
+        self.backend = self.get_backend(backend)
+
+        # Time the phases of each step
+        self.profiler = Profiler(self, profile, profile_interval, profile_steps)
+
+        # Copy the cells into arrays used by the vectorized propagation rule
+        phase_start = time.perf_counter()
+        if self.engine in ("grid", "arrival") and self.grid_state is None:
+            self.grid_state = GridState.from_cells(self)
+
+        # Stack the layers that change during the simulation, one for each member of the ensemble
+        if members is not None:
+            if self.storage != "arrays":
+                raise RuntimeError("The ensemble requires the arrays storage")
+            self.grid_state = self.grid_state.to_ensemble(members)
+        self.setup_times["agents"] += time.perf_counter() - phase_start
+
+        # Draw the first ignitions of the arrival engine
+        if self.engine == "arrival":
+            self.schedule.setup()
+
+        # Count the cells burned correctly and incorrectly
+        self.metrics = Metrics(self, metrics_interval)
+        self.metrics.count()
+
+        # Record the initial state of the cells
+        self.trace = None
+        if trace is not None:
+            members = self.grid_state.members if self.grid_state is not None else None
+            self.trace = TraceRecorder(trace, self.height, self.width, members, self.dtype)
+            self.trace.add_cells(*self.get_burning_cells())
+            self.trace.end_step(self.schedule.steps)
+
+        # Write the arrivals and the metrics of the run
+        self.output = None
+        if output is not None:
+            members = self.grid_state.members if self.grid_state is not None else None
+            self.output = OutputWriter(output, self.height, self.width, members, self.dtype, self.starting_day, self.steps_per_day)
+            self.output.add_cells(*self.get_burning_cells())
+            self.output.end_step(self.schedule.steps)
+
+        # The recorders of the cells that change state in each step
+        self.recorders = [recorder for recorder in (self.trace, self.output) if recorder is not None]
+
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+
+        self.steady_state = SteadyState(self, steady_state) if steady_state is not None else None
+
         self.running = True
+        self.setup_times["total"] = time.perf_counter() - start
+
+    def get_schedule(self, engine, frontier, tiles=None):
+        """ Return the scheduler used by the given engine """
+        if tiles is not None:
+            if engine != "grid" or frontier:
+                raise RuntimeError("The tiles require the grid engine without the frontier")
+            return TiledActivation(self, tiles)
+        if engine == "cell":
+            return FrontierActivation(self) if frontier else CellActivation(self)
+        elif engine == "grid":
+            return GridActivation(self, frontier)
+        elif engine == "arrival":
+            return ArrivalActivation(self)
+        else:
+            raise RuntimeError("Engine not found")
 
     def get_propagation_rule(self, propagation_rule):
         """ Return the propagation rule object """
@@ -74,6 +262,20 @@ class ForestFire(Model):
         else:
             raise RuntimeError("Rule not found")
 
+    def get_backend(self, backend):
+        """ Return the compute backend of the grid engine """
+        if backend == "numpy":
+            return NumpyBackend()
+        elif backend == "numba":
+            if self.engine != "grid":
+                raise RuntimeError("The numba backend requires the grid engine")
+            if not NumbaBackend.available:
+                self.log("model", "Numba is not installed, the numpy backend will be used")
+                return NumpyBackend()
+            return NumbaBackend(self)
+        else:
+            raise RuntimeError("Backend not found")
+
     def setup_cells(self):
         """ Setup the grid """
         for (_, x, y) in self.grid.coord_iter():
@@ -83,22 +285,87 @@ class ForestFire(Model):
             self.schedule.add(forest_cell)
 
     def draw_circle(self, center, radius):
-        """ Draw a circle at the given center """
+        """ Draw a circle at the given center. Only the cells in the square around the circle are visited """
         x0, y0 = center
-        for (cell, x, y) in self.grid.coord_iter():
-            if (x - x0) ** 2 + (y - y0) ** 2 <= radius ** 2:
-                self.get_cell(x, y).state = 1.0
+        xs = range(max(0, math.ceil(x0 - radius)), min(self.width - 1, math.floor(x0 + radius)) + 1)
+        ys = range(max(0, math.ceil(y0 - radius)), min(self.height - 1, math.floor(y0 + radius)) + 1)
+        if len(xs) == 0 or len(ys) == 0:
+            return
+        if self.window is not None:
+            self.window.include(self.height - 1 - ys[-1], xs[0], self.height - ys[0], xs[-1] + 1)
+        for x in xs:
+            for y in ys:
+                if (x - x0) ** 2 + (y - y0) ** 2 <= radius ** 2:
+                    self.get_cell(x, y).state = 1.0
 
     def get_cell(self, x, y):
         """ Return the cell at the given position. The coordinate (x=0, y=0) indicate the bottom left corner """
+        if self.cells is None:
+            return CellView((x, y), self)
         return self.cells[self.height - 1 - y][x]
 
     def set_cell(self, x, y, cell):
         """ Set the cell at the given position. The coordinate (x=0, y=0) indicate the bottom left corner """
         self.cells[self.height - 1 - y][x] = cell
 
+    def set_layer(self, name, values):
+        """ Set an attribute of every cell. The values are given as rows, starting from the top of the map """
+        if self.storage == "agents":
+            rows = values.tolist() if hasattr(values, "tolist") else values
+            for (cell, x, y) in self.grid.coord_iter():
+                setattr(cell, name, rows[self.height - 1 - y][x])
+
+        if self.window is not None:
+            self.window.set_layer(name, values)
+        elif self.grid_state is not None:
+            self.grid_state.get(name)[:] = values
+
+    def get_layer(self, name):
+        """ Return an attribute of every cell as an array. The rows start from the top of the map """
+        if self.window is not None:
+            return self.window.get_layer(name)
+        if self.grid_state is not None:
+            return self.grid_state.get(name).copy()
+        return np.array([[getattr(cell, name) for cell in row] for row in self.cells], dtype=self.dtype)
+
+    def get_burning_cells(self):
+        """ Return the (row, col) indices of the cells whose state isn't 0, (member, row, col) in an ensemble, and their states """
+        state = self.grid_state.get("state") if self.grid_state is not None else self.get_layer("state")
+        cells = np.nonzero(state)
+        states = state[cells]
+        if self.window is not None:
+            cells = self.window.to_grid(cells)
+        return cells, states
+
+    def update_height_factors(self, phi):
+        """ Update the height factors of every cell using the given slope function """
+        start = time.perf_counter()
+        if self.window is not None:
+            self.window.update_height_factors(phi)
+            self.setup_times["slope"] += time.perf_counter() - start
+            return
+
+        height_factors = self.scenario_store.get_height_factors(self, phi) if self.scenario_store is not None else None
+        if height_factors is None:
+            height_factors = SlopeFactors.load(self, phi)
+        if self.grid_state is not None:
+            self.grid_state.height_factors = np.asarray(height_factors, dtype=self.dtype)  # The shared factors aren't copied
+
+        if self.storage == "agents":
+            for row in range(self.height):
+                for col in range(self.width):
+                    cell = self.cells[row][col]
+                    for k, (a, b) in enumerate(directions):
+                        cell.set_height_factor(a, b, float(height_factors[k, row, col]))
+        self.setup_times["slope"] += time.perf_counter() - start
+
     def get_max_ros(self):
         """ Return the maximum rate of spread in the grid """
+        if self.window is not None:
+            return max(0.0, self.window.get_max("rate_of_spread"))
+        if self.storage == "arrays":
+            return max(0.0, float(self.grid_state.get("rate_of_spread").max()))
+
         max_ros = 0.0
         for (cell, x, y) in self.grid.coord_iter():
             max_ros = max(max_ros, cell.rate_of_spread)
@@ -109,27 +376,118 @@ class ForestFire(Model):
 
     def step(self):
         """ Execute a step in the model """
+        profiler = self.profiler
+        profiler.start_step()
+
         # Load the daily rain
         if self.schedule.steps % self.steps_per_day == 0:
-            self.data_loader.load_rain(self.starting_day + self.get_days_elapsed())
+            with profiler.timer("load_rain"):
+                self.data_loader.load_rain(self.starting_day + self.get_days_elapsed())
+
+        # The wind is the same for the whole day
+        self.wind_context = WindFactorCalculator.get_context(self)
+
+        with profiler.timer("schedule"):
+            self.schedule.step()
+
+        self.end_step()
+
+        # Stop, or skip the steps that can't change any cell
+        if self.steady_state is not None:
+            with profiler.timer("steady_state"):
+                self.steady_state.check()
+
+        # Save a checkpoint at the day boundary
+        if self.checkpoint is not None and self.schedule.steps % (self.steps_per_day * self.checkpoint_interval) == 0:
+            day = self.starting_day + self.get_days_elapsed()
+            with profiler.timer("checkpoint"):
+                self.save_checkpoint(os.path.join(self.checkpoint, "day{}.npz".format(day)))
+
+        profiler.end_step()
+
+    def end_step(self):
+        """ Record the step that just ended in the trace, the output files and the metrics """
+        profiler = self.profiler
+        if self.trace is not None:
+            with profiler.timer("trace"):
+                self.trace.end_step(self.schedule.steps)
+
+        if self.output is not None:
+            with profiler.timer("output"):
+                self.output.end_step(self.schedule.steps)
+
+        with profiler.timer("metrics"):
+            self.metrics.record()
+
+    def save_checkpoint(self, path):
+        """ Save the state of the simulation in the given path """
+        Checkpoint.save(self, path)
+
+    @staticmethod
+    def load_checkpoint(path, **options):
+        """
+            Build a model from a checkpoint and resume the simulation from it. The options override the arguments
+            saved in the checkpoint, e.g. to continue with another propagation rule or as an ensemble.
+            If a seed is given, the random numbers don't continue the ones of the checkpoint
+        """
+        metadata, arrays = Checkpoint.read(path)
+        arguments = dict(metadata["options"])
+        arguments.update(options)
+        arguments["dtype"] = np.dtype(arguments["dtype"])
+        model = ForestFire(**arguments)
+        Checkpoint.restore(model, metadata, arrays, restore_random="seed" not in options)
+        return model
+
+    def log(self, subsystem, message, *args):
+        """ Print a message of the given subsystem, if it's enabled. The message is formatted with the arguments """
+        if subsystem in self.verbose:
+            print(message.format(*args))
 
-        self.schedule.step()
+    def close(self):
+        """ Release the resources of the model: the trace and the output files, the rain prefetcher and the workers of the tiles """
+        if isinstance(self.schedule, TiledActivation):
+            self.schedule.close()
+        if self.trace is not None:
+            self.trace.close()
+        if self.output is not None:
+            self.output.close()
+        if self.data_loader.rain_prefetcher is not None:
+            self.data_loader.rain_prefetcher.close()
 
-        self.print_metrics()
+    def get_metrics(self):
+        """
+            Return the precision, the recall and the F1-score of the simulation compared to the real wildfire.
+            In an ensemble, return the averages of the metrics of the members
+        """
+        precision, recall, f1_score = self.get_member_metrics()
+        return float(np.mean(precision)), float(np.mean(recall)), float(np.mean(f1_score))
 
-    def print_metrics(self):
-        true_positive, false_positive, false_negative = 0, 0, 0
-        for (cell, _, _) in self.grid.coord_iter():
-            if cell.state == 1.0 and cell.is_burned:
-                true_positive += 1
-            elif cell.state == 1.0 and not cell.is_burned:
-                false_positive += 1
-            elif cell.state == 0.0 and cell.is_burned:
-                false_negative += 1
+    def get_member_metrics(self):
+        """ Return the precision, the recall and the F1-score of each member of the ensemble """
+        return self.metrics.get()
 
-        precision = true_positive / (true_positive + false_positive)
-        recall = true_positive / (true_positive + false_negative)
-        f1_score = 2 / ((1 / precision) + (1 / recall))
+    def get_burn_probability(self):
+        """ Return, for each cell, the fraction of the members of the ensemble in which the cell is burned """
+        burned = (self.get_layer("state") if self.window is not None else self.grid_state.get("state")) == 1.0
+        return burned.mean(axis=0) if self.grid_state.members is not None else burned.astype(float)
 
-        print("Metrics at step {}".format(self.schedule.steps))
-        print("Precision: {} | Recall: {} | F1-Score: {}".format(precision, recall, f1_score))
+    def get_ensemble_metrics(self, threshold=0.5):
+        """
+            Return the statistics of the F1-score of the members of the ensemble, along with the metrics of the
+            map of the cells whose burn probability is at least the given threshold
+        """
+        _, _, f1_score = self.get_member_metrics()
+        burned = self.get_burn_probability() >= threshold
+        is_burned = (self.get_layer("is_burned") if self.window is not None else self.grid_state.get("is_burned")) != 0
+        precision, recall, probability_f1_score = Metrics.compute(np.count_nonzero(burned & is_burned),
+                                                                  np.count_nonzero(burned & ~is_burned),
+                                                                  np.count_nonzero(~burned & is_burned))
+        return {
+            "f1_score_mean": float(np.mean(f1_score)),
+            "f1_score_std": float(np.std(f1_score)),
+            "f1_score_min": float(np.min(f1_score)),
+            "f1_score_max": float(np.max(f1_score)),
+            "probability_precision": float(precision),
+            "probability_recall": float(recall),
+            "probability_f1_score": float(probability_f1_score)
+        }
@@ -0,0 +1,104 @@
+import asyncio
+
+
+class Subscription:
+    """
+        The frames received by a viewer. Only the latest frame is kept: the ones published while the viewer is
+        busy (or waiting for its frame interval) are dropped, so a slow viewer never slows the model down
+    """
+
+    def __init__(self, hub, interval=0.0):
+        self.hub = hub
+        self.interval = interval  # The minimum number of seconds between two frames
+        self.frame = hub.latest  # The latest frame published
+        self.last = None  # The last frame taken by the viewer
+        self.last_time = None
+        self.dropped = 0  # The number of frames published but never taken
+        self.event = asyncio.Event()
+        if self.frame is not None:
+            self.event.set()
+
+    def offer(self, frame):
+        """ Replace the latest frame, dropping it if the viewer didn't take it """
+        if self.frame is not None and self.frame is not self.last:
+            self.dropped += 1
+        self.frame = frame
+        self.event.set()
+
+    def has_next(self):
+        """ Return whether a frame newer than the last one taken has been published """
+        return self.frame is not None and self.frame is not self.last
+
+    async def next(self):
+        """ Wait for a frame newer than the last one taken, no sooner than interval seconds after it """
+        loop = asyncio.get_running_loop()
+        if self.last_time is not None and self.interval > 0:
+            delay = self.last_time + self.interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        while not self.has_next():
+            self.event.clear()
+            await self.event.wait()
+        self.last = self.frame
+        self.last_time = loop.time()
+        return self.last
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.next()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class FrameHub:
+    """
+        Fan out the frames published by a SimulationWorker to the viewers, on the asyncio loop of the server.
+        The worker thread calls publish(), which hands the frame over to the loop: each subscription keeps only
+        the latest frame, so the model never waits for the viewers
+    """
+
+    def __init__(self):
+        self.loop = None  # The loop of the subscribers, known once the first one subscribes
+        self.model = None  # The model whose frames are published
+        self.latest = None
+        self.subscribers = set()
+
+    def publish(self, frame):
+        """ Publish a frame. It can be called from any thread """
+        if self.loop is None:
+            if frame.model is self.model:
+                self.latest = frame
+        else:
+            self.loop.call_soon_threadsafe(self.dispatch, frame)
+
+    def reset(self, frame):
+        """
+            Publish the first frame of a new model. It must be called in the loop (or before it starts): the frames
+            of the previous model that are still on their way are dropped
+        """
+        self.model = frame.model
+        if self.loop is None:
+            self.latest = frame
+        else:
+            self.dispatch(frame)
+
+    def dispatch(self, frame):
+        """ Give the frame to every subscriber, in the loop """
+        if frame.model is not self.model:
+            return
+        self.latest = frame
+        for subscription in self.subscribers:
+            subscription.offer(frame)
+
+    def subscribe(self, interval=0.0):
+        """ Return a subscription receiving the latest frame, at most one every interval seconds. It must be called in the loop """
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(self, interval)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
@@ -0,0 +1,63 @@
+from .CellActivation import CellActivation
+
+
+class FrontierActivation(CellActivation):
+    """
+        A scheduler that activates only the cells whose state can change: the cells around the fire front and
+        the cells whose rain deficit is still changing. Any other cell would keep its state, so the result is
+        the same of SimultaneousActivation, but the cost of a step depends on the size of the fire front
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.front = set()  # The positions of the burning cells that can still ignite a neighbor
+        self.pending = set()  # The positions of the cells that must be activated in the next step
+
+    def step(self):
+        """ Step the cells around the fire front, then advance them """
+        # The rain changes every day
+        if self.steps % self.model.steps_per_day == 0:
+            self.scan()
+
+        cells = [self._agents[pos] for pos in sorted(self.get_candidates())]
+        states = [cell.state for cell in cells]
+        rain_deficits = [cell.rain_deficit for cell in cells]
+
+        self.activate(cells)
+
+        self.pending = set()
+        for cell, state, rain_deficit in zip(cells, states, rain_deficits):
+            if cell.state != state:
+                self.pending.add(cell.pos)
+                if cell.state > 0:
+                    self.front.add(cell.pos)
+            elif cell.rain_deficit != rain_deficit:
+                self.pending.add(cell.pos)
+
+        self.front = {pos for pos in self.front if any(self.can_change(cell) for cell in self.iter_neighborhood(pos))}
+
+        self.steps += 1
+        self.time += 1
+
+    def scan(self):
+        """ Find the burning cells and the cells affected by the rain looking at the whole grid """
+        uses_rain = self.model.propagation_rule.uses_rain
+        self.front = set()
+        for cell in self._agents.values():
+            if cell.state > 0:
+                self.front.add(cell.pos)
+            elif uses_rain and self.can_change(cell) and (cell.rain > 0 or cell.rain_deficit > 0):
+                self.pending.add(cell.pos)
+
+    def get_candidates(self):
+        """ Return the positions of the cells that can change their state in the current step """
+        candidates = {cell.pos for pos in self.front for cell in self.iter_neighborhood(pos)}
+        candidates.update(self.pending)
+        return {pos for pos in candidates if self.can_change(self._agents[pos])}
+
+    def iter_neighborhood(self, pos):
+        """ Iterate the cell at the given position and its neighbors """
+        return self.model.grid.iter_neighbors(pos, moore=True, include_center=True)
+
+    def can_change(self, cell):
+        return self.model.propagation_rule.can_change(cell.state, cell.rate_of_spread)
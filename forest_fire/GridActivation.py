@@ -0,0 +1,149 @@
+import numpy as np
+from mesa.time import BaseScheduler
+from .GridSelection import GridSelection
+
+
+class GridActivation(BaseScheduler):
+    """
+        A scheduler that updates the whole grid at once using the compute backend of the model (by default, the
+        vectorized version of the propagation rule).
+        The next states are computed from the current ones and then applied together, like SimultaneousActivation.
+
+        If frontier is True, only the cells around the fire front and the cells whose rain deficit is still
+        changing are updated: the others would keep their state, so the result doesn't change
+    """
+
+    def __init__(self, model, frontier=False):
+        super().__init__(model)
+        self.frontier = frontier
+        self.front = np.empty(0, dtype=np.intp)  # The indices of the burning cells that can still ignite a neighbor
+        self.pending = np.empty(0, dtype=np.intp)  # The indices of the cells that must be updated in the next step
+        self.changed = {}  # The number of changed values of each layer in the last step
+
+    def step(self):
+        """ Compute the next state of every cell, then advance them """
+        profiler = self.model.profiler
+        if self.frontier:
+            changes = self.step_frontier()
+        else:
+            grid_state = self.model.grid_state
+            with profiler.timer("rule.apply"):
+                grid_state.stage("state", self.model.backend.apply_grid(self.model.propagation_rule, grid_state))
+            with profiler.timer("advance"):
+                changes = grid_state.commit()
+            profiler.count("cells.updated", grid_state.width * grid_state.height)
+
+        with profiler.timer("advance"):
+            self.model.metrics.update_cells(*changes["state"])
+            cells = changes["state"][0]
+            states = self.model.grid_state.get("state")[cells]
+            if self.model.recorders:
+                grid_cells = self.model.window.to_grid(cells) if self.model.window is not None else cells
+                for recorder in self.model.recorders:
+                    recorder.add_cells(grid_cells, states)
+            self.update_agents(changes)
+        profiler.count("cells.changed", len(changes["state"][1]))
+        self.changed = {name: len(values) for name, (_, values) in changes.items()}
+        self.steps += 1
+        self.time += 1
+
+        # Grow the window before the fire reaches the cells outside it
+        if self.model.window is not None:
+            with profiler.timer("window"):
+                self.model.window.follow(cells, states)
+
+    def step_frontier(self):
+        """ Compute the next state of the cells around the fire front, then advance them """
+        grid_state = self.model.grid_state
+        profiler = self.model.profiler
+
+        with profiler.timer("frontier"):
+            # The rain changes every day
+            if self.steps % self.model.steps_per_day == 0:
+                self.scan()
+
+            candidates = self.get_candidates()
+        profiler.count("cells.updated", len(candidates))
+
+        selection = GridSelection(grid_state, candidates)
+        with profiler.timer("rule.apply"):
+            selection.stage("state", self.model.backend.apply_grid(self.model.propagation_rule, selection))
+        with profiler.timer("advance"):
+            changes = selection.commit()
+
+        with profiler.timer("frontier"):
+            changed_states = self.to_index(changes["state"][0])
+            ignited = changed_states[self.any_member(grid_state.take("state", changed_states) > 0)]
+            self.front = np.union1d(self.front, ignited)
+            self.front = self.front[self.can_change(self.get_neighborhood(self.front, unique=False)).any(axis=1)]
+
+            self.pending = changed_states
+            if "rain_deficit" in changes:
+                self.pending = np.union1d(self.pending, self.to_index(changes["rain_deficit"][0]))
+
+        return changes
+
+    def get_candidates(self):
+        """ Return the indices of the cells updated by the next step: the ones that can change around the front or pending """
+        candidates = np.union1d(self.get_neighborhood(self.front), self.pending)
+        return candidates[self.can_change(candidates)]
+
+    def scan(self):
+        """ Find the burning cells and the cells affected by the rain looking at the whole grid """
+        grid_state = self.model.grid_state
+        state = grid_state.get("state")
+        self.front = np.flatnonzero(self.any_member(state > 0))
+
+        if self.model.propagation_rule.uses_rain:
+            wet = (grid_state.get("rain") > 0) | (grid_state.get("rain_deficit") > 0)
+            wet &= self.model.propagation_rule.can_change(state, grid_state.get("rate_of_spread"))
+            self.pending = np.union1d(self.pending, np.flatnonzero(self.any_member(wet)))
+
+    def get_neighborhood(self, index, unique=True):
+        """
+            Return the indices of the given cells and of their neighbors. If unique is False, return a row of 9
+            items for each cell, where the out of bounds neighbors are replaced by -1
+        """
+        width, height = self.model.grid_state.width, self.model.grid_state.height
+        rows, cols = np.divmod(index, width)
+        offsets = np.arange(-1, 2)
+        rows = (rows[:, None] + np.repeat(offsets, 3)[None, :])
+        cols = (cols[:, None] + np.tile(offsets, 3)[None, :])
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        neighborhood = np.where(inside, rows * width + cols, -1)
+        if unique:
+            return np.unique(neighborhood[inside])
+        return neighborhood
+
+    def can_change(self, index):
+        """ Return whether the state of the given cells can change. The index -1 stands for an out of bounds cell """
+        grid_state = self.model.grid_state
+        inside = index >= 0
+        index = np.where(inside, index, 0)
+        state = grid_state.take("state", index)
+        rate_of_spread = grid_state.take("rate_of_spread", index)
+        return inside & self.any_member(self.model.propagation_rule.can_change(state, rate_of_spread))
+
+    def any_member(self, values):
+        """ Reduce the member axis of an ensemble: the value of a cell is True if it's True in any member """
+        members_ndim = len(self.model.grid_state.members_shape)
+        return values.any(axis=tuple(range(members_ndim))) if members_ndim else values
+
+    def to_index(self, cells):
+        """ Convert the (row, col) indices of the cells into the indices of the flattened grid """
+        rows, cols = cells[-2:]
+        return np.unique(rows * self.model.grid_state.width + cols)
+
+    def update_agents(self, changes):
+        """ Copy the changed values into the cells of the model """
+        if self.model.storage == "arrays":
+            return
+
+        for name, ((rows, cols), _) in changes.items():
+            values = self.model.grid_state.get(name)
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                cell = self.model.cells[row][col]
+                value = float(values[row, col])
+                if name == "state":
+                    self.model.log("cells", "Cell {} changed state from {} to {}", cell.pos, cell.state, value)
+                setattr(cell, name, value)
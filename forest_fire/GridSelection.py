@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class GridSelection:
+    """
+        A subset of the cells of a GridState. It has the same interface of GridState, so the vectorized rules
+        can compute the next state of the selected cells only. The values are 1-d arrays, one item per cell
+        (2-d arrays with a row per member in an ensemble)
+    """
+
+    def __init__(self, grid_state, index):
+        self.grid_state = grid_state
+        self.index = index  # The indices of the cells in the flattened grid
+        self.rows, self.cols = np.divmod(index, grid_state.width)
+        self.padded_index = (self.rows + 1) * (grid_state.width + 2) + self.cols + 1
+        self.members_shape = grid_state.members_shape
+        self.shape = grid_state.members_shape + index.shape
+        self.dtype = grid_state.dtype
+
+        self.staged = {}
+
+    def get(self, name):
+        """ Return the values of the layer in the selected cells """
+        return self.take(name, self.padded_index)
+
+    def neighbor(self, name, a, b):
+        """ Return, for each selected cell, the value of the layer in the neighbor at offset (a, b) """
+        return self.take(name, self.padded_index - b * (self.grid_state.width + 2) + a)
+
+    def take(self, name, padded_index):
+        layer = self.grid_state.layers[name]
+        return layer.reshape(layer.shape[:-2] + (-1,)).take(padded_index, axis=-1)
+
+    def height_factor(self, a, b):
+        """ Return, for each selected cell, the height factor towards the neighbor at offset (a, b) """
+        return self.grid_state.height_factor(a, b).take(self.index)
+
+    def stage(self, name, values):
+        """ Save the next values of a layer. They will be applied by commit() """
+        self.staged[name] = values
+
+    def commit(self):
+        """
+            Apply the staged layers and return, for each of them, the (row, col) indices of the changed cells
+            and their previous values. In an ensemble the indices are (member, row, col)
+        """
+        changes = {}
+        for name, values in self.staged.items():
+            current = self.get(name)
+            changed = np.nonzero(current != values)
+            cells = changed[:-1] + (self.rows[changed[-1]], self.cols[changed[-1]])
+            self.grid_state.get(name)[cells] = values[changed]
+            changes[name] = (cells, current[changed])
+        self.staged = {}
+        return changes
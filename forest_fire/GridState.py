@@ -0,0 +1,104 @@
+import numpy as np
+from .WindFactorCalculator import v_adj, v_diag
+
+# Define the order in which the directions of the neighbors are stored
+directions = np.concatenate((v_adj, v_diag))
+direction_index = {(int(a), int(b)): k for k, (a, b) in enumerate(directions)}
+
+
+class GridState:
+    """
+        Store each layer of the grid as a contiguous array surrounded by a border of zeros.
+        The arrays follow the layout of the csv files: the row 0 is the top of the map, so the
+        cell at position (x, y) is stored at [height - 1 - y][x].
+
+        An ensemble of realizations of the model is stored adding a leading axis of length members to the layers
+        that change during the simulation, while the other layers are shared by all the members
+    """
+
+    layer_names = ("state", "rate_of_spread", "height", "rain", "rain_deficit", "is_burned")
+    member_layer_names = ("state", "rain_deficit")  # The layers that are different in each member of an ensemble
+
+    def __init__(self, width, height, dtype=np.float64):
+        self.width = width
+        self.height = height
+        self.members = None  # The number of members of the ensemble, or None for a single realization
+        self.members_shape = ()
+        self.shape = (height, width)
+        self.dtype = dtype
+
+        self.layers = {name: np.zeros((height + 2, width + 2), dtype=dtype) for name in self.layer_names}
+        self.height_factors = np.ones((len(directions), height, width), dtype=dtype)
+
+        self.staged = {}  # The layers computed in the current step, but not applied yet
+
+    @staticmethod
+    def from_cells(model):
+        """ Build the arrays copying the attributes of the cells of the model """
+        grid_state = GridState(model.width, model.height, model.dtype)
+        for row in range(model.height):
+            for col in range(model.width):
+                cell = model.cells[row][col]
+                for name in GridState.layer_names:
+                    grid_state.get(name)[row, col] = getattr(cell, name)
+                for k, (a, b) in enumerate(directions):
+                    grid_state.height_factors[k, row, col] = cell.get_height_factor(a, b)
+        return grid_state
+
+    def to_ensemble(self, members):
+        """ Return a grid state with the given number of members, all starting from the current state """
+        ensemble = GridState(self.width, self.height, self.dtype)
+        ensemble.members = members
+        ensemble.members_shape = (members,)
+        ensemble.shape = (members,) + self.shape
+        ensemble.layers = dict(self.layers)
+        for name in self.member_layer_names:
+            ensemble.layers[name] = np.repeat(self.layers[name][None], members, axis=0)
+        ensemble.height_factors = self.height_factors
+        return ensemble
+
+    def detach(self, names):
+        """ Return a grid state sharing the layers of this one, except the given ones which are copied """
+        grid_state = GridState.__new__(GridState)
+        grid_state.__dict__.update(self.__dict__)
+        grid_state.layers = dict(self.layers)
+        for name in names:
+            grid_state.layers[name] = self.layers[name].copy()
+        grid_state.staged = {}
+        return grid_state
+
+    def get(self, name):
+        """ Return the values of the layer without the border """
+        return self.layers[name][..., 1:-1, 1:-1]
+
+    def take(self, name, index):
+        """ Return the values of the layer in the cells at the given indices of the flattened grid """
+        rows, cols = np.divmod(index, self.width)
+        layer = self.layers[name]
+        return layer.reshape(layer.shape[:-2] + (-1,)).take((rows + 1) * (self.width + 2) + cols + 1, axis=-1)
+
+    def neighbor(self, name, a, b):
+        """ Return, for each cell, the value of the layer in the neighbor at offset (a, b). Out of bounds neighbors are 0 """
+        return self.layers[name][..., 1 - b:self.height + 1 - b, 1 + a:self.width + 1 + a]
+
+    def height_factor(self, a, b):
+        """ Return, for each cell, the height factor towards the neighbor at offset (a, b) """
+        return self.height_factors[direction_index[(int(a), int(b))]]
+
+    def stage(self, name, values):
+        """ Save the next values of a layer. They will be applied by commit() """
+        self.staged[name] = values
+
+    def commit(self):
+        """
+            Apply the staged layers and return, for each of them, the (row, col) indices of the changed cells
+            and their previous values. In an ensemble the indices are (member, row, col)
+        """
+        changes = {}
+        for name, values in self.staged.items():
+            current = self.get(name)
+            cells = np.nonzero(current != values)
+            changes[name] = (cells, current[cells])
+            current[...] = values
+        self.staged = {}
+        return changes
@@ -0,0 +1,35 @@
+from .GridState import direction_index
+
+
+class GridTile:
+    """
+        A band of rows of a GridState, with the same interface, so the vectorized rules can compute the next state
+        of the cells of the band only. The layers are the padded arrays of the grid state: the rows just above and
+        below the band are read from the arrays, so they act as the halo of the band
+    """
+
+    def __init__(self, layers, height_factors, rows, width, members_shape=()):
+        self.layers = layers
+        self.height_factors = height_factors
+        self.start, self.stop = rows  # The first row of the band and the row after the last one
+        self.width = width
+        self.members_shape = members_shape
+        self.shape = members_shape + (self.stop - self.start, width)
+
+        self.staged = {}
+
+    def get(self, name):
+        """ Return the values of the layer in the cells of the band """
+        return self.layers[name][..., 1 + self.start:1 + self.stop, 1:-1]
+
+    def neighbor(self, name, a, b):
+        """ Return, for each cell of the band, the value of the layer in the neighbor at offset (a, b) """
+        return self.layers[name][..., 1 + self.start - b:1 + self.stop - b, 1 + a:self.width + 1 + a]
+
+    def height_factor(self, a, b):
+        """ Return, for each cell of the band, the height factor towards the neighbor at offset (a, b) """
+        return self.height_factors[direction_index[(int(a), int(b))], self.start:self.stop]
+
+    def stage(self, name, values):
+        """ Save the next values of a layer """
+        self.staged[name] = values
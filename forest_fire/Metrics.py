@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class Metrics:
+    """
+        Keep the confusion matrix of the simulation compared to the real wildfire. The matrix is counted once on the
+        whole grid, then it's updated using only the cells that changed state in each step.
+        The metrics are recorded every interval steps in a time series, and in every step in the output of the model
+    """
+
+    def __init__(self, model, interval=1):
+        self.model = model
+        self.interval = interval  # Record the metrics every interval steps (0 to never record them)
+
+        self.true_positive = 0
+        self.false_positive = 0
+        self.false_negative = 0
+
+        self.series = {"step": [], "precision": [], "recall": [], "f1_score": []}
+
+    def count(self):
+        """ Count the confusion matrix looking at the whole grid """
+        if self.model.grid_state is not None:
+            state = self.model.grid_state.get("state")
+            is_burned = self.model.grid_state.get("is_burned") != 0
+            self.true_positive = np.count_nonzero((state == 1.0) & is_burned, axis=(-2, -1))
+            self.false_positive = np.count_nonzero((state == 1.0) & ~is_burned, axis=(-2, -1))
+            self.false_negative = np.count_nonzero((state == 0.0) & is_burned, axis=(-2, -1))
+            if self.model.window is not None:  # The cells outside the window aren't burning
+                self.false_negative = self.false_negative + self.model.window.count_burned_outside()
+        else:
+            self.true_positive, self.false_positive, self.false_negative = 0, 0, 0
+            for (cell, _, _) in self.model.grid.coord_iter():
+                self.update_cell(cell, None, cell.state)
+
+    def update_cell(self, cell, previous_state, state):
+        """ Update the confusion matrix after a cell changed state. The previous state is None for a new cell """
+        for value, sign in ((state, 1), (previous_state, -1)):
+            if value is None:
+                continue
+            if value == 1.0 and cell.is_burned:
+                self.true_positive += sign
+            elif value == 1.0 and not cell.is_burned:
+                self.false_positive += sign
+            elif value == 0.0 and cell.is_burned:
+                self.false_negative += sign
+
+    def update_cells(self, cells, previous_states):
+        """ Update the confusion matrix after the cells at the given indices of the grid state changed state """
+        grid_state = self.model.grid_state
+        states = grid_state.get("state")[cells]
+        is_burned = grid_state.get("is_burned")[cells[-2:]] != 0
+
+        differences = np.subtract(self.classify(states, is_burned), self.classify(previous_states, is_burned), dtype=np.int64)
+        if grid_state.members is None:
+            differences = differences.sum(axis=1)
+        else:
+            members = np.zeros((3, grid_state.members), dtype=np.int64)
+            for k in range(3):
+                np.add.at(members[k], cells[0], differences[k])
+            differences = members
+
+        self.true_positive = self.true_positive + differences[0]
+        self.false_positive = self.false_positive + differences[1]
+        self.false_negative = self.false_negative + differences[2]
+
+    @staticmethod
+    def classify(state, is_burned):
+        """ Return whether the cells are true positives, false positives and false negatives """
+        is_burned = np.asarray(is_burned) != 0
+        return (state == 1.0) & is_burned, (state == 1.0) & ~is_burned, (state == 0.0) & is_burned
+
+    def get(self):
+        """ Return the precision, the recall and the F1-score (one for each member in an ensemble) """
+        return self.compute(self.true_positive, self.false_positive, self.false_negative)
+
+    @staticmethod
+    def compute(true_positive, false_positive, false_negative):
+        """ Compute the precision, the recall and the F1-score from the confusion matrix. They are 0 if nothing is burned """
+        true_positive = np.asarray(true_positive, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(true_positive > 0, true_positive / (true_positive + false_positive), 0.0)
+            recall = np.where(true_positive > 0, true_positive / (true_positive + false_negative), 0.0)
+            f1_score = np.where(true_positive > 0, 2 / ((1 / precision) + (1 / recall)), 0.0)
+        return precision, recall, f1_score
+
+    def record(self):
+        """ Add the current metrics to the time series if the interval is over, and to the output of the model in every step """
+        step = self.model.schedule.steps
+        output = self.model.output
+        recorded = self.interval > 0 and step % self.interval == 0
+        if not recorded and output is None:
+            return
+
+        if output is not None:
+            output.add_metrics(step, *self.get())
+        if not recorded:
+            return
+
+        precision, recall, f1_score = self.model.get_metrics()
+
+        self.series["step"].append(step)
+        self.series["precision"].append(precision)
+        self.series["recall"].append(recall)
+        self.series["f1_score"].append(f1_score)
+
+        self.model.log("metrics", "Metrics at step {}", step)
+        self.model.log("metrics", "Precision: {} | Recall: {} | F1-Score: {}", precision, recall, f1_score)
+
+    def get_series(self):
+        """ Return the recorded metrics as arrays """
+        return {name: np.array(values) for name, values in self.series.items()}
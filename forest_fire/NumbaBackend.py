@@ -0,0 +1,242 @@
+import math
+import numpy as np
+from .BaseRule import BaseRule
+from .ExtendedRule import ExtendedRule
+from .OurRule import OurRule
+from .PropagationRule import neighbor_directions
+
+try:
+    import numba
+except ImportError:  # Numba is optional: without it the kernels aren't compiled and the model uses the numpy backend
+    numba = None
+
+prange = numba.prange if numba is not None else range
+
+
+def jit(**options):
+    """ Compile the function with Numba, if it's installed """
+    def decorator(function):
+        return numba.njit(**options)(function) if numba is not None else function
+    return decorator
+
+
+@jit(cache=True)
+def wind_factor(sum_ang, sum_states, draw, wind):
+    """
+        Compute the wind factor of a cell. The wind contains gust_prob, the terms of the WindContext of the day and
+        its tables of the factors of the directions of the neighbors, with and without a gust of wind
+    """
+    if sum_states == 0:
+        return 0.0
+    fire_angle = sum_ang / sum_states
+    gust = draw < wind[0]  # there is a gust of wind
+    k = min(max(int(round(fire_angle / 45)), 0), 7)
+    if k * 45 == fire_angle:
+        return wind[6 + k] if gust else wind[14 + k]
+
+    # The fire comes from between two neighbors
+    if gust:
+        scale, exponent = wind[1], wind[3]
+    else:
+        scale, exponent = wind[2], wind[4]
+    return scale * math.exp(exponent * (math.cos(wind[5] - math.radians(fire_angle)) - 1))
+
+
+@jit(parallel=True, cache=True)
+def base_rule_kernel(state, rate_of_spread, height_factors, padded_index, index, offsets, angles, draws, wind,
+                     diagonal_weight, next_state):
+    """ Compute the next state of the given cells with BaseRule, in a single pass """
+    for i in prange(index.shape[0]):
+        p = padded_index[i]
+        c = index[i]
+        for m in range(state.shape[0]):
+            current = state[m, p]
+            if current == 1.0 or rate_of_spread[p] == 0.0:
+                next_state[m, i] = current
+                continue
+
+            sum_ang = sum_states = adj_sum = diag_sum = 0.0
+            for k in range(offsets.shape[0]):
+                neighbor_state = state[m, p + offsets[k]]
+                sum_ang += angles[k] * neighbor_state
+                sum_states += neighbor_state
+                if k < 4:
+                    adj_sum += height_factors[k, c] * neighbor_state
+                else:
+                    diag_sum += height_factors[k, c] * neighbor_state
+            wind_component = wind_factor(sum_ang, sum_states, draws[m, i], wind)
+
+            value = current + wind_component * adj_sum
+            if value < 1.0:
+                value = value + wind_component * diag_sum * diagonal_weight
+            next_state[m, i] = min(1.0, value)
+
+
+@jit(parallel=True, cache=True)
+def extended_rule_kernel(state, rate_of_spread, height_factors, padded_index, index, offsets, angles, draws, wind,
+                         max_ros, next_state):
+    """ Compute the next state of the given cells with ExtendedRule, in a single pass """
+    for i in prange(index.shape[0]):
+        p = padded_index[i]
+        c = index[i]
+        for m in range(state.shape[0]):
+            current = state[m, p]
+            if current == 1.0 or rate_of_spread[p] == 0.0:
+                next_state[m, i] = current
+                continue
+
+            sum_ang = sum_states = adj_sum = diag_sum = 0.0
+            for k in range(offsets.shape[0]):
+                neighbor_state = state[m, p + offsets[k]]
+                neighbor_ros = rate_of_spread[p + offsets[k]]
+                sum_ang += angles[k] * neighbor_state
+                sum_states += neighbor_state
+                if k < 4:
+                    adj_sum += height_factors[k, c] * neighbor_ros * neighbor_state
+                else:
+                    diag_sum += height_factors[k, c] * neighbor_ros ** 2 * neighbor_state
+            wind_component = wind_factor(sum_ang, sum_states, draws[m, i], wind)
+
+            value = (rate_of_spread[p] / max_ros) * current
+            value += wind_component * adj_sum / max_ros
+            if value < 1.0:
+                value = value + wind_component * diag_sum * math.pi / (4 * max_ros ** 2)
+            next_state[m, i] = 0.0 if value < 1.0 else 1.0
+
+
+@jit(parallel=True, cache=True)
+def our_rule_kernel(state, rain_deficit, rate_of_spread, rain, height_factors, padded_index, index, offsets, angles,
+                    draws, wind, constants, next_state, next_deficit):
+    """
+        Compute the next state and the next rain deficit of the given cells with OurRule, in a single pass.
+        The constants are max_ros followed by the rain parameters
+    """
+    max_ros = constants[0]
+    suppression_slope, suppression_offset, suppression_max = constants[1], constants[2], constants[3]
+    reduction_slope, reduction_max = constants[4], constants[5]
+    drying, deficit_min = constants[6], constants[7]
+
+    for i in prange(index.shape[0]):
+        p = padded_index[i]
+        c = index[i]
+        for m in range(state.shape[0]):
+            current = state[m, p]
+            deficit = rain_deficit[m, p]
+            if current == 1.0 or rate_of_spread[p] == 0.0:
+                next_state[m, i] = current
+                next_deficit[m, i] = deficit
+                continue
+
+            sum_ang = sum_states = adj_sum = diag_sum = 0.0
+            for k in range(offsets.shape[0]):
+                q = p + offsets[k]
+                neighbor_state = state[m, q]
+                spread_reduction = 1 - rain_deficit[m, q]
+                sum_ang += angles[k] * neighbor_state
+                sum_states += neighbor_state
+                if k < 4:
+                    adj_sum += height_factors[k, c] * rate_of_spread[q] * spread_reduction * neighbor_state
+                else:
+                    diag_sum += height_factors[k, c] * rate_of_spread[q] ** 2 * spread_reduction * neighbor_state
+            wind_component = wind_factor(sum_ang, sum_states, draws[m, i], wind)
+
+            value = (rate_of_spread[p] * (1 - deficit) / max_ros) * current
+            value += wind_component * adj_sum / max_ros
+            if value < 1.0:
+                value = value + wind_component * diag_sum * math.pi / (4 * max_ros ** 2)
+
+            # Apply the rain factor
+            if rain[p] > 0:
+                if value > 0:
+                    value = value * (1 - max(min(suppression_max, (suppression_slope * rain[p]) - suppression_offset), 0))
+                else:
+                    deficit = max(min(reduction_max, reduction_slope * rain[p]), 0)
+            else:
+                deficit = deficit * drying
+                if deficit < deficit_min:
+                    deficit = 0.0
+
+            # Cap the result
+            if 0.0 < value < 0.001:
+                value = 0.0
+            next_state[m, i] = min(1.0, value)
+            next_deficit[m, i] = deficit
+
+
+class NumbaBackend:
+    """
+        Compute the next states with a kernel compiled by Numba. A kernel walks each cell once, computing the fire
+        direction, the wind factor, the sums of the formula and the rain factor together, and the cells are split
+        among the threads. The results are the same of the vectorized rules: the gusts of wind are drawn in the same
+        order, so only the rounding can change. Rules without a kernel use their vectorized version
+    """
+
+    name = "numba"
+    available = numba is not None
+
+    def __init__(self, model):
+        self.model = model
+        self.angles = np.array([angle for _, _, angle, _ in neighbor_directions], dtype=np.float64)
+        self.set_shape(model.height, model.width)
+
+    def set_shape(self, height, width):
+        """ Compute the indices of the cells of a grid of the given size. The window of the model can change it """
+        self.shape = (height, width)
+
+        # The indices of every cell of the grid, in the padded and in the flattened layers
+        self.index = np.arange(height * width, dtype=np.int64)
+        rows, cols = np.divmod(self.index, width)
+        self.padded_index = (rows + 1) * (width + 2) + cols + 1
+
+        # The offsets of the neighbors in the padded layers
+        self.offsets = np.array([-b * (width + 2) + a for a, b, _, _ in neighbor_directions], dtype=np.int64)
+
+    def apply_grid(self, rule, grid):
+        """ Return the next state of every cell of the grid (a GridState or a GridSelection) """
+        if type(rule) not in (BaseRule, ExtendedRule, OurRule):
+            return rule.apply_grid(grid)
+
+        grid_state, padded_index, index = self.get_index(grid)
+        members = grid_state.members or 1
+        parameters = self.model.parameters
+        context = self.model.wind_context
+
+        def flat(name):
+            layer = grid_state.layers[name]
+            return layer.reshape(-1) if name not in grid_state.member_layer_names else layer.reshape(members, -1)
+
+        state = flat("state")
+        rate_of_spread = flat("rate_of_spread")
+        height_factors = grid_state.height_factors.reshape(len(self.offsets), -1)
+        draws = self.model.np_random.random(grid.shape).reshape(members, -1)
+        wind = np.concatenate([[parameters.gust_prob, context.gust_scale, context.mean_scale, context.gust_exponent,
+                                context.mean_exponent, context.wind_angle], context.gust_factors_grid, context.mean_factors_grid])
+        next_state = np.empty((members, len(index)), dtype=grid_state.dtype)
+
+        if type(rule) is BaseRule:
+            base_rule_kernel(state, rate_of_spread, height_factors, padded_index, index, self.offsets, self.angles, draws,
+                             wind, parameters.diagonal_weight, next_state)
+        elif type(rule) is ExtendedRule:
+            extended_rule_kernel(state, rate_of_spread, height_factors, padded_index, index, self.offsets, self.angles,
+                                 draws, wind, float(self.model.max_ros), next_state)
+        else:
+            constants = np.array([self.model.max_ros, parameters.rain_suppression_slope, parameters.rain_suppression_offset,
+                                  parameters.rain_suppression_max, parameters.rain_reduction_slope, parameters.rain_reduction_max,
+                                  parameters.rain_drying, parameters.rain_deficit_min])
+            next_deficit = np.empty_like(next_state)
+            our_rule_kernel(state, flat("rain_deficit"), rate_of_spread, flat("rain"), height_factors, padded_index, index,
+                            self.offsets, self.angles, draws, wind, constants, next_state, next_deficit)
+            grid.stage("rain_deficit", next_deficit.reshape(grid.shape))
+
+        return next_state.reshape(grid.shape)
+
+    def get_index(self, grid):
+        """ Return the grid state and the indices of the cells of the grid, in the padded and in the flattened layers """
+        grid_state = grid.grid_state if hasattr(grid, "padded_index") else grid
+        if (grid_state.height, grid_state.width) != self.shape:
+            self.set_shape(grid_state.height, grid_state.width)
+
+        if hasattr(grid, "padded_index"):  # A GridSelection
+            return grid_state, grid.padded_index.astype(np.int64), grid.index.astype(np.int64)
+
+        return grid, self.padded_index, self.index
@@ -0,0 +1,9 @@
+class NumpyBackend:
+    """ Compute the next states with the vectorized version of the propagation rule """
+
+    name = "numpy"
+    available = True
+
+    def apply_grid(self, rule, grid):
+        """ Return the next state of every cell of the grid (a GridState or a GridSelection) """
+        return rule.apply_grid(grid)
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import numpy as np
+from .OutputWriter import manifest_name, raster_names
+
+
+class OutputReader:
+    """ Read the rasters and the metrics written by OutputWriter, without loading them in memory until they're used """
+
+    def __init__(self, path):
+        self.path = path
+        manifest_path = os.path.join(path, manifest_name)
+        if not os.path.exists(manifest_path):
+            raise RuntimeError("{} is not the output of a run".format(path))
+        with open(manifest_path) as file:
+            self.manifest = json.load(file)
+        self.shape = tuple(self.manifest["shape"])
+        self.starting_day = self.manifest["starting_day"]
+        self.steps_per_day = self.manifest["steps_per_day"]
+
+    def get_raster(self, name):
+        """ Return a raster (arrival_step, arrival_day or peak_state) as a read-only memory-mapped array """
+        if name not in raster_names:
+            raise RuntimeError("Raster not found")
+        return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+
+    def get_column(self, name):
+        """ Return a column of the metrics, with a row for each recorded step (and a column for each member in an ensemble) """
+        if name not in self.manifest["columns"]:
+            raise RuntimeError("Column not found")
+        dtype = np.dtype(self.manifest["columns"][name])
+        shape = tuple(self.manifest["column_shapes"][name])
+        path = os.path.join(self.path, "series", name + ".bin")
+
+        # A row written only in part by a run that stopped is ignored
+        row_size = dtype.itemsize * int(np.prod(shape))
+        rows = os.path.getsize(path) // row_size
+        return np.memmap(path, dtype=dtype, mode="r", shape=(rows,) + shape) if rows > 0 else np.empty((0,) + shape, dtype=dtype)
+
+    def get_series(self):
+        """ Return every column of the metrics, like Metrics.get_series """
+        return {name: self.get_column(name) for name in self.manifest["columns"]}
+
+    def get_state(self, step):
+        """ Return which cells reached the state 1.0 by the given step """
+        arrival_step = self.get_raster("arrival_step")
+        return (arrival_step >= 0) & (arrival_step <= step)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a summary of the output of a run")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    reader = OutputReader(args.path)
+    arrival_step = reader.get_raster("arrival_step")
+    series = reader.get_series()
+    print("Grid: {}".format("x".join(str(size) for size in reader.shape)))
+    print("Burned cells: {}".format(int(np.count_nonzero(arrival_step >= 0))))
+    if np.any(arrival_step >= 0):
+        print("Last arrival: step {}, day {}".format(int(arrival_step.max()), int(reader.get_raster("arrival_day").max())))
+    print("Recorded steps: {}".format(len(series["step"])))
+    if len(series["step"]) > 0:
+        print("Last metrics: precision {} | recall {} | F1-score {}".format(series["precision"][-1], series["recall"][-1], series["f1_score"][-1]))
@@ -0,0 +1,119 @@
+import atexit
+import json
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+manifest_name = "manifest.json"
+raster_names = ("arrival_step", "arrival_day", "peak_state")
+column_names = ("step", "precision", "recall", "f1_score")
+
+
+class OutputWriter:
+    """
+        Write the results of a run to a folder while it runs, keeping no history of the steps in memory:
+        - arrival_step.npy and arrival_day.npy: the step and the day in which each cell first reached the state 1.0
+          (-1 if it never did). The cells burned at the start have the step 0 and the starting day
+        - peak_state.npy: the highest state reached by each cell, e.g. the partial burns of OurRule
+        - series/<column>.bin: the metrics of each step recorded by Metrics, one raw little-endian file per column
+          (step, precision, recall, f1_score), with a metric for each member in an ensemble
+        - manifest.json: the shape of the grid, the calendar of the run and the type of each file (see OutputReader)
+
+        The rasters are memory-mapped files updated with the cells that changed state in each step, and the columns
+        are appended through a buffer, so the memory used doesn't grow with the number of steps. The files are
+        flushed at the end of each day, so the output of a run that stops early is readable up to its last day.
+        The rows of the rasters start from the top of the map. A run restored from a checkpoint gives the step of
+        the checkpoint to the cells burned after the start and before it
+    """
+
+    def __init__(self, path, height, width, members=None, dtype=np.float32, starting_day=0, steps_per_day=1,
+                 buffer_size=1 << 16):
+        self.path = path
+        self.shape = (members, height, width) if members is not None else (height, width)
+        self.starting_day = starting_day
+        self.steps_per_day = steps_per_day
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.column_types = {"step": np.dtype("<i8")}
+        self.column_types.update({name: np.dtype("<f8") for name in column_names[1:]})
+        self.column_shapes = {"step": ()}
+        self.column_shapes.update({name: (members,) if members is not None else () for name in column_names[1:]})
+
+        os.makedirs(os.path.join(path, "series"), exist_ok=True)
+        with open(os.path.join(path, manifest_name), "w") as file:
+            json.dump({
+                "shape": list(self.shape),
+                "starting_day": starting_day,
+                "steps_per_day": steps_per_day,
+                "rasters": {"arrival_step": "<i4", "arrival_day": "<i4", "peak_state": self.dtype.str},
+                "columns": {name: column_type.str for name, column_type in self.column_types.items()},
+                "column_shapes": {name: list(shape) for name, shape in self.column_shapes.items()},
+            }, file, indent=2)
+
+        self.rasters = {}
+        for name in raster_names:
+            dtype = self.dtype if name == "peak_state" else np.dtype("<i4")
+            self.rasters[name] = open_memmap(os.path.join(path, name + ".npy"), mode="w+", dtype=dtype, shape=self.shape)
+        self.rasters["arrival_step"][...] = -1
+        self.rasters["arrival_day"][...] = -1
+        self.flat = {name: raster.reshape(-1) for name, raster in self.rasters.items()}
+
+        self.columns = {name: open(os.path.join(path, "series", name + ".bin"), "wb", buffering=buffer_size) for name in column_names}
+
+        self.indices = []
+        self.states = []
+        atexit.register(self.close)
+
+    def add(self, index, state):
+        """ Add a changed cell to the current step """
+        self.indices.append(index)
+        self.states.append(state)
+
+    def add_cells(self, cells, states):
+        """ Add the cells at the given (row, col) indices, or (member, row, col) in an ensemble, to the current step """
+        self.indices.append(np.ravel_multi_index(cells, self.shape))
+        self.states.append(states)
+
+    def add_grid(self, states):
+        """ Add every cell whose state isn't 0 to the current step """
+        cells = np.nonzero(states)
+        self.add_cells(cells, states[cells])
+
+    def end_step(self, step):
+        """ Update the rasters with the cells changed in the given step, flushing the files at the end of the day """
+        if self.indices:
+            indices = np.concatenate([np.atleast_1d(index) for index in self.indices]).astype(np.intp)
+            states = np.concatenate([np.atleast_1d(state) for state in self.states]).astype(self.dtype)
+            self.indices = []
+            self.states = []
+
+            peak_state = self.flat["peak_state"]
+            peak_state[indices] = np.maximum(peak_state[indices], states)
+
+            arrived = indices[(states == 1.0) & (self.flat["arrival_step"][indices] < 0)]
+            self.flat["arrival_step"][arrived] = step
+            self.flat["arrival_day"][arrived] = self.starting_day + max(step - 1, 0) // self.steps_per_day
+
+        if step % self.steps_per_day == 0:
+            self.flush()
+
+    def add_metrics(self, step, precision, recall, f1_score):
+        """ Append the metrics of a step to the columns """
+        for name, value in zip(column_names, (step, precision, recall, f1_score)):
+            self.columns[name].write(np.broadcast_to(np.asarray(value, dtype=self.column_types[name]), self.column_shapes[name]).tobytes())
+
+    def flush(self):
+        for raster in self.rasters.values():
+            raster.flush()
+        for column in self.columns.values():
+            column.flush()
+
+    def close(self):
+        if self.columns is None:
+            return
+        self.flush()
+        for column in self.columns.values():
+            column.close()
+        self.columns = None
+        self.rasters = {}
+        self.flat = {}
+        atexit.unregister(self.close)
@@ -0,0 +1,60 @@
+import hashlib
+import json
+
+
+class Parameters:
+    """
+        The tuning constants of the model. Each model has its own parameters, so models with different
+        parameters (e.g. the trials of a calibration) can run in the same process
+    """
+
+    defaults = {
+        # The wind factor (see WindFactorCalculator)
+        "gust_prob": 0.1,  # The probability of a gust of wind
+        "c1": 0.25,
+        "c2": 0.5,
+
+        # The slope function slope_h2 (see SlopeFunctions)
+        "slope_delta": 45.0,
+        "slope_length_horizontal": 656.0,  # The distance between the centers of two horizontal neighbors
+        "slope_length_vertical": 812.0,  # The distance between the centers of two vertical neighbors
+        "slope_length_diagonal": 1044.0,  # The distance between the centers of two diagonal neighbors
+
+        # The rain factor (see RainFactorCalculator)
+        "rain_suppression_slope": 0.0242424242424,
+        "rain_suppression_offset": 0.0484848484848,
+        "rain_suppression_max": 0.8,
+        "rain_reduction_slope": 0.012,
+        "rain_reduction_max": 0.8,
+        "rain_drying": 0.5,  # The fraction of the rain deficit left after a day without rain
+        "rain_deficit_min": 0.01,  # A smaller rain deficit is set to 0
+
+        # The weight of the diagonal neighbors in BaseRule
+        "diagonal_weight": 0.83,
+    }
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.defaults)
+        if unknown:
+            raise RuntimeError("Parameters not found: {}".format(", ".join(sorted(unknown))))
+
+        for name, default in self.defaults.items():
+            setattr(self, name, float(values.get(name, default)))
+
+    @staticmethod
+    def get(parameters):
+        """ Return a Parameters object from None (the defaults), a dict of values or a Parameters object """
+        if isinstance(parameters, Parameters):
+            return parameters
+        return Parameters(**(parameters or {}))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.defaults}
+
+    def get_hash(self, names=None):
+        """ Return a short hash of the values of the given parameters (default: all of them) """
+        values = {name: getattr(self, name) for name in (names or self.defaults)}
+        return hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def __repr__(self):
+        return "Parameters({})".format(", ".join("{}={}".format(name, value) for name, value in self.to_dict().items()))
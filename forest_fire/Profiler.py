@@ -0,0 +1,174 @@
+import contextlib
+import cProfile
+import io
+import pstats
+import time
+
+
+class Timer:
+    """ Add the time spent in a block to a timer of the profiler """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """
+        Named timers and counters around the phases of a step, summed per step, per day and over the whole run.
+        The phases of a step and the parts of the vectorized rules are timed with timer(), which returns a shared
+        empty context when the profiler is disabled, so the timers cost almost nothing when they're not used.
+        The rules of the cell engine time their parts for every cell with start() and lap(), which read the clock
+        only while the profiler is enabled.
+
+        If interval is positive, the timers are printed every interval steps and at the end of each day, through
+        the "profile" messages of the model.
+        If steps is a (first, last) range, the steps in it are captured with cProfile (see get_stats)
+    """
+
+    null_timer = contextlib.nullcontext()
+
+    def __init__(self, model, enabled=False, interval=0, steps=None):
+        self.model = model
+        self.enabled = enabled or steps is not None
+        self.interval = interval
+        self.steps = steps
+
+        self.current = {}  # The [seconds, calls] of each timer in the current step
+        self.counters = {}  # The counters of the current step
+        self.history = []  # The timers and the counters of each step
+        self.days = []  # The timers and the counters of each day
+        self.day = ({}, {})
+        self.total = ({}, {})
+
+        self.capture = None  # The cProfile of the captured steps
+        self.stats = None
+
+    def timer(self, name):
+        """ Return a context that adds the time spent in it to the given timer """
+        if not self.enabled:
+            return self.null_timer
+        return Timer(self, name)
+
+    def start(self):
+        """ Return the current time to start a lap, or None if the profiler is disabled """
+        return time.perf_counter() if self.enabled else None
+
+    def lap(self, name, start):
+        """ Add the time since start to a timer and return the current time, to start the next lap """
+        now = time.perf_counter()
+        self.add(name, now - start)
+        return now
+
+    def add(self, name, seconds, calls=1):
+        """ Add the given seconds to a timer """
+        timer = self.current.get(name)
+        if timer is None:
+            self.current[name] = [seconds, calls]
+        else:
+            timer[0] += seconds
+            timer[1] += calls
+
+    def count(self, name, value=1):
+        """ Add the value to a counter """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def start_step(self):
+        """ Start the capture with cProfile, if the step is in the captured range """
+        if self.steps is not None and self.steps[0] <= self.model.schedule.steps < self.steps[1]:
+            if self.capture is None:
+                self.capture = cProfile.Profile()
+            self.capture.enable()
+
+    def end_step(self):
+        """ Save the timers and the counters of the step, and print them if the interval or the day ended """
+        if not self.enabled:
+            return
+
+        if self.capture is not None:
+            self.capture.disable()
+            if self.model.schedule.steps >= self.steps[1]:
+                self.stats = pstats.Stats(self.capture, stream=io.StringIO())
+                self.capture = None
+
+        step = self.model.schedule.steps
+        timers = {name: seconds for name, (seconds, _) in self.current.items()}
+        self.history.append({"step": step, "timers": timers, "counters": dict(self.counters)})
+        for timers, counters in (self.day, self.total):
+            self.merge(timers, counters)
+        self.current, self.counters = {}, {}
+
+        if self.interval > 0 and step % self.interval == 0:
+            records = self.history[-self.interval:]
+            self.model.log("profile", "{}", self.format("Steps {}-{}".format(records[0]["step"], step), *self.sum(records)))
+
+        if step % self.model.steps_per_day == 0:
+            day = self.model.starting_day + self.model.get_days_elapsed() - 1
+            self.days.append({"day": day, "timers": self.to_dict(self.day[0]), "counters": dict(self.day[1])})
+            if self.interval > 0:
+                self.model.log("profile", "{}", self.format("Day {}".format(day), self.to_dict(self.day[0]), self.day[1]))
+            self.day = ({}, {})
+
+    def merge(self, timers, counters):
+        """ Add the timers and the counters of the current step to the given ones """
+        for name, (seconds, calls) in self.current.items():
+            timer = timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += calls
+        for name, value in self.counters.items():
+            counters[name] = counters.get(name, 0) + value
+
+    @staticmethod
+    def sum(records):
+        """ Return the sums of the timers and of the counters of the given steps """
+        timers, counters = {}, {}
+        for record in records:
+            for name, seconds in record["timers"].items():
+                timers[name] = timers.get(name, 0.0) + seconds
+            for name, value in record["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+        return timers, counters
+
+    @staticmethod
+    def to_dict(timers):
+        return {name: seconds for name, (seconds, _) in timers.items()}
+
+    @staticmethod
+    def format(title, timers, counters):
+        """ Return the timers, from the slowest, and the counters as text """
+        lines = ["{}:".format(title)]
+        lines += ["  {:<20} {:10.4f}s".format(name, seconds) for name, seconds in sorted(timers.items(), key=lambda item: -item[1])]
+        lines += ["  {:<20} {:>11}".format(name, value) for name, value in sorted(counters.items())]
+        return "\n".join(lines)
+
+    def get_report(self):
+        """ Return the total seconds and calls of each timer, the counters and the timers of each day """
+        timers, counters = self.total
+        return {
+            "steps": len(self.history),
+            "timers": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in timers.items()},
+            "counters": dict(counters),
+            "days": self.days
+        }
+
+    def get_stats(self):
+        """ Return the pstats.Stats of the captured steps, once the range is over """
+        return self.stats
+
+    def save_stats(self, path):
+        """ Save the statistics of the captured steps, which can be read with pstats or snakeviz """
+        if self.stats is None:
+            raise RuntimeError("No steps have been captured")
+        self.stats.dump_stats(path)
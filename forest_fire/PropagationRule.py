@@ -1,12 +1,31 @@
 from abc import abstractmethod
+from .WindFactorCalculator import v_adj, v_diag, ang_adj, ang_diag
+
+# The offset (a, b) of each neighbor, the direction of the fire coming from it and whether it's a diagonal neighbor
+neighbor_directions = [(a, b, angle, False) for (a, b), angle in zip(v_adj.tolist(), ang_adj.tolist())] + \
+                      [(a, b, angle, True) for (a, b), angle in zip(v_diag.tolist(), ang_diag.tolist())]
 
 
 class PropagationRule:
     """ An abstract class for a propagation rule """
+
+    uses_rain = False  # Whether the rule reads the rain and updates the rain deficit of the cells
+    discrete = False  # Whether the states are only 0 and 1, so each cell ignites once (see ArrivalTimeSolver)
+
     def __init__(self, model):
         self.model = model
 
+    @staticmethod
+    def can_change(state, rate_of_spread):
+        """ Return whether the state of the cell can change. It works with single values and with arrays """
+        return (state < 1.0) & (rate_of_spread != 0.0)
+
     @abstractmethod
     def apply(self, cell):
         """ Return the next state of the cell """
         pass
+
+    @abstractmethod
+    def apply_grid(self, grid):
+        """ Return the next state of every cell of the grid """
+        pass
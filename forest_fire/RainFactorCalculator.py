@@ -1,4 +1,9 @@
+import numpy as np
+
+
 class RainFactorCalculator:
+    """ Compute the rain factors. The coefficients are read from the parameters of the model """
+
     @staticmethod
     def compute_rain_factor(cell, state):
         """
@@ -7,6 +12,7 @@ class RainFactorCalculator:
             - if it's raining and the cell is not burning (nor burned) then decrease temporarily the spread component (sc_deficit)
             - if it isn't raining and the cell is not burning then halves sc_deficit (soil is drying)
         """
+        parameters = cell.model.parameters
         if cell.rain > 0:
             if state > 0:
                 return state * RainFactorCalculator.rain_suppression(cell)
@@ -14,16 +20,42 @@ class RainFactorCalculator:
                 cell.rain_deficit = RainFactorCalculator.rain_sc_reduction(cell)
                 return state
         else:
-            update_deficit = cell.rain_deficit * 0.5
-            if update_deficit < 0.01:
+            update_deficit = cell.rain_deficit * parameters.rain_drying
+            if update_deficit < parameters.rain_deficit_min:
                 update_deficit = 0
             cell.rain_deficit = update_deficit
             return state
 
     @staticmethod
     def rain_suppression(cell):
-        return 1 - max(min(0.8, (0.0242424242424 * cell.rain) - 0.0484848484848), 0)
+        parameters = cell.model.parameters
+        return 1 - max(min(parameters.rain_suppression_max, (parameters.rain_suppression_slope * cell.rain) - parameters.rain_suppression_offset), 0)
 
     @staticmethod
     def rain_sc_reduction(cell):
-        return max(min(0.8, 0.012 * cell.rain), 0)
+        parameters = cell.model.parameters
+        return max(min(parameters.rain_reduction_max, parameters.rain_reduction_slope * cell.rain), 0)
+
+    @staticmethod
+    def compute_rain_factor_grid(grid, state, parameters):
+        """ Compute the rain component of every cell. Return the next states and the next sc_deficits """
+        rain = grid.get("rain")
+        rain_deficit = grid.get("rain_deficit")
+
+        raining = rain > 0
+        burning = state > 0
+
+        next_state = np.where(raining & burning, state * RainFactorCalculator.rain_suppression_grid(rain, parameters), state)
+
+        update_deficit = rain_deficit * parameters.rain_drying
+        update_deficit[update_deficit < parameters.rain_deficit_min] = 0
+        next_deficit = np.where(raining, np.where(burning, rain_deficit, RainFactorCalculator.rain_sc_reduction_grid(rain, parameters)), update_deficit)
+        return next_state, next_deficit
+
+    @staticmethod
+    def rain_suppression_grid(rain, parameters):
+        return 1 - np.maximum(np.minimum(parameters.rain_suppression_max, (parameters.rain_suppression_slope * rain) - parameters.rain_suppression_offset), 0)
+
+    @staticmethod
+    def rain_sc_reduction_grid(rain, parameters):
+        return np.maximum(np.minimum(parameters.rain_reduction_max, parameters.rain_reduction_slope * rain), 0)
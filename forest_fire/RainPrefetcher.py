@@ -0,0 +1,41 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class RainPrefetcher:
+    """
+        Read the rain of the next days in a background thread while the current day is simulated.
+        The decoded maps are kept in a bounded cache, so a day boundary only has to swap in the map
+    """
+
+    def __init__(self, bundle, lookahead=1, cache_size=None):
+        self.bundle = bundle
+        self.lookahead = lookahead  # The number of days read in advance
+        self.cache_size = cache_size if cache_size is not None else lookahead + 1
+        self.cache = OrderedDict()  # Map each day to the future of its decoded rain
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rain-prefetcher")
+
+    def get(self, day):
+        """ Return the rain of the given day and start reading the next days """
+        rain = self.request(day).result()
+        for next_day in range(day + 1, day + 1 + self.lookahead):
+            self.request(next_day)
+        return rain
+
+    def request(self, day):
+        """ Return the future of the rain of the given day, submitting it if needed """
+        if day in self.cache:
+            self.cache.move_to_end(day)
+        else:
+            self.cache[day] = self.executor.submit(self.read, day)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)[1].cancel()
+        return self.cache[day]
+
+    def read(self, day):
+        """ Copy the rain of the given day from the bundle into memory """
+        return np.array(self.bundle.get_rain(day))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
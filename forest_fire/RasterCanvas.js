@@ -0,0 +1,120 @@
+var RasterCanvas = function(canvas_width, canvas_height) {
+	// Create the element
+	// ------------------
+
+	var canvas_tag = `<canvas width="${canvas_width}" height="${canvas_height}" class="world-grid"/>`
+	var parent_div_tag = '<div style="height:' + canvas_height + 'px;" class="world-grid-parent"></div>'
+
+	var canvas = $(canvas_tag)[0];
+	var parent = $(parent_div_tag)[0];
+	$("#elements").append(parent);
+	parent.append(canvas);
+
+	var context = canvas.getContext("2d");
+	context.imageSmoothingEnabled = false;
+
+	// The raster is drawn at full resolution in an offscreen canvas, then scaled into the visible one
+	var raster = document.createElement("canvas");
+	var rasterContext = null;
+	var image = null;
+	var palette = [];
+	var view = null;  // The cells of the grid drawn in the raster
+	var scale = 1;  // The size of a pixel of the raster in the visible canvas
+
+	var decode = function(text) {
+		var binary = atob(text);
+		var bytes = new Uint8Array(binary.length);
+		for (var i = 0; i < binary.length; i++)
+			bytes[i] = binary.charCodeAt(i);
+		return bytes;
+	};
+
+	var setPixel = function(index, color) {
+		var rgb = palette[color];
+		var offset = index * 4;
+		image.data[offset] = rgb[0];
+		image.data[offset + 1] = rgb[1];
+		image.data[offset + 2] = rgb[2];
+		image.data[offset + 3] = 255;
+	};
+
+	// Clicking a point shows the full resolution window around it, the right click goes back to the overview
+	canvas.addEventListener("click", function(event) {
+		if (view === null)
+			return;
+		var bounds = canvas.getBoundingClientRect();
+		var col = Math.floor((event.clientX - bounds.left) / scale);
+		var row = Math.floor((event.clientY - bounds.top) / scale);
+		if (row >= raster.height || col >= raster.width)
+			return;
+		send({type: "window", row: view.row + row * view.factor + Math.floor(view.factor / 2),
+		      col: view.col + col * view.factor + Math.floor(view.factor / 2)});
+	});
+
+	canvas.addEventListener("contextmenu", function(event) {
+		event.preventDefault();
+		send({type: "window", row: null, col: null});
+	});
+
+	// The model runs on the server: Start and Stop resume and pause it, and Step runs a single step of the paused model
+	if (!controller.workerControls) {
+		controller.workerControls = true;
+		var start = controller.start, stop = controller.stop, reset = controller.reset;
+		controller.start = function() {
+			send({type: "resume"});
+			start.call(this);
+		};
+		controller.stop = function() {
+			send({type: "pause"});
+			stop.call(this);
+		};
+		controller.reset = function() {
+			reset.call(this);
+			if (this.running)
+				send({type: "resume"});
+		};
+		stepModelButton.onclick = function() {
+			if (!controller.running && !controller.finished)
+				send({type: "step"});
+		};
+	}
+
+	this.render = function(data) {
+		// The model runs on the server, so show its step instead of the number of frames received
+		if (data.step !== undefined)
+			stepDisplay.innerText = data.step;
+
+		if (data.type === "full") {
+			raster.width = data.width;
+			raster.height = data.height;
+			rasterContext = raster.getContext("2d");
+			image = rasterContext.createImageData(data.width, data.height);
+			palette = data.palette;
+			view = data.view;
+			scale = Math.min(canvas_width / data.width, canvas_height / data.height);
+			context.clearRect(0, 0, canvas_width, canvas_height);
+
+			var colors = decode(data.colors);
+			for (var i = 0; i < colors.length; i++)
+				setPixel(i, colors[i]);
+		} else if (image !== null) {
+			var indices = new Uint32Array(decode(data.indices).buffer);
+			var colors = decode(data.colors);
+			for (var i = 0; i < indices.length; i++)
+				setPixel(indices[i], colors[i]);
+		} else {
+			return;
+		}
+
+		// Keep the proportions of the grid
+		rasterContext.putImageData(image, 0, 0);
+		context.imageSmoothingEnabled = false;
+		context.drawImage(raster, 0, 0, raster.width * scale, raster.height * scale);
+	};
+
+	this.reset = function() {
+		image = null;
+		view = null;
+		context.clearRect(0, 0, canvas_width, canvas_height);
+	};
+};
@@ -0,0 +1,197 @@
+import base64
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+# The colors of the cells, indexed by the values of the raster
+palette = [
+    ("White", (255, 255, 255)),  # The default color
+    ("Green", (0, 128, 0)),  # The cells burned during the wildfire, but not in the simulation
+    ("Red", (255, 0, 0)),  # The partially burned cells
+    ("Black", (0, 0, 0)),  # The cells correctly burned
+    ("Purple", (128, 0, 128)),  # The cells that shouldn't have burned
+    ("Yellow", (255, 255, 0)),  # The center of the map
+]
+color_index = {name: index for index, (name, _) in enumerate(palette)}
+
+
+class Frame:
+    """
+        A snapshot of the layers drawn by the canvas, taken after a step. It can be drawn while the model goes on,
+        and the raster of each view is computed once and shared by all the canvases that draw the frame.
+        The frame of a model that simulates a window of the grid keeps only the states of the window, and the
+        views read the rest of their rows and columns from the scenario
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.step = model.schedule.steps
+        self.running = model.running
+        self.height = model.height
+        self.width = model.width
+        self.show_partial_burned_cells = model.show_partial_burned_cells
+        self.grid_state = None
+        self.bounds = None  # The bounds of the window of the model, if it simulates one
+        everything = slice(None)
+        if model.window is not None:
+            window = model.window
+            state = model.grid_state.get("state")
+            self.bounds = (window.top, window.left, window.bottom, window.right)
+            self.layers = {"state": (state[0] if state.ndim == 3 else state).copy()}
+        else:
+            self.layers = {
+                "state": RasterCanvas.get_window(model, "state", everything, everything).copy(),
+                "is_burned": RasterCanvas.get_window(model, "is_burned", everything, everything)  # It doesn't change
+            }
+        self.rasters = {}
+
+    def get_layer(self, name):
+        return self.layers[name]
+
+    def get_window(self, name, rows, cols):
+        """ Return the values of a layer in the given rows and columns """
+        if self.bounds is None:
+            return self.layers[name][rows, cols]
+        return self.model.window.get_window(name, rows, cols, self.layers.get(name), self.bounds)
+
+    def get_raster(self, view, pooling):
+        """ Return the raster of the given view, computing it the first time """
+        key = (view["row"], view["col"], view["height"], view["width"], view["factor"], pooling)
+        if key not in self.rasters:
+            self.rasters[key] = RasterCanvas.get_raster(self, view["row"], view["col"], view["height"], view["width"], view["factor"], pooling)
+        return self.rasters[key]
+
+
+class RasterCanvas(VisualizationElement):
+    """
+        Draw the grid as a raster of palette indices. The first frame of a view contains the whole raster,
+        while the next ones contain only the cells whose color changed.
+
+        A grid larger than the canvas is drawn as an overview: each block of factor x factor cells becomes one
+        pixel, pooling the state and the burned map of the block with the maximum ("max") or the average ("mean").
+        Clicking a point of the canvas shows the full resolution window of window_size cells around it, and the
+        right click goes back to the overview
+    """
+
+    local_includes = ["forest_fire/RasterCanvas.js"]
+
+    def __init__(self, canvas_width=750, canvas_height=750, pooling="max", window_size=None):
+        super().__init__()
+        if pooling not in ("max", "mean"):
+            raise RuntimeError("Pooling not found")
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.pooling = pooling
+        self.window_size = window_size or (canvas_width // 3, canvas_height // 3)
+
+        self.js_code = "elements.push(new RasterCanvas({}, {}));".format(canvas_width, canvas_height)
+
+        self.model = None  # The model drawn in the last frame
+        self.raster = None  # The raster sent in the last frame
+        self.window = None  # The (row, col) of the top left cell of the full resolution window, None in the overview
+        self.view = None  # The view of the last frame
+
+    def set_window(self, row=None, col=None):
+        """ Show the full resolution window centered at the given cell, or the overview if the cell isn't given """
+        self.window = None if row is None or col is None else (int(row), int(col))
+
+    def render(self, model):
+        """ Return the raster of the model, or the changes since the last frame if the model and the view are the same """
+        with model.profiler.timer("render"):
+            return self.render_frame(Frame(model))
+
+    def render_frame(self, frame):
+        """ Return the raster of a frame, or the changes since the last one if the model and the view are the same """
+        if frame.model is not self.model:
+            self.window = None
+        view = self.get_view(frame)
+        raster = frame.get_raster(view, self.pooling)
+
+        if frame.model is not self.model or view != self.view or self.raster is None:
+            self.model, self.view, self.raster = frame.model, view, raster
+            return {
+                "type": "full",
+                "step": frame.step,
+                "width": raster.shape[1],
+                "height": raster.shape[0],
+                "view": view,
+                "palette": [rgb for _, rgb in palette],
+                "colors": self.encode(raster)
+            }
+
+        indices = np.flatnonzero(raster != self.raster)
+        self.raster = raster
+        return {
+            "type": "delta",
+            "step": frame.step,
+            "indices": self.encode(indices.astype("<u4")),
+            "colors": self.encode(raster.reshape(-1)[indices])
+        }
+
+    def get_view(self, model):
+        """ Return the cells drawn in the next frame: the first row and column, the number of cells and the pooling factor """
+        if self.window is None:
+            factor = max(1, -(-model.height // self.canvas_height), -(-model.width // self.canvas_width))
+            return {"row": 0, "col": 0, "height": model.height, "width": model.width, "factor": factor,
+                    "grid_height": model.height, "grid_width": model.width}
+
+        width, height = min(self.window_size[0], model.width), min(self.window_size[1], model.height)
+        row = min(max(0, self.window[0] - height // 2), model.height - height)
+        col = min(max(0, self.window[1] - width // 2), model.width - width)
+        return {"row": row, "col": col, "height": height, "width": width, "factor": 1,
+                "grid_height": model.height, "grid_width": model.width}
+
+    @staticmethod
+    def get_window(model, name, rows, cols):
+        """ Return the values of a layer in the given rows and columns. In an ensemble, return the ones of the first member """
+        if isinstance(model, Frame):
+            return model.get_window(name, rows, cols)
+        if model.window is not None:
+            values = model.window.get_window(name, rows, cols)
+            return values[0] if values.ndim == 3 else values
+        if model.grid_state is not None:
+            values = model.grid_state.get(name)
+            if values.ndim == 3:
+                values = values[0]
+            return values[rows, cols]
+        values = model.get_layer(name)
+        return values[0, rows, cols] if values.ndim == 3 else values[rows, cols]
+
+    @staticmethod
+    def pool(values, factor, pooling):
+        """ Reduce each block of factor x factor cells to one value. The blocks at the edges can be smaller """
+        if factor == 1:
+            return values
+        height, width = values.shape
+        padded = np.pad(values.astype(np.float64), ((0, -height % factor), (0, -width % factor)), constant_values=np.nan)
+        blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+        return np.nanmax(blocks, axis=(1, 3)) if pooling == "max" else np.nanmean(blocks, axis=(1, 3))
+
+    @staticmethod
+    def get_raster(model, row=0, col=0, height=None, width=None, factor=1, pooling="max"):
+        """
+            Return the color of each cell of the given window as an array of palette indices, pooling the blocks
+            of factor x factor cells. The row 0 is the top of the map
+        """
+        height = model.height if height is None else height
+        width = model.width if width is None else width
+        rows, cols = slice(row, row + height), slice(col, col + width)
+        state = RasterCanvas.pool(RasterCanvas.get_window(model, "state", rows, cols), factor, pooling)
+        is_burned = RasterCanvas.pool(RasterCanvas.get_window(model, "is_burned", rows, cols) != 0, factor, pooling) >= 0.5
+
+        raster = np.full(state.shape, color_index["White"], dtype=np.uint8)
+        raster[is_burned] = color_index["Green"]
+        if model.show_partial_burned_cells:
+            raster[(0.0 < state) & (state < 1.0)] = color_index["Red"]
+        raster[state == 1.0] = color_index["Black"]
+        raster[(state == 1.0) & ~is_burned] = color_index["Purple"]
+
+        # Color the center of the map
+        center_row, center_col = model.height - 1 - model.height // 2, model.width // 2
+        if row <= center_row < row + height and col <= center_col < col + width:
+            raster[(center_row - row) // factor, (center_col - col) // factor] = color_index["Yellow"]
+        return raster
+
+    @staticmethod
+    def encode(array):
+        """ Encode the bytes of the array as a base64 string """
+        return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import numpy as np
+
+
+class ScenarioBundle:
+    """
+        A compiled copy of the csv files of a scenario. Each layer is saved as a .npy file in the cache folder of the
+        scenario, the rain of every day is stacked in a single (days, height, width) array and the layers are opened
+        with memory mapping. The bundle is compiled again when a csv file changes.
+        The messages are given to log(subsystem, message, *args), like the log of the model, and printed by default
+    """
+
+    version = 1
+
+    # Map the name of each layer to its csv file
+    sources = {
+        "elevation": "elevation.csv",
+        "spread_component": "spread_component.csv",
+        "burned_mask": "burned_mask.csv",
+        "wind": "wind.csv",
+    }
+
+    def __init__(self, scenario, log=None):
+        self.scenario = scenario
+        self.log = log or self.print_message
+        self.data_path = "data/{}".format(scenario)
+        self.path = "data/{}/.cache/bundle".format(scenario)
+
+        if not self.is_valid():
+            self.compile()
+
+        with open(os.path.join(self.path, "manifest.json"), "r") as file:
+            self.manifest = json.load(file)
+        self.rain_days = {day: index for index, day in enumerate(self.manifest["rain_days"])}
+        self.layers = {}
+
+    def get(self, name):
+        """ Return the layer with the given name, or None if the scenario doesn't have it """
+        if name not in self.layers:
+            path = os.path.join(self.path, name + ".npy")
+            self.layers[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        return self.layers[name]
+
+    def get_rain(self, day):
+        """ Return the rain of the given day """
+        if day not in self.rain_days:
+            raise FileNotFoundError("data/{}/rain/rain{}.csv".format(self.scenario, day))
+        return self.get("rain")[self.rain_days[day]]
+
+    def get_shape(self):
+        """ Return the (height, width) of the scenario, checking that every map of the scenario has the same shape """
+        height, width = self.get("elevation").shape
+        for name in ("spread_component", "burned_mask", "rain"):
+            layer = self.get(name)
+            if layer is not None and layer.shape[-2:] != (height, width):
+                raise RuntimeError("The map {} of the scenario {} is {}x{}, but the elevation map is {}x{}".format(
+                    name, self.scenario, layer.shape[-1], layer.shape[-2], width, height))
+
+        wind = self.get("wind")
+        if wind.ndim != 2 or wind.shape[1] != 3:
+            raise RuntimeError("The wind of the scenario {} must have 3 columns".format(self.scenario))
+        return height, width
+
+    def get_source_files(self):
+        """ Return the csv files the bundle is compiled from """
+        files = [os.path.join(self.data_path, filename) for filename in self.sources.values()]
+        files = [file for file in files if os.path.exists(file)]
+        rain_path = os.path.join(self.data_path, "rain")
+        if os.path.isdir(rain_path):
+            files += sorted(os.path.join(rain_path, filename) for filename in os.listdir(rain_path) if filename.endswith(".csv"))
+        return files
+
+    def is_valid(self):
+        """ Check if the bundle exists and it's compiled from the current csv files """
+        manifest_path = os.path.join(self.path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return False
+
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+        if manifest.get("version") != self.version:
+            return False
+
+        files = self.get_source_files()
+        if sorted(files) != sorted(manifest["sources"]):
+            return False
+
+        # Compare the hash only when the modification time changed
+        updated = False
+        for file in files:
+            source = manifest["sources"][file]
+            if os.path.getmtime(file) != source["mtime"]:
+                if self.hash(file) != source["hash"]:
+                    return False
+                source["mtime"] = os.path.getmtime(file)
+                updated = True
+
+        if updated:
+            self.write_manifest(self.path, manifest)
+        return True
+
+    def compile(self):
+        """ Convert the csv files of the scenario into .npy files """
+        self.log("data", "Compiling the scenario {}", self.scenario)
+        temporary_path = "{}.{}.tmp".format(self.path, os.getpid())
+        os.makedirs(temporary_path, exist_ok=True)
+
+        for name, filename in self.sources.items():
+            path = os.path.join(self.data_path, filename)
+            if os.path.exists(path):
+                np.save(os.path.join(temporary_path, name + ".npy"), self.read_csv(path))
+
+        rain_days = []
+        rain_path = os.path.join(self.data_path, "rain")
+        if os.path.isdir(rain_path):
+            for filename in os.listdir(rain_path):
+                match = re.fullmatch(r"rain(\d+)\.csv", filename)
+                if match:
+                    rain_days.append(int(match.group(1)))
+            rain_days.sort()
+
+            if rain_days:
+                first = self.read_csv(os.path.join(rain_path, "rain{}.csv".format(rain_days[0])))
+                rain = np.lib.format.open_memmap(os.path.join(temporary_path, "rain.npy"), mode="w+",
+                                                 dtype=first.dtype, shape=(len(rain_days),) + first.shape)
+                for index, day in enumerate(rain_days):
+                    values = self.read_csv(os.path.join(rain_path, "rain{}.csv".format(day)))
+                    if values.shape != first.shape:
+                        raise RuntimeError("The rain of the day {} of the scenario {} is {}x{}, but the rain of the day {} is {}x{}".format(
+                            day, self.scenario, values.shape[1], values.shape[0], rain_days[0], first.shape[1], first.shape[0]))
+                    rain[index] = values
+                rain.flush()
+                del rain
+
+        manifest = {
+            "version": self.version,
+            "rain_days": rain_days,
+            "sources": {file: {"mtime": os.path.getmtime(file), "hash": self.hash(file)} for file in self.get_source_files()}
+        }
+        self.write_manifest(temporary_path, manifest)
+
+        # Replace the old bundle with the new one
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+        try:
+            os.replace(temporary_path, self.path)
+        except OSError:  # Another process compiled the bundle in the meantime
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+    @staticmethod
+    def read_csv(path):
+        with open(path, "r") as file:
+            rows = [[float(i) for i in line.split(",")] for line in file if line.strip()]
+        if len({len(row) for row in rows}) > 1:
+            raise RuntimeError("The rows of {} have different lengths".format(path))
+        return np.array(rows)
+
+    @staticmethod
+    def hash(path):
+        with open(path, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()
+
+    @staticmethod
+    def print_message(subsystem, message, *args):
+        print(message.format(*args))
+
+    @staticmethod
+    def write_manifest(path, manifest):
+        temporary_path = os.path.join(path, "manifest.json.{}.tmp".format(os.getpid()))
+        with open(temporary_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(temporary_path, os.path.join(path, "manifest.json"))
+
+
+if __name__ == "__main__":
+    # Compile the given scenarios, or all of them: python -m forest_fire.ScenarioBundle [scenario ...]
+    for scenario in sys.argv[1:] or sorted(item for item in os.listdir("data") if os.path.isdir(os.path.join("data", item))):
+        ScenarioBundle(scenario)
@@ -0,0 +1,150 @@
+import atexit
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from .Parameters import Parameters
+from .ScenarioBundle import ScenarioBundle
+from .SlopeFactors import SlopeFactors
+from .SlopeFunctions import SlopeFunctions
+
+
+class ScenarioStore:
+    """
+        Keep the layers of the scenarios that don't change during the simulation (the rates of spread, the elevation,
+        the burned map and the height factors) in named shared memory, so the models of many processes use one copy
+        of them instead of loading their own.
+
+        The process that creates the store loads the scenarios with add() and removes them with release(): each
+        scenario is counted, and its memory is freed when it's released as many times as it's been added, or when
+        the process exits. The store can be passed to other processes, where the models built with scenario_store=store
+        attach to the shared layers without copying them. The shared arrays are read-only: the layers are used only by
+        the models with the arrays storage and the dtype of the store (the other ones load their own), while the height
+        factors are read by every model of the scenario
+    """
+
+    # Map the layers of GridState to the layers of the ScenarioBundle
+    layer_names = {"rate_of_spread": "spread_component", "height": "elevation", "is_burned": "burned_mask"}
+
+    attached = {}  # The shared memory blocks opened by this process
+    arrays = {}  # The read-only array of each block opened by this process
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.owner = os.getpid()  # The process that created the blocks, the only one that removes them
+        self.layouts = {}  # The (block name, shape) of each layer of each scenario
+        self.references = {}  # The number of times each scenario has been added and not released
+        self.blocks = {}  # The shared memory blocks created by the owner
+        atexit.register(self.close)
+
+    def __getstate__(self):
+        # The other processes receive only the names of the blocks
+        return {"dtype": self.dtype, "owner": self.owner, "layouts": self.layouts, "references": {}, "blocks": {}}
+
+    def add(self, scenario, phis=(SlopeFunctions.slope_h2,), parameters=None):
+        """
+            Load the static layers of a scenario into shared memory, along with the height factors computed with the
+            given slope functions and parameters. Adding a scenario again only counts it
+        """
+        if os.getpid() != self.owner:
+            raise RuntimeError("The scenarios can be added only by the process that created the store")
+        if scenario in self.references:
+            self.references[scenario] += 1
+            return
+
+        bundle = ScenarioBundle(scenario)
+        height, width = bundle.get_shape()
+        parameters = Parameters.get(parameters)
+        layout = {}
+
+        # The layers are stored with the border of GridState, so a model can use them as they are
+        for name, bundle_name in self.layer_names.items():
+            values = bundle.get(bundle_name)
+            if values is not None:
+                self.share(scenario, layout, name, (height + 2, width + 2))[1:-1, 1:-1] = values
+
+        for phi in phis:
+            heights = bundle.get("elevation").astype(self.dtype)
+            height_factors = SlopeFactors.load_scenario(scenario, (height, width), lambda: heights, phi, parameters, lambda *args: None)
+            self.share(scenario, layout, self.get_height_factors_name(phi, parameters), height_factors.shape)[...] = height_factors
+
+        self.layouts[scenario] = layout
+        self.references[scenario] = 1
+
+    def share(self, scenario, layout, name, shape):
+        """ Create a shared memory block for a layer and return the array backed by it """
+        block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * self.dtype.itemsize))
+        self.blocks.setdefault(scenario, []).append(block)
+        layout[name] = (block.name, tuple(shape))
+        array = np.ndarray(shape, dtype=self.dtype, buffer=block.buf)
+        array[...] = 0
+        return array
+
+    def release(self, scenario):
+        """ Count a release of the scenario, freeing its memory when it's no longer used """
+        if scenario not in self.references:
+            raise RuntimeError("Scenario not found in the store")
+        self.references[scenario] -= 1
+        if self.references[scenario] > 0:
+            return
+
+        del self.references[scenario]
+        layout = self.layouts.pop(scenario)
+        for block_name, _ in layout.values():
+            self.detach(block_name)
+        for block in self.blocks.pop(scenario, []):
+            block.close()
+            block.unlink()
+
+    def close(self):
+        """ Free the memory of every scenario. In the other processes, only the blocks opened by them are closed """
+        if os.getpid() != self.owner:
+            for layout in self.layouts.values():
+                for block_name, _ in layout.values():
+                    self.detach(block_name)
+            return
+        for scenario in list(self.references):
+            self.references[scenario] = 1
+            self.release(scenario)
+
+    def get_array(self, scenario, name):
+        """ Return the read-only array of a layer of the scenario, opening its block the first time """
+        layout = self.layouts.get(scenario)
+        if layout is None or name not in layout:
+            return None
+
+        block_name, shape = layout[name]
+        if block_name not in self.arrays:
+            if block_name not in self.attached:
+                self.attached[block_name] = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, dtype=self.dtype, buffer=self.attached[block_name].buf)
+            array.flags.writeable = False
+            self.arrays[block_name] = array
+        return self.arrays[block_name]
+
+    @staticmethod
+    def detach(block_name):
+        """ Close a block opened by this process. The arrays using it must not be used anymore """
+        ScenarioStore.arrays.pop(block_name, None)
+        block = ScenarioStore.attached.pop(block_name, None)
+        if block is not None:
+            try:
+                block.close()
+            except BufferError:  # A model still uses the layer, so the block stays open until the process exits
+                ScenarioStore.attached[block_name] = block
+
+    def can_share(self, model):
+        return model.storage == "arrays" and model.window is None and np.dtype(model.dtype) == self.dtype and model.wildfire_name in self.layouts
+
+    def get_layer(self, model, name):
+        """ Return the shared layer (with the border of GridState) of the scenario of the model, or None if it can't use it """
+        if not self.can_share(model):
+            return None
+        return self.get_array(model.wildfire_name, name)
+
+    def get_height_factors(self, model, phi):
+        """ Return the shared height factors of the scenario of the model, or None if the store doesn't have them """
+        return self.get_array(model.wildfire_name, self.get_height_factors_name(phi, model.parameters))
+
+    @staticmethod
+    def get_height_factors_name(phi, parameters):
+        return "height_factors-{}-{}".format(phi.__name__, parameters.get_hash([name for name in Parameters.defaults if name.startswith("slope_")]))
@@ -0,0 +1,223 @@
+import numpy as np
+from .GridState import GridState
+from .RainFactorCalculator import RainFactorCalculator
+from .SlopeFactors import SlopeFactors
+
+
+class SimulationWindow:
+    """
+        Simulate only a window of the grid around the fire. The GridState of the model holds the cells of the window,
+        with margin cells around the burning ones, and it grows when a burning cell reaches its edge: a cell outside
+        the window has no burning neighbor, so it keeps the state 0 and it can be added later. The layers of the new
+        cells are read from the memory-mapped maps of the scenario, only in the rows and the columns of the window,
+        and their rain deficit is computed again from the rain of the elapsed days, since it depends only on the rain
+        while the cell isn't burning.
+
+        The memory and the cost of a step follow the size of the fire instead of the size of the grid. The rules
+        compute the same states of the whole grid, but the gusts of wind are drawn only for the cells of the window,
+        so with the same seed the runs differ unless gust_prob is 0 or 1
+    """
+
+    static_layers = {"rate_of_spread": "spread_component", "height": "elevation", "is_burned": "burned_mask"}
+
+    def __init__(self, model, margin):
+        if margin < 1:
+            raise RuntimeError("The margin of the window must be at least 1 cell")
+        self.model = model
+        self.margin = margin
+        self.bundle = model.data_loader.bundle
+        self.top, self.left, self.bottom, self.right = 0, 0, 0, 0  # The bounds of the window, the bottom and the right excluded
+        self.rain = None  # The rain of the current day on the whole grid, as given to set_layer
+        self.phi = None  # The slope function of the height factors
+        self.burned_cells = None  # The number of cells burned in the real wildfire, counted the first time it's needed
+        self.resizes = 0
+        model.grid_state = GridState(0, 0, model.dtype)
+
+    @property
+    def shape(self):
+        return self.bottom - self.top, self.right - self.left
+
+    def include(self, top, left, bottom, right):
+        """ Grow the window to contain the given rows and columns (the bottom and the right excluded) with the margin around them """
+        model = self.model
+        top, left, bottom, right = top - self.margin, left - self.margin, bottom + self.margin, right + self.margin
+        if self.bottom > self.top and self.right > self.left:
+            top, left = min(top, self.top), min(left, self.left)
+            bottom, right = max(bottom, self.bottom), max(right, self.right)
+        top, left, bottom, right = max(0, top), max(0, left), min(model.height, bottom), min(model.width, right)
+        if (top, left, bottom, right) != (self.top, self.left, self.bottom, self.right):
+            self.resize(top, left, bottom, right)
+
+    def follow(self, cells, states):
+        """ Grow the window if any of the given cells (in the window) started burning on its edge """
+        rows, cols = cells[-2:]
+        burning = states > 0
+        rows, cols = rows[burning], cols[burning]
+        if rows.size == 0:
+            return
+        height, width = self.shape
+        on_edge = ((rows == 0) & (self.top > 0)) | ((rows == height - 1) & (self.bottom < self.model.height)) | \
+                  ((cols == 0) & (self.left > 0)) | ((cols == width - 1) & (self.right < self.model.width))
+        if on_edge.any():
+            self.include(self.top + int(rows.min()), self.left + int(cols.min()), self.top + int(rows.max()) + 1, self.left + int(cols.max()) + 1)
+
+    def resize(self, top, left, bottom, right):
+        """ Move the cells into a grid state with the given bounds, reading the layers of the new cells """
+        model = self.model
+        previous, previous_bounds = model.grid_state, (self.top, self.left, self.bottom, self.right)
+        self.top, self.left, self.bottom, self.right = top, left, bottom, right
+        rows, cols = slice(top, bottom), slice(left, right)
+        height, width = self.shape
+
+        grid_state = GridState(width, height, model.dtype)
+        if previous.members is not None:
+            grid_state = grid_state.to_ensemble(previous.members)
+        for name in self.static_layers:
+            grid_state.get(name)[...] = self.read(name, rows, cols)
+        if self.rain is not None:
+            grid_state.get("rain")[...] = self.rain[rows, cols]
+        grid_state.get("rain_deficit")[...], changed = self.replay_rain_deficit(rows, cols)
+        if self.phi is not None:
+            grid_state.height_factors = self.get_height_factors(rows, cols)
+
+        # Keep the cells of the previous window
+        old_top, old_left, old_bottom, old_right = previous_bounds
+        inner = (slice(old_top - top, old_bottom - top), slice(old_left - left, old_right - left))
+        for name in GridState.member_layer_names:
+            grid_state.get(name)[(...,) + inner] = previous.get(name)
+        changed[inner] = False
+        model.grid_state = grid_state
+
+        # The first step finds the front scanning the whole window
+        schedule = model.schedule
+        if getattr(schedule, "frontier", False) and schedule.steps > 0:
+            # The burning cells on the edge left the front, since their neighbors outside the window couldn't change
+            burning = np.flatnonzero(schedule.any_member(grid_state.get("state") > 0))
+            schedule.front = burning[schedule.can_change(schedule.get_neighborhood(burning, unique=False)).any(axis=1)]
+
+            # The new cells whose rain deficit changed in the last step must be updated, like the ones in the window
+            schedule.pending = np.union1d(self.move(schedule.pending, previous_bounds), np.flatnonzero(changed.reshape(-1) & schedule.can_change(np.arange(height * width))))
+
+        self.resizes += 1
+        model.log("model", "The window grew to rows {}-{} and columns {}-{} ({}x{} cells)", top, bottom - 1, left, right - 1, width, height)
+
+    def move(self, index, previous_bounds):
+        """ Convert the indices of the flattened previous window into the ones of the current window """
+        old_top, old_left, old_bottom, old_right = previous_bounds
+        rows, cols = np.divmod(index, max(1, old_right - old_left))
+        return (rows + old_top - self.top) * (self.right - self.left) + cols + old_left - self.left
+
+    def read(self, name, rows, cols):
+        """ Read the given rows and columns of a static layer from the maps of the scenario """
+        values = self.bundle.get(self.static_layers[name])
+        return 0.0 if values is None else np.asarray(values[rows, cols], dtype=self.model.dtype)
+
+    def replay_rain_deficit(self, rows, cols):
+        """
+            Compute the rain deficit of the given cells at the current step, applying the rain of each elapsed day.
+            The cells are never burning, so only the rain changes their deficit. Return the deficits and whether
+            they changed in the last step
+        """
+        model = self.model
+        shape = (len(range(model.height)[rows]), len(range(model.width)[cols]))
+        rain_deficit = np.zeros(shape, dtype=model.dtype)
+        changed = np.zeros(shape, dtype=bool)
+        if model.schedule.steps == 0 or not model.propagation_rule.uses_rain:
+            return rain_deficit, changed
+
+        parameters = model.parameters
+        inactive = self.read("rate_of_spread", rows, cols) == 0.0
+        for day in range(model.get_days_elapsed() + 1):
+            steps = min(model.steps_per_day, model.schedule.steps - day * model.steps_per_day)
+            if steps <= 0:
+                break
+            rain = np.asarray(self.bundle.get_rain(model.starting_day + day)[rows, cols], dtype=model.dtype)
+            changed[...] = False
+            if not rain.any() and not rain_deficit.any():
+                continue
+
+            # The rain is the same for the whole day, so the deficits stop changing once they're dry or soaked
+            for _ in range(steps):
+                update_deficit = rain_deficit * parameters.rain_drying
+                update_deficit[update_deficit < parameters.rain_deficit_min] = 0
+                next_deficit = np.where(rain > 0, RainFactorCalculator.rain_sc_reduction_grid(rain, parameters), update_deficit)
+                next_deficit = np.where(inactive, rain_deficit, next_deficit).astype(model.dtype)
+                changed = next_deficit != rain_deficit
+                if not changed.any():
+                    break
+                rain_deficit = next_deficit
+        return rain_deficit, changed
+
+    def get_height_factors(self, rows, cols):
+        """ Compute the height factors of the given cells, reading the elevation of their neighbors too """
+        model = self.model
+        top, bottom = max(0, rows.start - 1), min(model.height, rows.stop + 1)
+        left, right = max(0, cols.start - 1), min(model.width, cols.stop + 1)
+        heights = np.asarray(self.bundle.get("elevation")[top:bottom, left:right], dtype=np.float64)  # Like the cached factors of the whole grid
+        height_factors = SlopeFactors.compute(heights, self.phi, model.parameters)
+        return np.asarray(height_factors[:, rows.start - top:rows.stop - top, cols.start - left:cols.stop - left], dtype=model.dtype)
+
+    def update_height_factors(self, phi):
+        """ Compute the height factors of the window with the given slope function, and of the next windows """
+        self.phi = phi
+        self.model.grid_state.height_factors = self.get_height_factors(slice(self.top, self.bottom), slice(self.left, self.right))
+
+    def to_grid(self, cells):
+        """ Convert the (row, col) indices of cells of the window, or (member, row, col) in an ensemble, into the ones of the grid """
+        return tuple(cells[:-2]) + (cells[-2] + self.top, cells[-1] + self.left)
+
+    def get_layer(self, name):
+        """ Return a layer on the whole grid: the cells outside the window are read from the scenario """
+        return self.get_window(name, slice(None), slice(None))
+
+    def get_window(self, name, rows, cols, inside=None, bounds=None):
+        """
+            Return a layer in the given rows and columns of the grid (slices). The cells outside the window are read
+            from the scenario only in those rows and columns, and the static layers are read from the scenario as they
+            are. A frame can give the values and the bounds of the window it saved, instead of the current ones
+        """
+        model = self.model
+        rows, cols = range(model.height)[rows], range(model.width)[cols]
+        rows, cols = slice(rows.start, rows.stop), slice(cols.start, cols.stop)
+        shape = (rows.stop - rows.start, cols.stop - cols.start)
+        if name in self.static_layers:
+            values = np.zeros(shape, dtype=model.dtype)
+            values[...] = self.read(name, rows, cols)
+            return values
+
+        if inside is None:
+            inside, bounds = model.grid_state.get(name), (self.top, self.left, self.bottom, self.right)
+        values = np.zeros(inside.shape[:-2] + shape, dtype=model.dtype)
+        if name == "rain" and self.rain is not None:
+            values[...] = self.rain[rows, cols]
+        elif name == "rain_deficit":
+            values[...] = self.replay_rain_deficit(rows, cols)[0]
+
+        # Copy the cells of the window in the given rows and columns
+        top, left, bottom, right = bounds
+        first_row, last_row = max(top, rows.start), min(bottom, rows.stop)
+        first_col, last_col = max(left, cols.start), min(right, cols.stop)
+        if first_row < last_row and first_col < last_col:
+            values[..., first_row - rows.start:last_row - rows.start, first_col - cols.start:last_col - cols.start] = \
+                inside[..., first_row - top:last_row - top, first_col - left:last_col - left]
+        return values
+
+    def set_layer(self, name, values):
+        """ Set a layer from its values on the whole grid, keeping only the ones of the window """
+        if name == "rain":
+            self.rain = values
+        self.model.grid_state.get(name)[...] = np.asarray(values)[..., self.top:self.bottom, self.left:self.right]
+
+    def get_max(self, name, rows=1024):
+        """ Return the maximum of a static layer on the whole grid, reading a block of rows at a time """
+        values = self.bundle.get(self.static_layers[name])
+        return max(float(np.asarray(values[row:row + rows], dtype=self.model.dtype).max()) for row in range(0, values.shape[0], rows))
+
+    def count_burned_outside(self):
+        """ Return the number of cells burned in the real wildfire outside the window """
+        is_burned = self.bundle.get("burned_mask")
+        if is_burned is None:
+            return 0
+        if self.burned_cells is None:
+            self.burned_cells = sum(int(np.count_nonzero(is_burned[row:row + 1024])) for row in range(0, is_burned.shape[0], 1024))
+        return self.burned_cells - int(np.count_nonzero(self.model.grid_state.get("is_burned")))
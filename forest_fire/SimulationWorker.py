@@ -0,0 +1,102 @@
+import threading
+import time
+import traceback
+from .RasterCanvas import Frame
+
+
+class SimulationWorker:
+    """
+        Run the model in its own thread as fast as it can, publishing a Frame to the hub at most every
+        frame_interval seconds, along with the first and the last one. The viewers draw the frames without
+        touching the model, so they don't slow it down.
+
+        The worker starts paused: resume() runs the model until pause(), and step() runs a single step of a paused
+        model. The frame of the last step is published whenever the model pauses
+    """
+
+    def __init__(self, model, hub, frame_interval=0.05):
+        self.model = model
+        self.hub = hub
+        self.frame_interval = frame_interval
+        self.thread = None
+        self.condition = threading.Condition()  # Wakes the thread when the worker resumes, steps or stops
+        self.paused = True
+        self.steps_requested = 0  # The single steps requested while paused
+        self.stopping = False
+        self.error = None  # The exception that stopped the model, if any
+
+        self.hub.reset(Frame(model))
+
+    @property
+    def started(self):
+        return self.thread is not None
+
+    def start(self):
+        """ Start the thread of the model, if it's not running yet """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="SimulationWorker", daemon=True)
+            self.thread.start()
+
+    def resume(self):
+        """ Run the model until it's paused """
+        with self.condition:
+            self.paused = False
+            self.condition.notify()
+        self.start()
+
+    def pause(self):
+        """ Pause the model after the current step """
+        with self.condition:
+            self.paused = True
+            self.steps_requested = 0
+
+    def step(self):
+        """ Pause the model and run a single step. Return the step the model will reach """
+        with self.condition:
+            self.paused = True
+            self.steps_requested += 1
+            self.condition.notify()
+            target = self.model.schedule.steps + self.steps_requested
+        self.start()
+        return target
+
+    def stop(self):
+        """ Stop the model after the current step """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        model = self.model
+        last_frame = time.perf_counter()
+        published = True  # Whether the frame of the last step has been published
+        try:
+            while model.running:
+                with self.condition:
+                    if self.paused and self.steps_requested == 0 and not published:
+                        self.hub.publish(Frame(model))
+                        published = True
+                    while self.paused and self.steps_requested == 0 and not self.stopping:
+                        self.condition.wait()
+                    if self.stopping:
+                        break
+                    single = self.paused
+                    if single:
+                        self.steps_requested -= 1
+
+                model.step()
+                published = False
+                now = time.perf_counter()
+                if single or now - last_frame >= self.frame_interval:
+                    self.hub.publish(Frame(model))
+                    published = True
+                    last_frame = now
+        except Exception as error:
+            self.error = error
+            model.running = False
+            traceback.print_exc()
+
+        # Publish the last step
+        self.hub.publish(Frame(model))
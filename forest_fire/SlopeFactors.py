@@ -0,0 +1,101 @@
+import contextlib
+import hashlib
+import os
+import threading
+import numpy as np
+from .GridState import directions
+from .SlopeFunctions import SlopeFunctions
+from .Parameters import Parameters
+
+
+class SlopeFactors:
+    """
+        Compute the height factors of every cell towards its 8 neighbors as a (8, height, width) array, following
+        the order of GridState.directions. The factors of the default slope parameters are saved in the cache folder
+        of the scenario and they're computed again only when the elevation map changes. The factors of other slope
+        parameters, like the ones of the trials of a calibration, are computed in memory, so the cache doesn't grow
+    """
+
+    @staticmethod
+    def load(model, phi):
+        """ Return the height factors of the scenario of the model computed with the given slope function """
+        return SlopeFactors.load_scenario(model.wildfire_name, (model.height, model.width), lambda: model.get_layer("height"),
+                                          phi, model.parameters, model.log)
+
+    @staticmethod
+    def load_scenario(scenario, shape, get_heights, phi, parameters, log):
+        """ Return the height factors of a scenario, reading them from the cache or computing them from the heights returned by get_heights """
+        if not SlopeFactors.has_default_parameters(parameters):
+            log("data", "The height factors of the slope parameters {} are computed in memory", parameters.get_hash(SlopeFactors.get_parameter_names()))
+            return SlopeFactors.compute(get_heights(), phi, parameters)
+
+        elevation_path = "data/{}/elevation.csv".format(scenario)
+        cache_path = SlopeFactors.get_cache_path(scenario, phi, elevation_path, parameters)
+
+        # Another process can remove or replace the file while it's read, then the factors are computed again
+        try:
+            height_factors = np.load(cache_path)
+        except (FileNotFoundError, ValueError):
+            height_factors = None
+        if height_factors is not None and height_factors.shape == (len(directions),) + tuple(shape):
+            log("data", "The height factors have been loaded from {}", cache_path)
+            return height_factors
+
+        height_factors = SlopeFactors.compute(get_heights(), phi, parameters)
+        SlopeFactors.save(cache_path, height_factors)
+        log("data", "The height factors have been saved in {}", cache_path)
+        return height_factors
+
+    @staticmethod
+    def compute(heights, phi, parameters=None):
+        """ Compute the height factors of a map of heights. The factors towards out of bounds neighbors are 1 """
+        phi = SlopeFunctions.get_grid_function(phi)
+        height, width = heights.shape
+        padded = np.pad(heights.astype(np.float64), 1)
+        inside = np.pad(np.ones(heights.shape, dtype=bool), 1)
+
+        height_factors = np.ones((len(directions), height, width))
+        for k, (a, b) in enumerate(directions):
+            neighbor_heights = padded[1 - b:height + 1 - b, 1 + a:width + 1 + a]
+            neighbor_inside = inside[1 - b:height + 1 - b, 1 + a:width + 1 + a]
+            height_factors[k] = np.where(neighbor_inside, phi(heights - neighbor_heights, a, b, parameters), 1.0)
+        return height_factors
+
+    @staticmethod
+    def get_parameter_names():
+        return [name for name in Parameters.defaults if name.startswith("slope_")]
+
+    @staticmethod
+    def has_default_parameters(parameters):
+        """ Whether the slope parameters have their default values, the only ones whose factors are cached """
+        names = SlopeFactors.get_parameter_names()
+        return parameters.get_hash(names) == Parameters.get(None).get_hash(names)
+
+    @staticmethod
+    def get_cache_path(scenario, phi, elevation_path, parameters):
+        """ Return the path of the cached factors. It contains the hash of the elevation map and of the slope parameters """
+        with open(elevation_path, "rb") as file:
+            elevation_hash = hashlib.sha1(file.read()).hexdigest()[:16]
+        parameters_hash = parameters.get_hash(SlopeFactors.get_parameter_names())
+        return "data/{}/.cache/{}-{}-{}.npy".format(scenario, phi.__name__, elevation_hash, parameters_hash)
+
+    @staticmethod
+    def save(cache_path, height_factors):
+        """
+            Save the factors in the cache, removing the other factors of the slope function: the ones computed from an
+            old elevation map and the ones of other slope parameters, left by older versions
+        """
+        folder, filename = os.path.split(cache_path)
+        phi_name = filename.split("-")[0]
+        os.makedirs(folder, exist_ok=True)
+        for old_filename in os.listdir(folder):
+            old_parts = old_filename[:-len(".npy")].split("-") if old_filename.endswith(".npy") else []
+            if len(old_parts) == 3 and old_parts[0] == phi_name and old_filename != filename:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(folder, old_filename))
+
+        # Write a temporary file first, so a concurrent model never reads a partial file
+        temporary_path = "{}.{}-{}.tmp".format(cache_path, os.getpid(), threading.get_ident())
+        with open(temporary_path, "wb") as file:
+            np.save(file, height_factors)
+        os.replace(temporary_path, cache_path)
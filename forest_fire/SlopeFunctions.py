@@ -1,11 +1,16 @@
 import math
+import numpy as np
+from .Parameters import Parameters
 
 
 class SlopeFunctions:
-    """ This class contains some functions to calculate slope coefficients """
+    """
+        This class contains some functions to calculate slope coefficients. The constants of the functions are read
+        from the given parameters (the defaults if they're None)
+    """
 
     @staticmethod
-    def h(value, a, b):
+    def h(value, a, b, parameters=None):
         if value <= -50.0 or value >= 50.0:
             return 0.0
 
@@ -15,7 +20,7 @@ class SlopeFunctions:
         return -(value / 50.0) + 1.0
 
     @staticmethod
-    def h2(value, a, b):
+    def h2(value, a, b, parameters=None):
         value = -value
         if value <= -100.0 or value >= 100.0:
             return 0
@@ -27,7 +32,7 @@ class SlopeFunctions:
         return (-2 / 50) * (value - 2) + 2
 
     @staticmethod
-    def slope_h(value, a, b):
+    def slope_h(value, a, b, parameters=None):
         slope = math.atan(value / 496)
         if value <= 0:
             return -1 / (math.pi / 4) * slope + 1
@@ -37,17 +42,59 @@ class SlopeFunctions:
         return -2 / (1.39626 - math.pi / 4) * (slope - math.pi / 4) + 2
 
     @staticmethod
-    def slope_h2(value, a, b):
+    def slope_h2(value, a, b, parameters=None):
         """ This function it's defined in Alexandridis. It's used in OurModel """
+        parameters = parameters or Parameters()
         value = -value
-        delta = 45.0
+        delta = parameters.slope_delta
 
         if a != 0 and b == 0:  # horizontal
-            length = 656
+            length = parameters.slope_length_horizontal
         elif a == 0 and b != 0:  # vertical
-            length = 812
+            length = parameters.slope_length_vertical
         else:  # diagonal
-            length = 1044
+            length = parameters.slope_length_diagonal
 
         theta = math.atan(value / length)
         return math.exp(delta * theta)
+
+    # Vectorized versions of the slope functions: value is an array, (a, b) is the direction of the neighbors
+
+    @staticmethod
+    def h_grid(value, a, b, parameters=None):
+        result = np.where(value < 0.0, 2 - ((value / 20.71) + 1) ** 2, -(value / 50.0) + 1.0)
+        return np.where((value <= -50.0) | (value >= 50.0), 0.0, result)
+
+    @staticmethod
+    def h2_grid(value, a, b, parameters=None):
+        value = -value
+        result = np.where(value <= 50, (1 / 50) * value + 1, (-2 / 50) * (value - 2) + 2)
+        result = np.where(value <= 0.0, (1 / 100) * value + 1, result)
+        return np.where((value <= -100.0) | (value >= 100.0), 0.0, result)
+
+    @staticmethod
+    def slope_h_grid(value, a, b, parameters=None):
+        slope = np.arctan(value / 496)
+        result = np.where(slope <= math.pi / 4, 1 / (math.pi / 4) * slope + 1, -2 / (1.39626 - math.pi / 4) * (slope - math.pi / 4) + 2)
+        return np.where(value <= 0, -1 / (math.pi / 4) * slope + 1, result)
+
+    @staticmethod
+    def slope_h2_grid(value, a, b, parameters=None):
+        parameters = parameters or Parameters()
+        value = -value
+        delta = parameters.slope_delta
+
+        if a != 0 and b == 0:  # horizontal
+            length = parameters.slope_length_horizontal
+        elif a == 0 and b != 0:  # vertical
+            length = parameters.slope_length_vertical
+        else:  # diagonal
+            length = parameters.slope_length_diagonal
+
+        theta = np.arctan(value / length)
+        return np.exp(delta * theta)
+
+    @staticmethod
+    def get_grid_function(phi):
+        """ Return the vectorized version of the given slope function """
+        return getattr(SlopeFunctions, phi.__name__ + "_grid")
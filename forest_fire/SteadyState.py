@@ -0,0 +1,180 @@
+import numpy as np
+from mesa.time import SimultaneousActivation
+from .ArrivalActivation import ArrivalActivation
+from .CellActivation import CellActivation
+from .FixedDraws import FixedDraws
+from .FrontierActivation import FrontierActivation
+from .GridActivation import GridActivation
+from .GridSelection import GridSelection
+
+
+# The random numbers of the skipped steps are drawn in chunks of this size, so the cell engine never builds a huge integer
+draws_per_chunk = 1 << 16
+
+
+class SteadyState:
+    """
+        Detect when the simulation stops changing. It's checked after a step that didn't change the state of any cell:
+        - if no burning cell has a cell that can change around it, the fire is out and no cell will ever change
+          state again, so the model stops running
+        - if the rain deficits didn't change either and the cells around the fire keep their state both with and
+          without a gust of wind, nothing changes until the rain and the wind of the next day. In the "skip" mode
+          the model jumps to the start of the next day: the skipped steps are counted by the scheduler, they're
+          recorded in the trace, the output files and the metrics and the random number generators are advanced by
+          the numbers they would have drawn, so the result is the same of simulating them
+        The changes are counted by the scheduler while it steps the cells, and in the cell engine only the cells
+        around the fire are looked at, so a step that changed a cell costs nothing to the detector
+    """
+
+    modes = ("stop", "skip")
+
+    def __init__(self, model, mode):
+        if mode not in self.modes:
+            raise RuntimeError("Steady state mode not found")
+        self.model = model
+        self.mode = mode
+        self.skipped_steps = 0
+
+    def check(self):
+        """ Stop the model or skip the steps to the next day, if the cells can't change before it """
+        state_changed, rain_deficit_changed = self.get_changes()
+        if state_changed:
+            return
+
+        candidates = self.get_candidates()
+        if len(candidates) == 0:
+            self.model.running = False
+            self.model.log("model", "The fire is out at step {}", self.model.schedule.steps)
+            return
+
+        remaining = -self.model.schedule.steps % self.model.steps_per_day
+        if self.mode == "skip" and remaining > 0 and not rain_deficit_changed and self.is_stuck(candidates):
+            self.skip(remaining)
+
+    def get_changes(self):
+        """ Return whether the last step changed the state and the rain deficit of any cell """
+        changed = self.model.schedule.changed
+        return changed.get("state", 0) > 0, changed.get("rain_deficit", 0) > 0
+
+    def get_candidates(self):
+        """
+            Return the indices of the cells that can change with a burning cell around them (including the cell itself).
+            Any other cell has no burning neighbor and it didn't change in the last step, so it keeps its state.
+            The cell engine returns the cells themselves
+        """
+        schedule = self.model.schedule
+        if isinstance(schedule, CellActivation):
+            return self.get_candidate_cells()
+        if isinstance(schedule, GridActivation) and schedule.frontier:
+            candidates = schedule.get_neighborhood(schedule.front)
+            return candidates[schedule.can_change(candidates)]
+
+        model = self.model
+        grid_state = model.grid_state
+        state = grid_state.get("state") if grid_state is not None else model.get_layer("state")
+        rate_of_spread = grid_state.get("rate_of_spread") if grid_state is not None else model.get_layer("rate_of_spread")
+        members_axes = tuple(range(state.ndim - 2))
+        changeable = model.propagation_rule.can_change(state, rate_of_spread).any(axis=members_axes)
+
+        # Mark the cells with a burning cell in their 3x3 neighborhood
+        height, width = changeable.shape
+        burning = np.pad((state > 0).any(axis=members_axes), 1)
+        near_fire = np.zeros(changeable.shape, dtype=bool)
+        for a in (-1, 0, 1):
+            for b in (-1, 0, 1):
+                near_fire |= burning[1 - b:height + 1 - b, 1 + a:width + 1 + a]
+        return np.flatnonzero(changeable & near_fire)
+
+    def get_candidate_cells(self):
+        """ Return the cells of the cell engine that can change with a burning cell around them """
+        schedule = self.model.schedule
+        if isinstance(schedule, FrontierActivation):
+            positions = {cell.pos for pos in schedule.front for cell in schedule.iter_neighborhood(pos)}
+            return [schedule._agents[pos] for pos in sorted(positions) if schedule.can_change(schedule._agents[pos])]
+
+        rule = self.model.propagation_rule
+        return [cell for cell in schedule.agents if rule.can_change(cell.state, cell.rate_of_spread)
+                and (cell.state > 0 or any(neighbor.state > 0 for *_, neighbor in cell.get_neighbors()))]
+
+    def is_stuck(self, candidates):
+        """ Return whether the candidates keep their state and their rain deficit both with and without a gust of wind """
+        model = self.model
+        if isinstance(model.schedule, CellActivation):
+            return self.are_cells_stuck(candidates)
+
+        grid_state = model.grid_state
+        np_random = model.np_random
+        try:
+            for value in (0.0, 1.0):  # A draw of 0 is a gust of wind (if gust_prob > 0), a draw of 1 never is
+                model.np_random = FixedDraws(value)
+                selection = GridSelection(grid_state, candidates)
+                next_state = model.backend.apply_grid(model.propagation_rule, selection)
+                if not np.array_equal(next_state, selection.get("state")):
+                    return False
+                if "rain_deficit" in selection.staged and not np.array_equal(selection.staged["rain_deficit"], selection.get("rain_deficit")):
+                    return False
+        finally:
+            model.np_random = np_random
+        return True
+
+    def are_cells_stuck(self, cells):
+        """ Like is_stuck, applying the rule of the cell engine. The rain deficits changed by the rule are restored """
+        model = self.model
+        random = model.random
+        try:
+            for value in (0.0, 1.0):
+                model.random = FixedDraws(value)
+                for cell in cells:
+                    rain_deficit = cell.rain_deficit
+                    next_state = model.propagation_rule.apply(cell)
+                    stuck = next_state == cell.state and cell.rain_deficit == rain_deficit
+                    cell.rain_deficit = rain_deficit
+                    if not stuck:
+                        return False
+        finally:
+            model.random = random
+        return True
+
+    def skip(self, steps):
+        """ Advance the model by the given number of steps in which no cell changes """
+        model = self.model
+        schedule = model.schedule
+        draws = self.get_draws()
+
+        for _ in range(steps):
+            schedule.steps += 1
+            schedule.time += 1
+            model.end_step()
+
+        # Draw the numbers the skipped steps would have drawn
+        if isinstance(schedule, GridActivation):
+            model.np_random.bit_generator.advance(draws * steps)
+        else:
+            for start in range(0, draws * steps, draws_per_chunk):
+                model.random.getrandbits(64 * min(draws_per_chunk, draws * steps - start))  # random() takes 64 bits from the generator
+
+        self.skipped_steps += steps
+        model.profiler.count("steps.skipped", steps)
+        model.log("model", "No cell can change before the next day: skipped {} steps to step {}", steps, schedule.steps)
+
+        # Stop if the scenario has no data for the next day
+        day = model.starting_day + model.get_days_elapsed()
+        if day not in model.data_loader.bundle.rain_days or day >= len(model.wind):
+            model.running = False
+
+    def get_draws(self):
+        """ Return how many random numbers a step of the scheduler draws: one for each updated cell that can change """
+        model = self.model
+        schedule = model.schedule
+        if isinstance(schedule, ArrivalActivation):
+            return 0  # The delays of the ignitions are drawn when the neighbors of a cell change, not in every step
+        if isinstance(schedule, GridActivation):
+            if not schedule.frontier:
+                return int(np.prod(model.grid_state.shape))
+            return int(np.prod(model.grid_state.members_shape)) * len(schedule.get_candidates())
+        if isinstance(schedule, FrontierActivation):
+            return len(schedule.get_candidates())
+        if isinstance(schedule, SimultaneousActivation):
+            rule = model.propagation_rule
+            return sum(1 for cell in schedule.agents if rule.can_change(cell.state, cell.rate_of_spread))
+        raise RuntimeError("Scheduler not supported")
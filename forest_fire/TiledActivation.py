@@ -0,0 +1,193 @@
+import atexit
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from .GridActivation import GridActivation
+from .GridTile import GridTile
+from .Profiler import Profiler
+
+
+class WorkerModel:
+    """
+        The attributes of the model read by the vectorized rules in a worker. The gusts of wind are drawn by the main
+        process for the whole grid, so a worker returns its band of the drawn numbers instead of drawing them
+    """
+
+    def __init__(self, parameters, max_ros, draws):
+        self.parameters = parameters
+        self.max_ros = max_ros
+        self.wind_context = None
+        self.draws = draws
+        self.profiler = Profiler(None)  # The phases of the rules are timed by the main process only
+        self.np_random = self  # The rules draw the gusts with model.np_random.random(shape)
+
+    def random(self, shape):
+        return self.draws
+
+
+def attach(layout):
+    """ Return the shared memory blocks of the layout and the arrays backed by them """
+    blocks, arrays = {}, {}
+    for name, (block_name, shape, dtype) in layout.items():
+        blocks[name] = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+    return blocks, arrays
+
+
+def run_worker(connection, layout, layer_names, rows, width, members_shape, rule, parameters, max_ros):
+    """ Attach the shared memory, then update a band of rows of the grid until the main process stops the worker """
+    blocks, arrays = attach(layout)
+    try:
+        serve(connection, arrays, layer_names, rows, width, members_shape, rule, parameters, max_ros)
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+
+
+def serve(connection, arrays, layer_names, rows, width, members_shape, rule, parameters, max_ros):
+    """
+        Update a band of rows of the grid. Each step has two phases, so every worker reads the current states
+        before any of them is changed:
+        - "step": compute the next values of the band and write them in the next layers
+        - "commit": copy the next values into the layers and return the changed cells
+    """
+    layers = {name: arrays[name] for name in layer_names}
+    tile = GridTile(layers, arrays["height_factors"], rows, width, members_shape)
+    start, stop = rows
+
+    rule = copy.copy(rule)
+    rule.model = WorkerModel(parameters, max_ros, arrays["draws"][..., start:stop, :])
+
+    while True:
+        command, argument = connection.recv()
+        if command == "step":
+            rule.model.wind_context = argument
+            tile.stage("state", rule.apply_grid(tile))
+            for name, values in tile.staged.items():
+                arrays["next_" + name][..., start:stop, :] = values
+            connection.send(list(tile.staged))
+            tile.staged = {}
+        elif command == "commit":
+            changes = {}
+            for name in argument:
+                current = tile.get(name)
+                values = arrays["next_" + name][..., start:stop, :]
+                cells = np.nonzero(current != values)
+                changes[name] = (cells[:-2] + (cells[-2] + start, cells[-1]), current[cells])
+                current[...] = values
+            connection.send(changes)
+        else:
+            return
+
+
+class TiledActivation(GridActivation):
+    """
+        A scheduler that splits the grid into bands of rows, each one updated by a worker process. The layers of
+        the grid state are moved into shared memory, so a worker reads the rows around its band (the halo) directly
+        from the arrays of its neighbors. The workers write the next values into separate arrays and apply them only
+        after every worker computed them, so the result is the same of GridActivation
+    """
+
+    def __init__(self, model, tiles):
+        super().__init__(model, frontier=False)
+        self.tiles = tiles
+        self.blocks = []  # The shared memory blocks
+        self.workers = []
+        self.connections = []
+        self.draws = None  # The random numbers used to draw the gusts of wind in the current step
+
+    def step(self):
+        """ Compute the next state of every cell in the workers, then advance them """
+        if not self.workers:
+            self.start_workers()
+
+        grid_state = self.model.grid_state
+        profiler = self.model.profiler
+
+        with profiler.timer("rule.apply"):
+            self.draws[...] = self.model.np_random.random(grid_state.shape)
+            for connection in self.connections:
+                connection.send(("step", self.model.wind_context))
+            names = [connection.recv() for connection in self.connections][0]
+
+        with profiler.timer("advance"):
+            for connection in self.connections:
+                connection.send(("commit", names))
+            changes = self.merge_changes([connection.recv() for connection in self.connections])
+
+            self.model.metrics.update_cells(*changes["state"])
+            if self.model.recorders:
+                cells = changes["state"][0]
+                for recorder in self.model.recorders:
+                    recorder.add_cells(cells, grid_state.get("state")[cells])
+            self.update_agents(changes)
+        profiler.count("cells.updated", self.model.width * self.model.height)
+        profiler.count("cells.changed", len(changes["state"][1]))
+        self.changed = {name: len(values) for name, (_, values) in changes.items()}
+        self.steps += 1
+        self.time += 1
+
+    def start_workers(self):
+        """ Move the layers into shared memory and start a worker for each band of rows """
+        grid_state = self.model.grid_state
+        layout = {}
+
+        def share(name, array):
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            self.blocks.append(block)
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            layout[name] = (block.name, array.shape, array.dtype)
+            return shared
+
+        for name, layer in list(grid_state.layers.items()):
+            grid_state.layers[name] = share(name, layer)
+        grid_state.height_factors = share("height_factors", grid_state.height_factors)
+        for name in grid_state.member_layer_names:
+            share("next_" + name, grid_state.get(name))
+        self.draws = share("draws", np.zeros(grid_state.shape))
+
+        rule = copy.copy(self.model.propagation_rule)
+        rule.model = None
+        bounds = np.linspace(0, self.model.height, min(self.tiles, self.model.height) + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=run_worker, daemon=True,
+                                             args=(worker_connection, layout, list(grid_state.layers), (int(start), int(stop)),
+                                                   self.model.width, grid_state.members_shape, rule,
+                                                   self.model.parameters, self.model.max_ros))
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(connection)
+
+        self.model.log("model", "The grid has been split into {} bands of rows", len(self.workers))
+        atexit.register(self.close)
+
+    @staticmethod
+    def merge_changes(results):
+        """ Join the changed cells of the bands, in the order of the rows """
+        changes = {}
+        for name in results[0]:
+            cells = tuple(np.concatenate(axis) for axis in zip(*(result[name][0] for result in results)))
+            changes[name] = (cells, np.concatenate([result[name][1] for result in results]))
+        return changes
+
+    def close(self):
+        """ Stop the workers and release the shared memory. The layers of the grid state are copied back """
+        for connection in self.connections:
+            connection.send(("close", None))
+        for worker in self.workers:
+            worker.join()
+        self.workers, self.connections = [], []
+
+        grid_state = self.model.grid_state
+        if self.blocks:
+            grid_state.layers = {name: layer.copy() for name, layer in grid_state.layers.items()}
+            grid_state.height_factors = grid_state.height_factors.copy()
+            self.draws = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
@@ -0,0 +1,85 @@
+import argparse
+import struct
+import numpy as np
+from .TraceRecorder import magic, header_format, record_format
+
+
+class TraceReader:
+    """ Rebuild the state of the grid at any step from a trace written by TraceRecorder """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(magic)) != magic:
+                raise RuntimeError("{} is not a trace".format(path))
+            height, width, members, itemsize = struct.unpack(header_format, file.read(struct.calcsize(header_format)))
+            self.shape = (members, height, width) if members else (height, width)
+            self.dtype = np.dtype("<f{}".format(itemsize))
+
+            # Find the position of each record, skipping the cells
+            self.records = []  # (step, offset of the cells, number of cells)
+            record_size = struct.calcsize(record_format)
+            while True:
+                data = file.read(record_size)
+                if len(data) < record_size:
+                    break
+                step, count = struct.unpack(record_format, data)
+                self.records.append((step, file.tell(), count))
+                file.seek(count * (4 + itemsize), 1)
+
+    def get_steps(self):
+        """ Return the steps recorded in the trace. A new run appended to the trace starts again from step 0 """
+        return [step for step, _, _ in self.records]
+
+    def get_runs(self):
+        """ Return the records of each run appended to the trace. A new run starts again from step 0 """
+        runs = []
+        for record in self.records:
+            if record[0] == 0 or not runs:
+                runs.append([])
+            runs[-1].append(record)
+        return runs
+
+    def read_record(self, file, offset, count, state):
+        """ Apply the changes of a record to the state """
+        file.seek(offset)
+        indices = np.frombuffer(file.read(count * 4), dtype="<u4")
+        states = np.frombuffer(file.read(count * self.dtype.itemsize), dtype=self.dtype)
+        state.reshape(-1)[indices] = states
+
+    def iter_states(self):
+        """ Iterate the recorded steps along with the state of the grid after each of them """
+        state = np.zeros(self.shape, dtype=self.dtype)
+        with open(self.path, "rb") as file:
+            for step, offset, count in self.records:
+                if step == 0:  # A new run starts
+                    state[...] = 0
+                self.read_record(file, offset, count, state)
+                yield step, state
+
+    def get_state(self, step, run=-1):
+        """
+            Return the state of the grid after the given step of the given run (the last one by default). Only the
+            records of the run up to the step are read
+        """
+        runs = self.get_runs()
+        if not -len(runs) <= run < len(runs) or runs[run][0][0] > step:
+            raise RuntimeError("The step {} isn't in the trace".format(step))
+
+        state = np.zeros(self.shape, dtype=self.dtype)
+        with open(self.path, "rb") as file:
+            for current_step, offset, count in runs[run]:
+                if current_step > step:
+                    break
+                self.read_record(file, offset, count, state)
+        return state
+
+
+if __name__ == "__main__":
+    # Rebuild the state at a step: python -m forest_fire.TraceReader trace.bin 100 state.npy
+    parser = argparse.ArgumentParser(description="Rebuild the state of the grid from a trace")
+    parser.add_argument("trace")
+    parser.add_argument("step", type=int)
+    parser.add_argument("output", help="the .npy file where the state is saved")
+    args = parser.parse_args()
+    np.save(args.output, TraceReader(args.trace).get_state(args.step))
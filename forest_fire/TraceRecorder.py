@@ -0,0 +1,65 @@
+import atexit
+import os
+import struct
+import numpy as np
+
+magic = b"FFTRACE1"
+header_format = "<IIII"  # height, width, members (0 for a single realization), size of a state in bytes
+record_format = "<II"  # step, number of changed cells
+
+
+class TraceRecorder:
+    """
+        Record the changes of state of the cells in a compact binary file. After a header, the file contains a record
+        for each step with the indices of the changed cells in the flattened grid (uint32) followed by their new states.
+        The first record contains the initial state of the cells. The file is written through a buffer and new runs
+        with the same grid can be appended to it
+    """
+
+    def __init__(self, path, height, width, members=None, dtype=np.float32, buffer_size=1 << 20):
+        self.shape = (members, height, width) if members is not None else (height, width)
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        header = magic + struct.pack(header_format, height, width, members or 0, self.dtype.itemsize)
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as file:
+                if file.read(len(header)) != header:
+                    raise RuntimeError("The trace {} was recorded with a different grid".format(path))
+            self.file = open(path, "ab", buffering=buffer_size)
+        else:
+            self.file = open(path, "wb", buffering=buffer_size)
+            self.file.write(header)
+
+        self.indices = []
+        self.states = []
+        atexit.register(self.close)
+
+    def add(self, index, state):
+        """ Add a changed cell to the current step """
+        self.indices.append(index)
+        self.states.append(state)
+
+    def add_cells(self, cells, states):
+        """ Add the cells at the given (row, col) indices, or (member, row, col) in an ensemble, to the current step """
+        self.indices.append(np.ravel_multi_index(cells, self.shape))
+        self.states.append(states)
+
+    def add_grid(self, states):
+        """ Add every cell whose state isn't 0 to the current step """
+        cells = np.nonzero(states)
+        self.add_cells(cells, states[cells])
+
+    def end_step(self, step):
+        """ Write the record of the given step """
+        indices = np.concatenate([np.atleast_1d(index) for index in self.indices]) if self.indices else np.empty(0)
+        states = np.concatenate([np.atleast_1d(state) for state in self.states]) if self.states else np.empty(0)
+        self.file.write(struct.pack(record_format, step, len(indices)))
+        self.file.write(indices.astype("<u4").tobytes())
+        self.file.write(states.astype(self.dtype).tobytes())
+        self.indices = []
+        self.states = []
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        atexit.unregister(self.close)
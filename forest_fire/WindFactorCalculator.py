@@ -1,5 +1,4 @@
 import math
-import random
 import numpy as np
 
 # Define some support vectors to iterate the neighbors
@@ -10,53 +9,111 @@ v_diag = np.array([(-1, 1), (1, 1), (1, -1), (-1, -1)])
 ang_adj = np.array([180, 270, 0, 90])
 ang_diag = np.array([135, 225, 315, 45])
 
+# The directions of the 8 neighbors, in the order of the tables of WindContext: the angle of index k is 45 * k
+neighbor_angles = np.arange(0, 360, 45)
+
+
+class WindContext:
+    """
+        The wind of a day. The speed and the direction of the wind are the same in every cell for the whole day,
+        so the terms of the wind factor that don't depend on the fire direction are computed once per day,
+        both with and without a gust of wind.
+
+        The fire of most cells comes from the direction of one of the 8 neighbors: the ones with a single burning
+        neighbor, or with burning neighbors whose mean direction is a neighbor again. Their wind factors are read
+        from the tables of the day, indexed by the angle / 45. Only the cells with burning neighbors in directions
+        that average between two neighbors compute the cosine and the exponential
+    """
+
+    def __init__(self, day, wind, parameters):
+        gust_speed, mean_speed, wind_angle = wind
+        self.day = day
+        self.wind = tuple(wind)
+        self.parameters = parameters
+
+        self.wind_angle = math.radians(wind_angle)
+        self.gust_speed = gust_speed / 3.6
+        self.mean_speed = mean_speed / 3.6
+
+        # The wind factor is scale * exp(exponent * (cos(wind angle - fire angle) - 1))
+        self.gust_scale = math.exp(parameters.c1 * self.gust_speed)
+        self.mean_scale = math.exp(parameters.c1 * self.mean_speed)
+        self.gust_exponent = self.gust_speed * parameters.c2
+        self.mean_exponent = self.mean_speed * parameters.c2
+
+        # The factors of the cell engine are computed with math, the ones of the grid with numpy, like for any other angle
+        self.gust_factors = {float(angle): self.get_factor(True, angle) for angle in neighbor_angles}
+        self.mean_factors = {float(angle): self.get_factor(False, angle) for angle in neighbor_angles}
+        self.gust_factors_grid = self.get_factors_grid(np.array(True), neighbor_angles)
+        self.mean_factors_grid = self.get_factors_grid(np.array(False), neighbor_angles)
+
+    def get_factor(self, gust, fire_angle):
+        """ Compute the wind factor of a fire direction in degrees """
+        if gust:
+            return self.gust_scale * math.exp(self.gust_exponent * (math.cos(self.wind_angle - math.radians(fire_angle)) - 1))
+        return self.mean_scale * math.exp(self.mean_exponent * (math.cos(self.wind_angle - math.radians(fire_angle)) - 1))
+
+    def get_factors_grid(self, gusts, fire_angle):
+        """ Compute the wind factors of arrays of gusts and fire directions in degrees """
+        scale = np.where(gusts, self.gust_scale, self.mean_scale)
+        exponent = np.where(gusts, self.gust_exponent, self.mean_exponent)
+        return scale * np.exp(exponent * (np.cos(self.wind_angle - np.radians(fire_angle)) - 1))
+
 
 class WindFactorCalculator:
+    """ Compute the wind factors. The constants gust_prob, c1 and c2 are read from the parameters of the model """
+
     @staticmethod
-    def compute_wind_factor(model, cell):
-        """ Compute the wind factors """
-        gust_prob = 0.1  # The probability of a gust of wind
-        c1 = 0.25
-        c2 = 0.5
-
-        days_elapsed = model.get_days_elapsed()
-        if random.random() < gust_prob:
-            wind_speed = model.wind[model.starting_day + days_elapsed][0] / 3.6  # there is a gust of wind
-        else:
-            wind_speed = model.wind[model.starting_day + days_elapsed][1] / 3.6
-
-        fire_angle = WindFactorCalculator.get_fire_direction(model, cell)
+    def get_context(model):
+        """ Return the wind context of the current day, reusing the one of the model if it's still valid """
+        day = model.starting_day + model.get_days_elapsed()
+        context = model.wind_context
+        if context is None or context.day != day or context.parameters is not model.parameters or context.wind != tuple(model.wind[day]):
+            context = WindContext(day, model.wind[day], model.parameters)
+        return context
+
+    @staticmethod
+    def compute_wind_factor(model, fire_angle):
+        """ Compute the wind factor of a cell, given its fire direction (-1 if no neighbor is burning) """
+        context = model.wind_context
+        gust = model.random.random() < model.parameters.gust_prob  # there is a gust of wind
+
         if fire_angle == -1:
             return 0
-        wind_angle = model.wind[model.starting_day + days_elapsed][2]
-        angle_difference = abs(wind_angle - fire_angle) % 360
-        if angle_difference > 180:
-            angle_difference = 360 - angle_difference
-
-        ft = math.exp(wind_speed * c2 * (math.cos(math.radians(angle_difference)) - 1))
-        return math.exp(c1 * wind_speed) * ft
+        wind_factor = (context.gust_factors if gust else context.mean_factors).get(fire_angle)
+        if wind_factor is None:  # The fire comes from between two neighbors
+            wind_factor = context.get_factor(gust, fire_angle)
+        return wind_factor
 
     @staticmethod
-    def get_fire_direction(model, cell):
-        sum_ang = 0
-        sum_states = 0
-
-        for index, (a, b) in enumerate(v_adj):
-            x, y = cell.pos + np.array((a, b))
-            if not model.grid.out_of_bounds((x, y)):
-                neighbor = model.get_cell(x, y)
-                ang = ang_adj[index]
-                sum_ang += ang * neighbor.state
-                sum_states += neighbor.state
-
-        for index, (a, b) in enumerate(v_diag):
-            x, y = cell.pos + np.array((a, b))
-            if not model.grid.out_of_bounds((x, y)):
-                neighbor = model.get_cell(x, y)
-                ang = ang_diag[index]
-                sum_ang += ang * neighbor.state
-                sum_states += neighbor.state
+    def compute_wind_factor_grid(model, grid, fire_angle, sum_states):
+        """ Compute the wind factors of every cell of the grid, given the fire direction and the sum of the states of the neighbors """
+        context = model.wind_context
+        gusts = model.np_random.random(grid.shape) < model.parameters.gust_prob  # there is a gust of wind
+
+        # Only the cells with a burning neighbor have a wind factor
+        wind_factor = np.zeros(np.shape(sum_states))
+        near_fire = np.nonzero(sum_states != 0)
+        angles, near_fire_gusts = fire_angle[near_fire], gusts[near_fire]
 
+        # Read the factors of the directions of the neighbors from the tables, then compute the factors of the cells
+        # whose fire comes from between two neighbors
+        index = np.clip(np.rint(angles / 45), 0, len(neighbor_angles) - 1).astype(np.intp)
+        factors = np.where(near_fire_gusts, context.gust_factors_grid[index], context.mean_factors_grid[index])
+        between = np.flatnonzero(neighbor_angles[index] != angles)
+        factors[between] = context.get_factors_grid(near_fire_gusts[between], angles[between])
+
+        wind_factor[near_fire] = factors
+        return wind_factor
+
+    @staticmethod
+    def get_fire_direction(sum_ang, sum_states):
+        """ Return the fire direction of a cell from the sums of the angles and of the states of its neighbors """
         if sum_states == 0:
             return -1
         return sum_ang / sum_states
+
+    @staticmethod
+    def get_fire_direction_grid(sum_ang, sum_states):
+        """ Return the fire direction of every cell from the sums of the angles and of the states of its neighbors """
+        return np.divide(sum_ang, sum_states, out=np.full(np.shape(sum_states), -1.0), where=sum_states != 0)
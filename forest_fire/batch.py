@@ -0,0 +1,150 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from .ForestFire import ForestFire
+from .ScenarioBundle import ScenarioBundle
+from .ScenarioStore import ScenarioStore
+
+rules = ["BaseRule", "ExtendedRule", "OurRule"]
+
+
+def get_scenarios():
+    """ Return the names of the scenarios in the data folder """
+    return sorted(item for item in os.listdir("./data") if os.path.isdir(os.path.join("./data", item)))
+
+
+def build_model(scenario, rule, seed, **options):
+    """ Build a model without the visualization. The size of the grid is taken from the scenario """
+    return ForestFire(None, None, rule, scenario, False, seed=seed, verbose=False, **options)
+
+
+def get_record(model, steps=None):
+    """
+        Return the metrics of the model at the current step, along with the day of the last simulated step.
+        A previous step count can be given if the cells didn't change since it (see SteadyState)
+    """
+    steps = model.schedule.steps if steps is None else steps
+    precision, recall, f1_score = model.get_metrics()
+    return {
+        "steps": steps,
+        "day": model.starting_day + (steps - 1) // model.steps_per_day,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1_score
+    }
+
+
+def save_ensemble(model, result, output):
+    """ Save the burn probability of the ensemble next to the results file and return the ensemble metrics """
+    path = "{}.{}.{}.{}.{}.npy".format(os.path.splitext(output)[0], result["scenario"], result["rule"], result["seed"], result["steps"])
+    np.save(path, model.get_burn_probability())
+    metrics = model.get_ensemble_metrics()
+    metrics["burn_probability"] = path
+    return metrics
+
+
+def run(job):
+    """ Run a simulation and return a result for each of the requested step counts """
+    scenario, rule, seed, steps, options, output = job
+    results = []
+    per_day = []
+
+    # Write the arrivals and the metrics of each step of the run in its own folder
+    options = dict(options)
+    export = options.pop("export", None)
+    if export is not None:
+        options["output"] = os.path.join(export, "{}.{}.{}".format(scenario, rule, seed))
+
+    start = time.perf_counter()
+    model = build_model(scenario, rule, seed, **options)
+    setup_time = time.perf_counter() - start
+
+    # The runs with fewer steps are the prefixes of the longest one
+    pending = list(steps)
+    while pending:
+        if model.running:
+            model.step()
+            if model.schedule.steps % model.steps_per_day == 0:
+                per_day.append(get_record(model))
+
+        # The steady state can skip past the requested step counts, or stop the model before them when the fire is out
+        while pending and (pending[0] <= model.schedule.steps or not model.running):
+            result = {"scenario": scenario, "rule": rule, "seed": seed}
+            result.update(get_record(model, pending.pop(0)))
+            result["per_day"] = [record for record in per_day if record["steps"] <= result["steps"]]
+            result["simulated_steps"] = model.schedule.steps
+            result["setup_seconds"] = setup_time
+            result["seconds"] = time.perf_counter() - start - setup_time
+            if export is not None:
+                result["output"] = options["output"]
+            if options.get("members") is not None:
+                result.update(save_ensemble(model, result, output))
+            if model.profiler.enabled:
+                result["profile"] = model.profiler.get_report()
+            results.append(result)
+
+    # Save the steps captured with cProfile
+    if model.profiler.get_stats() is not None:
+        model.profiler.save_stats("{}.{}.{}.{}.pstats".format(os.path.splitext(output)[0], scenario, rule, seed))
+
+    model.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the forest fire simulation without the visualization")
+    parser.add_argument("--scenarios", nargs="+", default=None, help="the scenarios in ./data (default: all)")
+    parser.add_argument("--rules", nargs="+", default=rules, choices=rules)
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0])
+    parser.add_argument("--steps", nargs="+", type=int, default=[100], help="the number of steps of each run")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="results.jsonl", help="the results file, one JSON object per line")
+    parser.add_argument("--engine", default="grid", choices=["grid", "cell", "arrival"])
+    parser.add_argument("--storage", default="arrays", choices=["arrays", "agents"])
+    parser.add_argument("--no-frontier", dest="frontier", action="store_false")
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "numba"], help="the compute backend of the grid engine")
+    parser.add_argument("--tiles", type=int, default=None, help="split the grid of each run among the given number of processes")
+    parser.add_argument("--members", type=int, default=None, help="run an ensemble with the given number of members")
+    parser.add_argument("--profile", action="store_true", help="add the time spent in each phase of the steps to the results")
+    parser.add_argument("--profile-steps", nargs=2, type=int, default=None, metavar=("FIRST", "LAST"),
+                        help="capture the steps in the range with cProfile, saving the statistics next to the results file")
+    parser.add_argument("--steady-state", default=None, choices=["stop", "skip"],
+                        help="stop the runs when the fire is out, and optionally skip the steps in which no cell can change")
+    parser.add_argument("--no-shared-store", dest="shared_store", action="store_false",
+                        help="load the maps of the scenarios in each run, instead of sharing them among the processes")
+    parser.add_argument("--window", type=int, default=None, metavar="MARGIN",
+                        help="simulate only the cells around the fire, with the given margin, growing the window with the fire")
+    parser.add_argument("--export", default=None, metavar="FOLDER",
+                        help="write the arrival step of each cell and the metrics of each step of every run in a subfolder (see OutputWriter)")
+    args = parser.parse_args(argv)
+
+    options = {"engine": args.engine, "storage": args.storage, "frontier": args.frontier, "backend": args.backend, "tiles": args.tiles, "members": args.members,
+               "profile": args.profile, "profile_steps": tuple(args.profile_steps) if args.profile_steps else None,
+               "steady_state": args.steady_state, "window": args.window, "export": args.export}
+    scenarios = args.scenarios or get_scenarios()
+    steps = sorted(set(args.steps))
+
+    # Compile the scenarios once, before the workers start, and share their maps with the workers
+    store = ScenarioStore() if args.shared_store else None
+    for scenario in scenarios:
+        ScenarioBundle(scenario)
+        if store is not None:
+            store.add(scenario)
+    options["scenario_store"] = store
+
+    jobs = [(scenario, rule, seed, steps, options, args.output) for scenario, rule, seed in itertools.product(scenarios, args.rules, args.seeds)]
+    print("Running {} simulations on {} processes".format(len(jobs) * len(steps), args.processes))
+
+    with Pool(args.processes) as pool, open(args.output, "w") as file:
+        for results in pool.imap_unordered(run, jobs):
+            for result in results:
+                file.write(json.dumps(result) + "\n")
+                print("{scenario} {rule} seed={seed} steps={steps}: F1-Score {f1_score:.4f}".format(**result))
+            file.flush()
+    if store is not None:
+        store.close()
+    print("The results have been saved in {}".format(args.output))
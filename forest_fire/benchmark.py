@@ -0,0 +1,247 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+import numpy as np
+from .batch import build_model, get_scenarios, rules
+
+# The metrics compared between two result files, with True if a higher value is better
+metrics = {
+    "setup_seconds": False,
+    "loader_seconds": False,
+    "slope_seconds": False,
+    "agents_seconds": False,
+    "steps_per_second": True,
+    "cells_per_second": True,
+    "day_boundary_seconds": False,
+    "load_rain_seconds": False,
+    "peak_rss_mb": False,
+}
+
+
+def write_synthetic_scenario(path, size, days=3, seed=0):
+    """
+        Write a synthetic scenario of size x size cells: a smooth random elevation, random rates of spread with
+        some unburnable cells, a burned map around the center, a constant wind and the rain of the given days
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(path, "rain"), exist_ok=True)
+
+    def save(filename, values, fmt):
+        np.savetxt(os.path.join(path, filename), values, delimiter=",", fmt=fmt)
+
+    # Sum a few waves of random direction, so neighbors have similar heights
+    y, x = np.mgrid[0:size, 0:size] / size
+    elevation = sum(rng.uniform(50, 300) * np.sin(2 * np.pi * (rng.uniform(0.5, 3) * x + rng.uniform(0.5, 3) * y + rng.uniform()))
+                    for _ in range(4))
+    save("elevation.csv", elevation + 1000, "%.2f")
+
+    spread_component = rng.uniform(0.1, 1.0, (size, size))
+    spread_component[rng.random((size, size)) < 0.05] = 0.0
+    save("spread_component.csv", spread_component, "%.4f")
+
+    distance = np.hypot(x - 0.5, y - 0.5)
+    save("burned_mask.csv", (distance < 0.2).astype(int), "%d")
+
+    for day in range(1, days + 1):
+        rain = np.where(rng.random((size, size)) < 0.02 * day, rng.uniform(0, 10, (size, size)), 0.0)
+        save("rain/rain{}.csv".format(day), rain, "%.2f")
+    save("wind.csv", [[30.0, 15.0, 45.0]] * (days + 1), "%.1f")
+
+    with open(os.path.join(path, "starting_points.csv"), "w") as file:
+        file.write("{},{},{},Center\n".format(size // 2, size // 2, max(1, size // 50)))
+    with open(os.path.join(path, "starting_day.csv"), "w") as file:
+        file.write("1")
+
+
+def get_rss_mb():
+    """ Return the peak resident memory of the process in MB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def run_case(case):
+    """ Build a model and measure its initialization, its steps and the latency of the day boundaries """
+    name, root, rule, steps, options = case
+    os.chdir(root)  # The scenarios are read from ./data
+    base_rss = get_rss_mb()
+
+    start = time.perf_counter()
+    model = build_model(name, rule, 0, **options)
+    setup_seconds = time.perf_counter() - start
+
+    step_times, boundary_times = [], []
+    for _ in range(steps):
+        boundary = model.schedule.steps % model.steps_per_day == 0
+        start = time.perf_counter()
+        model.step()
+        (boundary_times if boundary else step_times).append(time.perf_counter() - start)
+
+    # Measure the swap of the rain of the current day alone
+    day = model.starting_day + model.get_days_elapsed()
+    rain_times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        model.data_loader.load_rain(day)
+        rain_times.append(time.perf_counter() - start)
+
+    step_seconds = sum(step_times)
+    result = {
+        "scenario": name,
+        "rule": rule,
+        "options": options,
+        "width": model.width,
+        "height": model.height,
+        "steps": steps,
+        "burned_cells": int(np.count_nonzero(model.get_layer("state") == 1.0)),
+        "setup_seconds": setup_seconds,
+        "loader_seconds": model.setup_times["loader"],
+        "slope_seconds": model.setup_times["slope"],
+        "agents_seconds": model.setup_times["agents"],
+        "steps_per_second": len(step_times) / step_seconds if step_seconds > 0 else None,
+        "cells_per_second": len(step_times) * model.width * model.height / step_seconds if step_seconds > 0 else None,
+        "day_boundary_seconds": statistics.median(boundary_times) - statistics.median(step_times) if boundary_times and step_times else None,
+        "load_rain_seconds": statistics.median(rain_times),
+        "base_rss_mb": base_rss,
+        "peak_rss_mb": get_rss_mb(),
+    }
+    model.close()
+    return result
+
+
+def aggregate(results):
+    """ Join the repetitions of a case, taking the median of each measure """
+    result = dict(results[0])
+    for name in metrics:
+        values = [item[name] for item in results if item[name] is not None]
+        result[name] = statistics.median(values) if values else None
+    result["repeats"] = len(results)
+    return result
+
+
+def get_case_key(result):
+    """ Return the key used to match the same case in two result files """
+    return "{} {} {}".format(result["scenario"], result["rule"], json.dumps(result["options"], sort_keys=True))
+
+
+def get_environment():
+    """ Return the versions and the machine the benchmark ran on """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmark(scenarios, sizes, rules, steps, repeats, options, output):
+    """
+        Run each case (a scenario and a rule) the given number of times and save the medians of the measures.
+        Every run is done in a new process, so the peak memory and the caches of a run don't affect the others.
+        The synthetic scenarios are written in a temporary folder
+    """
+    root = os.getcwd()
+    synthetic_root = tempfile.mkdtemp(prefix="forest-fire-benchmark-")
+    cases = [(scenario, root) for scenario in scenarios]
+    for size in sizes:
+        name = "synthetic{}".format(size)
+        write_synthetic_scenario(os.path.join(synthetic_root, "data", name), size)
+        cases.append((name, synthetic_root))
+
+    results = []
+    try:
+        with Pool(1, maxtasksperchild=1) as pool:
+            # Run each case once, so the compilation of the bundles, of the slopes and of the kernels isn't measured
+            pool.map(run_case, [(name, case_root, rule, 1, options) for (name, case_root), rule in itertools.product(cases, rules)], chunksize=1)
+
+            for (name, case_root), rule in itertools.product(cases, rules):
+                runs = pool.map(run_case, [(name, case_root, rule, steps, options)] * repeats, chunksize=1)
+                result = aggregate(runs)
+                results.append(result)
+                print("{scenario} ({width}x{height}) {rule}: setup {setup_seconds:.3f}s, {steps_per_second:.1f} steps/s, "
+                      "peak {peak_rss_mb:.0f} MB".format(**result))
+    finally:
+        shutil.rmtree(synthetic_root, ignore_errors=True)
+
+    report = {"environment": get_environment(), "steps": steps, "repeats": repeats, "results": results}
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print("The results have been saved in {}".format(output))
+    return report
+
+
+def compare(baseline, current, threshold=0.25, min_seconds=0.001):
+    """
+        Compare two result files and return the regressions: the measures of the same case that got worse by more
+        than the given fraction. The durations that changed by less than min_seconds are ignored, as they are noise
+    """
+    baseline_results = {get_case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        reference = baseline_results.get(get_case_key(result))
+        if reference is None:
+            continue
+        for name, higher_is_better in metrics.items():
+            old, new = reference.get(name), result.get(name)
+            if not old or new is None:
+                continue
+            if name.endswith("_seconds") and abs(new - old) < min_seconds:
+                continue
+            change = (new - old) / abs(old)
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append({"case": get_case_key(result), "metric": name, "baseline": old, "current": new, "change": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the initialization, the step throughput and the memory of the model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmark")
+    run_parser.add_argument("--scenarios", nargs="+", default=None, help="the scenarios in ./data (default: all)")
+    run_parser.add_argument("--sizes", nargs="*", type=int, default=[250, 500, 1000], help="the sizes of the synthetic grids")
+    run_parser.add_argument("--rules", nargs="+", default=rules, choices=rules)
+    run_parser.add_argument("--steps", type=int, default=150, help="the number of steps of each run")
+    run_parser.add_argument("--repeats", type=int, default=3, help="the number of runs of each case")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--engine", default="grid", choices=["grid", "cell", "arrival"])
+    run_parser.add_argument("--storage", default="arrays", choices=["arrays", "agents"])
+    run_parser.add_argument("--no-frontier", dest="frontier", action="store_false")
+    run_parser.add_argument("--backend", default="numpy", choices=["numpy", "numba"], help="the compute backend of the grid engine")
+    run_parser.add_argument("--tiles", type=int, default=None, help="split the grid among the given number of processes")
+
+    compare_parser = subparsers.add_parser("compare", help="flag the regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="the tolerated fraction of change")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        options = {"engine": args.engine, "storage": args.storage, "frontier": args.frontier, "backend": args.backend, "tiles": args.tiles}
+        run_benchmark(args.scenarios or get_scenarios(), args.sizes, args.rules, args.steps, args.repeats, options, args.output)
+        return 0
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    with open(args.current, "r") as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print("{case}: {metric} {baseline:.4g} -> {current:.4g} ({change:+.1%})".format(**regression))
+    print("{} regressions".format(len(regressions)))
+    return 1 if regressions else 0
@@ -0,0 +1,260 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import time
+from multiprocessing import Pool
+import numpy as np
+from .Parameters import Parameters
+from .ScenarioBundle import ScenarioBundle
+from .ScenarioStore import ScenarioStore
+from .batch import build_model, get_scenarios, rules
+
+# The default search space: the range of each calibrated parameter
+default_space = {
+    "gust_prob": (0.0, 0.3),
+    "c1": (0.05, 0.5),
+    "c2": (0.1, 1.0),
+    "slope_delta": (20.0, 70.0),
+    "diagonal_weight": (0.5, 1.0),
+}
+
+strategies = ["grid", "random", "bayes"]
+
+
+def parse_space(items):
+    """ Parse the ranges given as name=low:high """
+    space = {}
+    for item in items:
+        name, _, bounds = item.partition("=")
+        if name not in Parameters.defaults:
+            raise RuntimeError("Parameter not found: {}".format(name))
+        low, high = (float(value) for value in bounds.split(":"))
+        space[name] = (low, high)
+    return space
+
+
+def get_grid(space, levels):
+    """ Return every combination of the given number of evenly spaced values of each parameter """
+    values = [np.linspace(low, high, levels).tolist() for low, high in space.values()]
+    return [dict(zip(space, combination)) for combination in itertools.product(*values)]
+
+
+def propose_random(space, rng):
+    """ Return a configuration drawn uniformly from the search space """
+    return {name: float(rng.uniform(low, high)) for name, (low, high) in space.items()}
+
+
+def propose_bayes(space, history, rng, startup=8, gamma=0.25, candidates=64):
+    """
+        Return a configuration proposed by a Tree-structured Parzen Estimator: the finished trials are split into
+        the best gamma fraction and the others (the stopped trials are always among the others), and the candidate
+        drawn around the best ones with the highest ratio between the two kernel densities is chosen
+    """
+    if len(history) < startup:
+        return propose_random(space, rng)
+
+    low = np.array([bounds[0] for bounds in space.values()])
+    high = np.array([bounds[1] for bounds in space.values()])
+    scale = np.where(high > low, high - low, 1.0)
+
+    def normalize(trial):
+        return (np.array([trial["parameters"][name] for name in space]) - low) / scale
+
+    finished = sorted((trial for trial in history if trial["score"] is not None), key=lambda trial: -trial["score"])
+    count = max(1, int(np.ceil(gamma * len(finished))))
+    good = np.array([normalize(trial) for trial in finished[:count]])
+    bad = [normalize(trial) for trial in finished[count:]] + [normalize(trial) for trial in history if trial["score"] is None]
+    if not bad:
+        return propose_random(space, rng)
+    bad = np.array(bad)
+
+    bandwidth = max(0.05, len(history) ** (-1 / (len(space) + 4)) * 0.5)
+
+    def log_density(points, centers):
+        distances = ((points[:, None, :] - centers[None, :, :]) / bandwidth) ** 2
+        return np.logaddexp.reduce(-0.5 * distances.sum(axis=2), axis=1) - np.log(len(centers))
+
+    points = good[rng.integers(len(good), size=candidates)] + rng.normal(0.0, bandwidth, size=(candidates, len(space)))
+    points = np.clip(points, 0.0, 1.0)
+    best = points[np.argmax(log_density(points, good) - log_density(points, bad))]
+    return {name: float(value) for name, value in zip(space, low + best * scale)}
+
+
+def get_reference(history, minimum=3):
+    """ Return the median F1-score of the previous trials at each step of each run, if enough trials reached it """
+    values = {}
+    for trial in history:
+        for run in trial["runs"]:
+            for step, f1_score in run["trajectory"]:
+                values.setdefault("{}/{}/{}".format(run["scenario"], run["seed"], step), []).append(f1_score)
+    return {key: float(np.median(scores)) for key, scores in values.items() if len(scores) >= minimum}
+
+
+def run_trial(job):
+    """
+        Simulate every scenario and seed with the given parameters. The F1-score is checked every interval steps
+        and the trial is stopped if it's below early_stopping times the median of the previous trials
+    """
+    trial, parameters, scenarios, seeds, rule, steps, interval, options, reference, early_stopping = job
+    start = time.perf_counter()
+    runs = []
+    stopped = False
+
+    for scenario, seed in itertools.product(scenarios, seeds):
+        model = build_model(scenario, rule, seed, parameters=parameters, metrics_interval=0, **options)
+        run = {"scenario": scenario, "seed": seed, "trajectory": []}
+        runs.append(run)
+
+        for _ in range(steps):
+            model.step()
+            step = model.schedule.steps
+            if step % interval == 0 or step == steps:
+                f1_score = model.get_metrics()[2]
+                run["trajectory"].append((step, f1_score))
+                median = reference.get("{}/{}/{}".format(scenario, seed, step))
+                if median is not None and f1_score < early_stopping * median:
+                    stopped = True
+                    break
+
+        model.close()
+        run["f1_score"] = run["trajectory"][-1][1] if run["trajectory"] else 0.0
+        if stopped:
+            break
+
+    return {
+        "trial": trial,
+        "parameters": parameters,
+        "runs": runs,
+        "stopped": stopped,
+        "score": None if stopped else float(np.mean([run["f1_score"] for run in runs])),
+        "seconds": time.perf_counter() - start
+    }
+
+
+def load_history(path):
+    """ Return the trials saved in the history file, if it exists """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def save_best(path, history, count):
+    """ Save the finished trials with the highest score """
+    finished = sorted((trial for trial in history if trial["score"] is not None), key=lambda trial: -trial["score"])
+    best = [{"trial": trial["trial"], "score": trial["score"], "parameters": Parameters(**trial["parameters"]).to_dict()} for trial in finished[:count]]
+
+    temporary_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary_path, "w") as file:
+        json.dump(best, file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def calibrate(space, strategy, trials, scenarios, seeds, rule, steps, interval, options, output,
+              processes=None, levels=3, early_stopping=0.8, seed=0, best=10):
+    """
+        Search the parameters that maximize the mean F1-score of the simulations. The trials run in parallel and
+        each finished trial is appended to <output>.trials.jsonl, so the search can be resumed; the best
+        configurations are saved in <output>.best.json
+    """
+    history_path = output + ".trials.jsonl"
+    best_path = output + ".best.json"
+    history = load_history(history_path)
+    rng = np.random.default_rng(seed + len(history))
+
+    if strategy == "grid":
+        grid = get_grid(space, levels)[len(history):]
+        trials = len(grid)
+    elif strategy not in strategies:
+        raise RuntimeError("Strategy not found")
+
+    def propose():
+        if strategy == "grid":
+            return grid.pop(0)
+        if strategy == "random":
+            return propose_random(space, rng)
+        return propose_bayes(space, history, rng)
+
+    results = queue.Queue()
+
+    def submit(pool, trial):
+        job = (trial, propose(), scenarios, seeds, rule, steps, interval, options, get_reference(history), early_stopping)
+        pool.apply_async(run_trial, (job,), callback=results.put, error_callback=results.put)
+
+    # Compile the scenarios once, before the workers start
+    for scenario in scenarios:
+        ScenarioBundle(scenario)
+
+    processes = processes or os.cpu_count()
+    first = len(history)
+    print("Running {} trials on {} processes".format(trials, processes))
+
+    with Pool(processes) as pool, open(history_path, "a") as file:
+        # Keep every process busy: a new trial is proposed as soon as one finishes, using the updated history
+        submitted = 0
+        while submitted < min(processes, trials):
+            submit(pool, first + submitted)
+            submitted += 1
+
+        for _ in range(trials):
+            result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            history.append(result)
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            save_best(best_path, history, best)
+
+            status = "stopped" if result["stopped"] else "F1-Score {:.4f}".format(result["score"])
+            print("Trial {} ({:.1f}s): {}".format(result["trial"], result["seconds"], status))
+
+            if submitted < trials:
+                submit(pool, first + submitted)
+                submitted += 1
+
+    print("The trials have been saved in {} and the best configurations in {}".format(history_path, best_path))
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the parameters of the model against the burned maps")
+    parser.add_argument("--scenarios", nargs="+", default=None, help="the scenarios in ./data (default: all)")
+    parser.add_argument("--rule", default="OurRule", choices=rules)
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0])
+    parser.add_argument("--steps", type=int, default=100, help="the number of steps of each run")
+    parser.add_argument("--interval", type=int, default=10, help="check the F1-score every interval steps")
+    parser.add_argument("--strategy", default="bayes", choices=strategies)
+    parser.add_argument("--trials", type=int, default=50, help="the number of trials (grid: every combination)")
+    parser.add_argument("--levels", type=int, default=3, help="the number of values of each parameter in the grid")
+    parser.add_argument("--space", nargs="+", default=None, help="the ranges of the parameters, as name=low:high")
+    parser.add_argument("--early-stopping", type=float, default=0.8,
+                        help="stop a trial if its F1-score is below this fraction of the median of the previous trials (0 to disable)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="calibration", help="the prefix of the output files")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the search")
+    parser.add_argument("--engine", default="grid", choices=["grid", "cell", "arrival"])
+    parser.add_argument("--storage", default="arrays", choices=["arrays", "agents"])
+    parser.add_argument("--no-frontier", dest="frontier", action="store_false")
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "numba"], help="the compute backend of the grid engine")
+    parser.add_argument("--no-shared-store", dest="shared_store", action="store_false",
+                        help="load the maps of the scenarios in each run, instead of sharing them among the processes")
+    args = parser.parse_args(argv)
+
+    space = parse_space(args.space) if args.space else default_space
+    scenarios = args.scenarios or get_scenarios()
+    options = {"engine": args.engine, "storage": args.storage, "frontier": args.frontier, "backend": args.backend}
+
+    # Share the maps of the scenarios with the workers. The height factors of other slope parameters are computed by each run
+    store = ScenarioStore() if args.shared_store else None
+    if store is not None:
+        for scenario in scenarios:
+            store.add(scenario)
+        options["scenario_store"] = store
+    try:
+        calibrate(space, args.strategy, args.trials, scenarios, args.seeds, args.rule, args.steps,
+                  args.interval, options, args.output, args.processes, args.levels, args.early_stopping, args.seed)
+    finally:
+        if store is not None:
+            store.close()
@@ -1,58 +1,153 @@
+import asyncio
+import copy
 import os
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid
+import tornado.escape
+import tornado.websocket
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
 from mesa.visualization.UserParam import UserSettableParameter
 from .ForestFire import ForestFire
+from .FrameHub import FrameHub
+from .RasterCanvas import RasterCanvas
+from .SimulationWorker import SimulationWorker
 
-# Define the width and the height of the map
-width = 250
-height = 250
+# Define the size of the canvas in pixels. The size of the grid is taken from the maps of the scenario
+canvas_width = 750
+canvas_height = 750
+
+# The minimum number of seconds between two frames published by the model
+frame_interval = 0.05
 
 scenarios = [item for item in os.listdir("./data") if os.path.isdir(os.path.join("./data", item))]
 
 
-def get_cell_color(cell):
-    """ This method return the color of the cell """
-    x, y = cell.pos
-    if x == width // 2 and y == width // 2:  # Color the center of the map
-        return "Yellow"
-    if cell.state == 1.0 and not cell.is_burned:  # Color the cells that shouldn't have burned
-        return "Purple"
-    elif cell.state == 1.0:  # Color the cells correctly burned
-        return "Black"
-    elif cell.model.show_partial_burned_cells and 0.0 < cell.state < 1.0:
-        return "Red"
-    elif cell.is_burned:  # Color the cells burned during the wildfire, but not in the simulation
-        return "Green"
-    else:  # The default color is white
-        return "White"
-
-
-def forest_fire_portrayal(cell):
-    """ This method return the style of the cell """
-    (x, y) = cell.pos
-    portrayal = {
-        "Shape": "rect",
-        "w": 1,
-        "h": 1,
-        "Filled": "true",
-        "Layer": 0,
-        "x": x,
-        "y": y,
-        "Color": get_cell_color(cell)
-    }
-    return portrayal
+class ForestFireSocketHandler(SocketHandler):
+    """
+        Send the frames of the model run by the worker of the server. Each page is a viewer with its own
+        subscription and its own copy of the visualization elements, so it can move the window of its canvas:
+        - "get_step" sends the latest frame, waiting for a newer one than the last sent while the model runs
+        - "resume" and "pause" run and pause the model of every page, "step" pauses it and runs a single step
+        - "stream" sends every frame, at most fps per second (0 stops the stream)
+        - "window" moves the window of the canvas and draws the last frame again
+        The model pauses when the last page is closed
+    """
+
+    def open(self):
+        super().open()
+        self.subscription = self.application.hub.subscribe()
+        self.elements = [copy.copy(element) for element in self.application.visualization_elements]
+        self.stream = None
+
+    def on_close(self):
+        self.stop_stream()
+        self.subscription.close()
+        if not self.application.hub.subscribers:
+            self.application.worker.pause()
+
+    async def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        worker = self.application.worker
+        if msg["type"] == "get_step":
+            if self.subscription.has_next() or (self.application.model.running and not worker.paused):
+                self.send_frame(await self.subscription.next())
+            elif self.application.model.running:
+                # The model is paused, so draw the last frame again
+                self.send_frame(self.subscription.last or self.application.hub.latest)
+            else:
+                self.write_message({"type": "end"})
+        elif msg["type"] == "resume":
+            worker.resume()
+        elif msg["type"] == "pause":
+            worker.pause()
+        elif msg["type"] == "step":
+            if self.application.model.running:
+                # Skip the frames published before the step
+                target = worker.step()
+                frame = await self.subscription.next()
+                while frame.model is worker.model and frame.running and frame.step < target:
+                    frame = await self.subscription.next()
+                self.send_frame(frame)
+            else:
+                self.write_message({"type": "end"})
+        elif msg["type"] == "stream":
+            self.stop_stream()
+            if msg.get("fps"):
+                worker.resume()
+                self.subscription.interval = 1 / msg["fps"]
+                self.stream = asyncio.ensure_future(self.send_stream())
+        elif msg["type"] == "window":
+            # Draw the new window of the grid without waiting for the model
+            for element in self.elements:
+                if isinstance(element, RasterCanvas):
+                    element.set_window(msg["row"], msg["col"])
+            self.send_frame(self.subscription.last or self.application.hub.latest)
+        elif msg["type"] == "reset":
+            self.stop_stream()
+            self.application.reset_model()
+            self.send_frame(await self.subscription.next())
+        else:
+            super().on_message(message)
+
+    async def send_stream(self):
+        """ Send the frames as they are published, dropping the ones published while the page is receiving one """
+        try:
+            async for frame in self.subscription:
+                await self.write_message(self.get_message(frame))
+                if not frame.running:
+                    self.write_message({"type": "end"})
+                    return
+        except tornado.websocket.WebSocketClosedError:
+            pass
+
+    def stop_stream(self):
+        if self.stream is not None:
+            self.stream.cancel()
+            self.stream = None
+            self.subscription.interval = 0.0
+
+    def send_frame(self, frame):
+        self.write_message(self.get_message(frame))
+
+    def get_message(self, frame):
+        data = [element.render_frame(frame) if hasattr(element, "render_frame") else element.render(frame.model) for element in self.elements]
+        return {"type": "viz_state", "data": data}
+
+
+class ForestFireServer(ModularServer):
+    """
+        The visualization server. The model runs in a SimulationWorker as fast as it can, and its frames are sent
+        to every page through a FrameHub: a slow page drops frames instead of slowing the model down
+    """
+
+    socket_handler = (r"/ws", ForestFireSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    def __init__(self, *args, **kwargs):
+        self.hub = FrameHub()
+        self.worker = None
+        super().__init__(*args, **kwargs)
+
+    def reset_model(self):
+        """ Stop the running model, release its resources and build a new one, which is paused until a page resumes it """
+        if self.worker is not None:
+            self.worker.stop()
+            self.model.close()
+        super().reset_model()
+        self.worker = SimulationWorker(self.model, self.hub, frame_interval)
 
 
 # Create a canvas grid
 model_params = {
-    "width": width,
-    "height": height,
+    "width": None,
+    "height": None,
     "propagation_rule": UserSettableParameter("choice", "PropagationRule", value="OurRule", choices=["OurRule", "BaseRule", "ExtendedRule"]),
     "scenario": UserSettableParameter("choice", "Scenario", value=scenarios[0], choices=scenarios),
-    "show_partial_burned_cells": UserSettableParameter("checkbox", 'Show partial burned cells', value=False)
+    "show_partial_burned_cells": UserSettableParameter("checkbox", 'Show partial burned cells', value=False),
+    "engine": UserSettableParameter("choice", "Engine", value="grid", choices=["grid", "cell", "arrival"]),
+    "storage": UserSettableParameter("choice", "Storage", value="arrays", choices=["arrays", "agents"]),
+    "frontier": UserSettableParameter("checkbox", "Update only the fire front", value=True),
+    "steady_state": UserSettableParameter("choice", "Steady state", value="skip", choices=["skip", "stop"])
 }
-canvas_element = CanvasGrid(forest_fire_portrayal, width, height, width * 3, height * 3)
+canvas_element = RasterCanvas(canvas_width, canvas_height)
 
 # Start the server
-server = ModularServer(ForestFire, [canvas_element], "Forest Fire", model_params)
+server = ForestFireServer(ForestFire, [canvas_element], "Forest Fire", model_params)
@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+
+@pytest.fixture(autouse=True)
+def scenarios(monkeypatch):
+    """ The scenarios are read from the data folder of the repository """
+    monkeypatch.chdir(root)
@@ -0,0 +1,70 @@
+import functools
+import numpy as np
+import pytest
+from forest_fire.ForestFire import ForestFire
+
+rules = ("BaseRule", "ExtendedRule", "OurRule")
+scenarios = ("test2", "august250")
+steps = 15  # On august250 it rains from the second day (5 steps per day)
+
+# The engines compared with the cell engine without the frontier
+engines = [
+    {"engine": "cell", "frontier": True},
+    {"engine": "grid"},
+    {"engine": "grid", "frontier": True},
+    {"engine": "grid", "storage": "arrays", "frontier": True},
+]
+engine_ids = ["cell-frontier", "grid", "grid-frontier", "grid-arrays-frontier"]
+
+# The cell engine draws the gusts of wind one cell at a time, the grid engine for the whole grid at once, so they
+# are compared without gusts and with a gust in every cell
+gusts = {"no-gusts": 0.0, "gusts": 1.0}
+
+
+def run(scenario, rule, parameters, **options):
+    """ Return the states and the rain deficits of each step """
+    model = ForestFire(None, None, rule, scenario, True, verbose=False, seed=0, parameters=parameters, **options)
+    history = []
+    for _ in range(steps):
+        model.step()
+        history.append((model.get_layer("state").copy(), model.get_layer("rain_deficit").copy()))
+    return history
+
+
+@functools.lru_cache(maxsize=None)
+def run_cells(scenario, rule, gust_prob):
+    """ The reference run: each cell applies the rule on its own """
+    return run(scenario, rule, {"gust_prob": gust_prob}, engine="cell")
+
+
+def assert_same_history(actual, expected):
+    for step, ((state, rain_deficit), (expected_state, expected_deficit)) in enumerate(zip(actual, expected), 1):
+        np.testing.assert_allclose(state, expected_state, rtol=0, atol=1e-9, err_msg="state at step {}".format(step))
+        np.testing.assert_allclose(rain_deficit, expected_deficit, rtol=0, atol=1e-9, err_msg="rain deficit at step {}".format(step))
+
+
+def in_sweep_order(scenario, rule, options):
+    """ Whether the engine applies the rain deficits in the order of the sweep, like the cell engine """
+    return rule != "OurRule" or scenario != "august250" or options["engine"] == "cell"
+
+
+@pytest.mark.parametrize("scenario", scenarios)
+@pytest.mark.parametrize("rule", rules)
+@pytest.mark.parametrize("gust_prob", gusts.values(), ids=gusts.keys())
+@pytest.mark.parametrize("options", engines, ids=engine_ids)
+def test_same_states_of_the_cells(scenario, rule, gust_prob, options):
+    actual = run(scenario, rule, {"gust_prob": gust_prob}, **options)
+    expected = run_cells(scenario, rule, gust_prob)
+    if in_sweep_order(scenario, rule, options):
+        assert_same_history(actual, expected)
+    else:
+        # The grid engine applies the rain deficits of every cell at once, the cell engine one cell at a time,
+        # so the cells stepped after a wet neighbor see its new deficit
+        with pytest.raises(AssertionError, match="state at step"):
+            assert_same_history(actual, expected)
+
+
+@pytest.mark.parametrize("rule", rules)
+def test_same_gusts_of_the_grids(rule):
+    """ The grid engine draws the same gusts with both storages, so they're compared with the default gust_prob """
+    assert_same_history(run("august250", rule, None, engine="grid", storage="arrays"), run("august250", rule, None, engine="grid"))
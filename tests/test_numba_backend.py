@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from forest_fire.ForestFire import ForestFire
+
+pytest.importorskip("numba")
+
+rules = ("BaseRule", "ExtendedRule", "OurRule")
+steps = 15  # On august250 it rains from the second day (5 steps per day)
+
+
+def run(rule, backend, **options):
+    """ Return the states and the rain deficits of each step on august250 """
+    model = ForestFire(None, None, rule, "august250", True, engine="grid", storage="arrays", backend=backend,
+                       verbose=False, seed=0, **options)
+    assert model.backend.name == backend
+    history = []
+    for _ in range(steps):
+        model.step()
+        history.append((model.get_layer("state").copy(), model.get_layer("rain_deficit").copy()))
+    return history
+
+
+@pytest.mark.parametrize("rule", rules)
+@pytest.mark.parametrize("options, tolerance", [
+    ({}, 1e-9),
+    ({"frontier": True}, 1e-9),
+    ({"members": 4}, 1e-9),
+    ({"members": 4, "frontier": True}, 1e-9),
+    ({"dtype": np.float32}, 1e-4),
+    ({"dtype": np.float32, "frontier": True}, 1e-4),
+], ids=["grid", "frontier", "ensemble", "ensemble-frontier", "float32", "float32-frontier"])
+def test_same_states_of_numpy(rule, options, tolerance):
+    expected = run(rule, "numpy", **options)
+    actual = run(rule, "numba", **options)
+    for step, ((state, rain_deficit), (expected_state, expected_deficit)) in enumerate(zip(actual, expected), 1):
+        np.testing.assert_allclose(state, expected_state, rtol=0, atol=tolerance, err_msg="state at step {}".format(step))
+        np.testing.assert_allclose(rain_deficit, expected_deficit, rtol=0, atol=tolerance, err_msg="rain deficit at step {}".format(step))